@@ -2,95 +2,625 @@
 # -*- coding: utf-8 -*-
 """
 《斗破苍穹》小说章节汇总脚本
-将novel_chapters目录下的所有章节文件合并成一个完整的小说文件
+将novel_chapters目录下的所有章节文件（或章节归档）合并成一个完整的小说文件
+
+用法：
+    python addfile.py                      # 合并 novel_chapters 目录
+    python addfile.py novel_chapters.pack  # 合并章节归档
+    python addfile.py novel_chapters --full  # 忽略上次的合并状态，完整重写
+    python addfile.py novel_chapters --epub  # 导出为EPUB（《斗破苍穹》.epub）
+
+合并时章节正文按字节直接从章节文件拷贝到输出文件（Linux上用os.sendfile在内核中完成），
+只在首尾读取少量字节来去掉空白，不需要把整章读入内存再解码、编码。
+爬虫生成的章节文件只使用"\n"，按原样拷贝；含有"\r"的章节（手工编辑过、从Windows拷贝来的）
+退回到解码后转换换行符再写入，与按文本方式读取的结果一致。
+后面的章节由线程池提前并发读取，写入仍严格按章节顺序（文件名中的URL索引）进行。
+合并后同时生成章节偏移索引（《斗破苍穹》.txt.idx），可用 book_index.py 直接提取任意章节。
+章节目录的文件清单缓存在 novel_chapters.catalog.json 中（见 chapter_catalog.py），目录没有变化时不再重新解析文件名。
 """
 
+import codecs
+import io
+import itertools
+import json
+import mmap
 import os
-import re
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-def extract_chapter_number(filename):
-    """从文件名中提取章节号"""
-    # 匹配形如 "1章" "123章" 等格式
-    match = re.search(r'(\d+)章', filename)
-    if match:
-        return int(match.group(1))
-    return float('inf')  # 非章节文件排到最后
-
-def is_chapter_file(filename):
-    """判断是否为章节文件"""
-    # 检查是否包含"章"字且为txt文件
-    return '章' in filename and filename.endswith('.txt')
-
-def merge_novel_chapters():
-    """合并所有章节文件"""
-    # 设置路径
-    chapters_dir = Path("novel_chapters")
-    output_file = "《斗破苍穹》.txt"
+from book_epub import EpubWriter, pack_chapter
+from book_index import write_book_index
+from chapter_archive import ArchiveReader, is_archive_path, index_path_for
+# extract_chapter_number、is_chapter_file 原先定义在本文件，移到清单缓存模块后仍从这里导出
+from chapter_catalog import chapter_number_or_none, extract_chapter_number, is_chapter_file, list_indexed_chapters
+from chapter_naming import fsync_directory, normalize_title, open_temp_file, write_text_atomic
+
+# 查找首尾空白时每次读取的字节数
+EDGE_WINDOW = 4096
+# 不能使用sendfile时，每次拷贝的字节数
+COPY_CHUNK = 1024 * 1024
+
+# 预读章节的线程数（网络盘、云盘上每次打开文件都要等一个往返，并发预读可以把等待重叠起来）
+PREFETCH_WORKERS = 8
+# 超过这个大小的章节不预读进内存，轮到它时再流式拷贝
+PREFETCH_MAX_BYTES = 4 * 1024 * 1024
+
+# 书名（合并文件的第一行、EPUB的标题）
+BOOK_TITLE = '斗破苍穹'
+
+# 合并状态文件（记录已合并的章节和偏移量）
+MERGE_STATE_SUFFIX = '.merge.json'
+MERGE_STATE_VERSION = 1
+
+# sendfile在macOS/Windows上不支持文件到文件的拷贝，失败一次后不再尝试
+_sendfile_supported = hasattr(os, 'sendfile')
+
+def write_book_header(outfile):
+    """写入书名（outfile为二进制文件）"""
+    outfile.write(f"《{BOOK_TITLE}》\n".encode('utf-8'))
+    outfile.write(("=" * 50 + "\n\n").encode('utf-8'))
+
+def write_chapter_header(outfile, chapter_title):
+    """写入章节标题（用作分隔符，outfile为二进制文件）"""
+    outfile.write(f"\n{'=' * 5}\n{chapter_title}\n{'=' * 5}\n\n".encode('utf-8'))
+
+def write_chapter(outfile, chapter_title, content):
+    """写入一个已在内存中的章节（标题分隔符 + 正文，outfile为二进制文件）"""
+    write_chapter_header(outfile, chapter_title)
+    outfile.write(content.encode('utf-8'))
+    outfile.write(b"\n\n")
+
+def stripped_range(infile, start, end):
+    """
+    计算字节范围 [start, end) 去掉首尾空白后的范围，结果与 str.strip() 一致
     
-    if not chapters_dir.exists():
-        print(f"错误：找不到章节目录 {chapters_dir}")
+    只读取首尾各几KB，中间部分不读取。start必须位于UTF-8字符边界。
+    
+    Args:
+        infile: 以二进制方式打开的文件
+        start (int): 起始偏移量
+        end (int): 结束偏移量
+        
+    Returns:
+        tuple: (新的起始偏移量, 新的结束偏移量)，全是空白时两者相等
+    """
+    # 去掉开头的空白：每次解码一个窗口，直到遇到非空白字符
+    while start < end:
+        infile.seek(start)
+        chunk = infile.read(min(EDGE_WINDOW, end - start))
+        # 增量解码器会保留窗口末尾不完整的字符，不会误报解码错误
+        text = codecs.getincrementaldecoder('utf-8')().decode(chunk)
+        stripped = text.lstrip()
+        start += len(text[:len(text) - len(stripped)].encode('utf-8'))
+        if stripped or not text:
+            break
+    
+    # 去掉结尾的空白：从后往前按窗口解码
+    while end > start:
+        window_start = max(start, end - EDGE_WINDOW)
+        infile.seek(window_start)
+        chunk = infile.read(end - window_start)
+        # 窗口可能从一个多字节字符的中间开始，跳过开头的UTF-8后续字节
+        skip = 0
+        if window_start > start:
+            while skip < len(chunk) and 0x80 <= chunk[skip] < 0xC0:
+                skip += 1
+        text = chunk[skip:].decode('utf-8')
+        stripped = text.rstrip()
+        end -= len(text[len(stripped):].encode('utf-8'))
+        if stripped:
+            break
+    
+    return start, end
+
+def copy_range(infile, outfile, offset, count):
+    """
+    把 infile 中从 offset 开始的 count 个字节拷贝到 outfile 的当前位置
+    
+    优先使用 os.sendfile 在内核中完成拷贝，不支持时退回到分块读写。
+    """
+    global _sendfile_supported
+    
+    # 先把缓冲区中的内容写出，保证顺序正确
+    outfile.flush()
+    if _sendfile_supported:
+        try:
+            while count > 0:
+                sent = os.sendfile(outfile.fileno(), infile.fileno(), offset, count)
+                if sent == 0:
+                    break
+                offset += sent
+                count -= sent
+        except OSError:
+            _sendfile_supported = False
+    
+    # sendfile不可用，或被中断后剩余的部分
+    infile.seek(offset)
+    while count > 0:
+        chunk = infile.read(min(COPY_CHUNK, count))
+        if not chunk:
+            break
+        outfile.write(chunk)
+        count -= len(chunk)
+
+def normalize_newlines(data):
+    """把正文字节中的"\r\n"和单独的"\r"换成"\n"（与按文本方式读取的结果一致）"""
+    return data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+def has_carriage_return(infile, start, end):
+    """判断 infile 的 [start, end) 范围中是否有"\r"（用mmap查找，不把内容读入Python）"""
+    if start >= end:
+        return False
+    try:
+        with mmap.mmap(infile.fileno(), end, access=mmap.ACCESS_READ) as view:
+            return view.find(b"\r", start, end) != -1
+    except (OSError, ValueError):
+        # 不支持mmap的文件，分块读取查找
+        infile.seek(start)
+        while start < end:
+            chunk = infile.read(min(COPY_CHUNK, end - start))
+            if not chunk:
+                return False
+            if b"\r" in chunk:
+                return True
+            start += len(chunk)
+        return False
+
+def copy_chapter(infile, outfile, chapter_title, start, end):
+    """
+    把 infile 中 [start, end) 范围的章节去掉首尾空白后流式写入 outfile
+    
+    含有"\r"的章节不能按字节拷贝，读入内存转换换行符后再写入。
+    """
+    start, end = stripped_range(infile, start, end)
+    if has_carriage_return(infile, start, end):
+        infile.seek(start)
+        write_chapter_header(outfile, chapter_title)
+        outfile.write(normalize_newlines(infile.read(end - start)))
+        outfile.write(b"\n\n")
         return
+    write_chapter_header(outfile, chapter_title)
+    copy_range(infile, outfile, start, end - start)
+    outfile.write(b"\n\n")
+
+def merge_state_path(output_file):
+    """返回合并状态文件的路径"""
+    return str(output_file) + MERGE_STATE_SUFFIX
+
+def load_merge_state(output_file):
+    """读取上次合并的状态，不存在或损坏时返回None"""
+    try:
+        with open(merge_state_path(output_file), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get('version') != MERGE_STATE_VERSION:
+        return None
+    return state
+
+def list_directory_chapters(chapters_dir):
+    """
+    列出章节目录中的章节，按文件名中的URL索引排序（没有索引前缀的旧章节文件按章节号排在后面）
+    
+    按URL索引而不是章节号排序：没有章节号的章节（如"0006_未知章节.txt"）按章节号会排到最后，
+    之后每次新下载的章节都会插到它前面，已合并的部分永远对不上，增量合并就退化成完整重写。
     
-    # 获取所有章节文件
-    all_files = list(chapters_dir.glob("*.txt"))
-    chapter_files = [f for f in all_files if is_chapter_file(f.name)]
+    Returns:
+        list: 每个元素为 {'key': 文件名, 'identity': [大小, 修改时间], 'title': 标题, 'path': 路径}
+    """
+    # 合并要发现只改了内容的章节，所以每次都核对文件的大小和修改时间
+    chapters = []
+    for _, entry in list_indexed_chapters(chapters_dir, verify=True):
+        chapters.append({
+            'key': entry['name'],
+            'identity': [entry['size'], entry['mtime_ns']],
+            # 章节标题（去掉.txt扩展名和URL索引前缀）
+            'title': entry['title'],
+            'path': os.path.join(chapters_dir, entry['name']),
+        })
+    return chapters
+
+def list_archive_chapters(reader):
+    """
+    列出章节归档中的章节，按URL索引排序
+    
+    Returns:
+        list: 每个元素为 {'key': "#URL索引", 'identity': [偏移量, 长度], 'title': 标题, 'entry': 索引记录}
+    """
+    return [
+        {
+            'key': f"#{entry['index']}",
+            'identity': [entry['offset'], entry['length']],
+            'title': entry['title'],
+            'entry': entry,
+        }
+        for entry in reader.entries()
+    ]
+
+def merged_prefix_length(state, source, chapters, output_file):
+    """
+    判断上次合并的结果能否直接追加
     
-    # 按章节号排序
-    chapter_files.sort(key=lambda x: extract_chapter_number(x.name))
+    上次合并的章节必须与当前章节列表的开头完全一致（文件名和大小、修改时间都相同），
+    且合并后的文件没有被改动过。
     
-    print(f"找到 {len(chapter_files)} 个章节文件")
+    Returns:
+        int: 可以保留的章节数，不能增量合并时返回None
+    """
+    if state is None or state.get('source') != os.path.abspath(source):
+        return None
+    try:
+        st = os.stat(output_file)
+    except OSError:
+        return None
+    if st.st_size != state['book_size'] or st.st_mtime_ns != state['book_mtime_ns']:
+        return None
     
-    # 合并文件
-    with open(output_file, 'w', encoding='utf-8') as outfile:
+    merged = state['chapters']
+    if len(merged) > len(chapters):
+        return None
+    for old, new in zip(merged, chapters):
+        if old['key'] != new['key'] or old['identity'] != new['identity']:
+            return None
+    return len(merged)
+
+def write_chapter_item(outfile, chapter, reader=None, data_file=None):
+    """写入 list_directory_chapters / list_archive_chapters 返回的一个章节"""
+    entry = chapter.get('entry')
+    if entry is None:
+        with open(chapter['path'], 'rb') as infile:
+            size = os.fstat(infile.fileno()).st_size
+            copy_chapter(infile, outfile, chapter['title'], 0, size)
+    elif entry.get('codec'):
+        # 压缩章节只能解压后写入
+        write_chapter_header(outfile, chapter['title'])
+        outfile.write(normalize_newlines(reader.read_text(entry).strip().encode('utf-8')))
+        outfile.write(b"\n\n")
+    else:
+        copy_chapter(data_file, outfile, chapter['title'],
+                     entry['offset'], entry['offset'] + entry['length'])
+
+def read_chapter_body(chapter, reader=None):
+    """
+    读取章节去掉首尾空白后的正文字节（在预读线程中调用）
+    
+    Returns:
+        bytes: 正文字节，章节太大时返回None，由写入时流式拷贝
+    """
+    entry = chapter.get('entry')
+    if entry is None:
+        with open(chapter['path'], 'rb') as infile:
+            size = os.fstat(infile.fileno()).st_size
+            start, end = stripped_range(infile, 0, size)
+            if end - start > PREFETCH_MAX_BYTES:
+                return None
+            infile.seek(start)
+            return normalize_newlines(infile.read(end - start))
+    if entry.get('codec'):
+        # 压缩章节在预读线程中解压，解压也一起并行了
+        return normalize_newlines(reader.read_text(entry).strip().encode('utf-8'))
+    if entry['length'] > PREFETCH_MAX_BYTES:
+        return None
+    data = reader.read_bytes(entry)
+    start, end = stripped_range(io.BytesIO(data), 0, len(data))
+    return normalize_newlines(data[start:end])
+
+def iter_prefetched(chapters, reader=None, workers=PREFETCH_WORKERS, task=read_chapter_body):
+    """
+    按原顺序返回 (章节, future)，后台线程池提前读取后面的章节
+    
+    已提交的future按章节顺序放在队列中，先读完的章节在队列里等前面的章节写完，
+    队列长度限制为 workers*2，内存中最多缓存这么多章。
+    task(chapter, reader) 在线程池中执行，默认读取正文字节。
+    """
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch") as executor:
+        pending = iter(chapters)
+        window = deque(
+            (chapter, executor.submit(task, chapter, reader))
+            for chapter in itertools.islice(pending, workers * 2)
+        )
+        while window:
+            chapter, future = window.popleft()
+            next_chapter = next(pending, None)
+            if next_chapter is not None:
+                window.append((next_chapter, executor.submit(task, next_chapter, reader)))
+            yield chapter, future
+
+def write_merged_book(source, chapters, output_file, incremental=True, reader=None, data_file=None,
+                      prefetch_workers=PREFETCH_WORKERS):
+    """
+    把章节写入合并文件，能增量合并时只追加新章节
+    
+    Args:
+        source (str): 章节目录或章节归档路径
+        chapters (list): list_directory_chapters / list_archive_chapters 的返回值
+        output_file (str): 输出文件路径
+        incremental (bool): 是否允许增量合并，False时总是完整重写
+        reader: 章节归档读取器（来源为归档时）
+        data_file: 以二进制方式打开的归档数据文件（来源为归档时）
+        prefetch_workers (int): 预读线程数，0表示不预读，逐个流式拷贝
+    """
+    state = load_merge_state(output_file)
+    kept = merged_prefix_length(state, source, chapters, output_file) if incremental else None
+    
+    if kept is not None and kept == len(chapters):
+        print(f"\n没有新章节，{output_file} 已是最新（共 {kept} 个章节）")
+        return
+    
+    if kept is None:
+        if incremental and state is not None:
+            print("已合并的章节有变化（或输出文件被修改），完整重写")
+        merged = []
+        outfile = open(output_file, 'wb')
         # 写入标题
-        outfile.write("《斗破苍穹》\n")
-        outfile.write("=" * 50 + "\n\n")
-        
-        for i, chapter_file in enumerate(chapter_files, 1):
-            print(f"正在处理第 {i} 个文件: {chapter_file.name}")
-            
+        write_book_header(outfile)
+    else:
+        merged = state['chapters']
+        print(f"增量合并：保留已合并的 {kept} 个章节，追加 {len(chapters) - kept} 个新章节")
+        outfile = open(output_file, 'r+b')
+        outfile.seek(state['book_size'])
+        outfile.truncate()
+    
+    new_chapters = chapters[len(merged):]
+    if prefetch_workers > 0:
+        prefetched = iter_prefetched(new_chapters, reader, prefetch_workers)
+    else:
+        prefetched = ((chapter, None) for chapter in new_chapters)
+    
+    with outfile:
+        for i, (chapter, future) in enumerate(prefetched, len(merged) + 1):
+            print(f"正在处理第 {i} 个章节: {chapter['title'] if 'entry' in chapter else chapter['key']}")
+            offset = outfile.tell()
             try:
-                with open(chapter_file, 'r', encoding='utf-8') as infile:
-                    content = infile.read().strip()
-                    
-                    # 从文件名提取章节标题
-                    chapter_title = chapter_file.stem  # 去掉.txt扩展名
-                    
-                    # 写入章节标题（用作分隔符）
-                    outfile.write(f"\n{'=' * 5}\n")
-                    outfile.write(f"{chapter_title}\n")
-                    outfile.write(f"{'=' * 5}\n\n")
-                    
-                    # 写入章节内容
-                    outfile.write(content)
-                    outfile.write("\n\n")
-                    
+                body = future.result() if future is not None else None
+                if body is None:
+                    write_chapter_item(outfile, chapter, reader, data_file)
+                else:
+                    write_chapter_header(outfile, chapter['title'])
+                    outfile.write(body)
+                    outfile.write(b"\n\n")
             except Exception as e:
-                print(f"处理文件 {chapter_file.name} 时出错: {e}")
+                print(f"处理章节 {chapter['key']} 时出错: {e}")
+                # 去掉写了一半的内容；这一章不记入状态，下次合并时会完整重写
+                outfile.seek(offset)
+                outfile.truncate()
                 continue
+            merged.append({
+                'key': chapter['key'],
+                'identity': chapter['identity'],
+                'title': chapter['title'],
+                'offset': offset,
+                'length': outfile.tell() - offset,
+            })
+        book_size = outfile.tell()
+    
+    st = os.stat(output_file)
+    write_text_atomic(merge_state_path(output_file), json.dumps({
+        'version': MERGE_STATE_VERSION,
+        'source': os.path.abspath(source),
+        'book_size': book_size,
+        'book_mtime_ns': st.st_mtime_ns,
+        'chapters': merged,
+    }, ensure_ascii=False))
+    
+    # 章节偏移索引，供 book_index.py 直接定位任意章节
+    write_book_index(output_file, [
+        dict(chapter, chapter=chapter_number_or_none(chapter['title'])) for chapter in merged
+    ])
     
     print(f"\n合并完成！输出文件：{output_file}")
-    print(f"共处理了 {len(chapter_files)} 个章节")
+    print(f"共处理了 {len(chapters) - (kept or 0)} 个章节，全书共 {len(merged)} 个章节")
+
+class BookSink:
+    """
+    直接输出合并后小说的输出端，配合 chapter_writer.BatchedChapterWriter(ordered=True) 使用
+
+    爬虫下载完成时小说也就合并好了，不需要先写章节文件再运行本脚本合并。
+    章节按URL索引顺序到达（由写入器的重排缓冲区保证），格式与合并章节文件时相同：
+    标题取规范化后的章节标题（与章节文件名中的标题一致），正文去掉首尾空白。
+    爬取过程中写入同目录下的临时文件，关闭时才替换输出文件，爬取失败不会毁掉上次合并好的小说；
+    关闭时同时生成章节偏移索引。
+
+    Args:
+        output_file (str): 输出文件路径
+    """
+
+    def __init__(self, output_file):
+        self.output_file = str(output_file)
+        self.chapters = []
+        fd, self._temp_path = open_temp_file(self.output_file)
+        self._outfile = os.fdopen(fd, 'wb')
+        write_book_header(self._outfile)
+
+    def stored_text(self, content):
+        """返回实际写入的正文（去掉首尾空白），统计字数时使用"""
+        return content.strip()
+
+    def _sync(self):
+        self._outfile.flush()
+        os.fsync(self._outfile.fileno())
+
+    def write_batch(self, records, fsync_policy):
+        """按顺序写入一批 (URL索引, 标题, 正文, URL)，返回写入的正文字节数"""
+        written = 0
+        for index, title, content, url in records:
+            title = normalize_title(title)
+            data = self.stored_text(content).encode('utf-8')
+            offset = self._outfile.tell()
+            write_chapter_header(self._outfile, title)
+            self._outfile.write(data)
+            self._outfile.write(b"\n\n")
+            self.chapters.append({
+                'title': title,
+                'offset': offset,
+                'length': self._outfile.tell() - offset,
+                'chapter': chapter_number_or_none(title),
+            })
+            written += len(data)
+            if fsync_policy == 'file':
+                self._sync()
+        if fsync_policy == 'batch':
+            self._sync()
+        return written
+
+    def close(self):
+        """把临时文件替换为输出文件，并写出章节偏移索引（由写线程调用）"""
+        if self._outfile.closed:
+            return
+        try:
+            # 替换后旧文件就没有了，替换前新内容必须已经落盘
+            self._sync()
+            self._outfile.close()
+            os.replace(self._temp_path, self.output_file)
+        except BaseException:
+            self._outfile.close()
+            os.unlink(self._temp_path)
+            raise
+        fsync_directory(os.path.dirname(os.path.abspath(self.output_file)))
+        # 旧的合并状态描述的是被替换之前的文件，留着没有意义
+        try:
+            os.remove(merge_state_path(self.output_file))
+        except FileNotFoundError:
+            pass
+        write_book_index(self.output_file, self.chapters)
 
-def show_chapter_list():
+def pack_epub_chapter(chapter, reader=None):
+    """读取一章并生成压缩好的XHTML（在线程池中调用）"""
+    entry = chapter.get('entry')
+    if entry is None:
+        with open(chapter['path'], 'r', encoding='utf-8') as infile:
+            text = infile.read()
+    else:
+        text = reader.read_text(entry)
+    return pack_chapter(chapter['title'], text.strip())
+
+def write_epub(chapters, output_file, reader=None, workers=PREFETCH_WORKERS):
+    """
+    把章节逐个写入EPUB，生成XHTML和压缩在线程池中进行，内存中最多缓存 workers*2 章
+    
+    Args:
+        chapters (list): list_directory_chapters / list_archive_chapters 的返回值
+        output_file (str): 输出文件路径
+        reader: 章节归档读取器（来源为归档时）
+        workers (int): 压缩线程数
+    """
+    written = 0
+    with EpubWriter(output_file, BOOK_TITLE) as epub:
+        for i, (chapter, future) in enumerate(iter_prefetched(chapters, reader, max(workers, 1), pack_epub_chapter), 1):
+            try:
+                packed = future.result()
+            except Exception as e:
+                print(f"处理章节 {chapter['key']} 时出错: {e}")
+                continue
+            epub.add_chapter(chapter['title'], packed)
+            written += 1
+            if i % 500 == 0:
+                print(f"已写入 {i}/{len(chapters)} 个章节")
+    print(f"\nEPUB导出完成！输出文件：{output_file}，共 {written} 个章节")
+
+def export_epub(source="novel_chapters", output_file="《斗破苍穹》.epub", workers=PREFETCH_WORKERS):
+    """
+    把章节目录或章节归档导出为EPUB（目录按章节标题生成）
+    
+    Args:
+        source (str): 章节目录或章节归档（.pack）路径
+        output_file (str): 输出文件路径
+        workers (int): 压缩线程数
+    """
+    if is_archive_path(source):
+        if not os.path.exists(index_path_for(source)):
+            print(f"错误：找不到章节归档 {source}")
+            return
+        with ArchiveReader(source) as reader:
+            chapters = list_archive_chapters(reader)
+            print(f"找到 {len(chapters)} 个章节")
+            write_epub(chapters, output_file, reader, workers)
+        return
+    
+    if not os.path.exists(source):
+        print(f"错误：找不到章节目录 {source}")
+        return
+    
+    chapters = list_directory_chapters(source)
+    print(f"找到 {len(chapters)} 个章节文件")
+    write_epub(chapters, output_file, workers=workers)
+
+def merge_novel_chapters(source="novel_chapters", output_file="《斗破苍穹》.txt", incremental=True,
+                         prefetch_workers=PREFETCH_WORKERS):
+    """
+    合并所有章节文件
+    
+    合并后在输出文件旁边保存状态文件（《斗破苍穹》.txt.merge.json），记录已合并的章节及其偏移量。
+    再次合并时如果只是在末尾新增了章节，直接追加到输出文件；中间的章节有变化时才完整重写。
+    
+    Args:
+        source (str): 章节目录或章节归档（.pack）路径
+        output_file (str): 输出文件路径
+        incremental (bool): 是否允许增量合并，False时总是完整重写
+        prefetch_workers (int): 预读线程数，0表示不预读
+    """
+    if is_archive_path(source):
+        if not os.path.exists(index_path_for(source)):
+            print(f"错误：找不到章节归档 {source}")
+            return
+        
+        with ArchiveReader(source) as reader, open(source, 'rb') as data_file:
+            chapters = list_archive_chapters(reader)
+            print(f"找到 {len(chapters)} 个章节")
+            write_merged_book(source, chapters, output_file, incremental, reader, data_file, prefetch_workers)
+        return
+    
+    if not os.path.exists(source):
+        print(f"错误：找不到章节目录 {source}")
+        return
+    
+    chapters = list_directory_chapters(source)
+    print(f"找到 {len(chapters)} 个章节文件")
+    write_merged_book(source, chapters, output_file, incremental, prefetch_workers=prefetch_workers)
+
+def show_archive_chapter_list(archive_path):
+    """显示章节归档的章节列表预览"""
+    if not os.path.exists(index_path_for(archive_path)):
+        print(f"错误：找不到章节归档 {archive_path}")
+        return
+    
+    with ArchiveReader(archive_path) as reader:
+        entries = reader.entries()
+    
+    print("章节列表预览：")
+    print("-" * 60)
+    
+    for i, entry in enumerate(entries[:10], 1):  # 只显示前10个
+        print(f"{i:3d}. 索引{entry['index'] + 1} - {entry['title']}")
+    
+    if len(entries) > 10:
+        print(f"... 还有 {len(entries) - 10} 个章节")
+    
+    print(f"\n总共找到 {len(entries)} 个章节")
+
+def show_chapter_list(source="novel_chapters"):
     """显示章节列表预览"""
-    chapters_dir = Path("novel_chapters")
+    if is_archive_path(source):
+        show_archive_chapter_list(source)
+        return
+    
+    chapters_dir = Path(source)
     
     if not chapters_dir.exists():
         print(f"错误：找不到章节目录 {chapters_dir}")
         return
     
-    all_files = list(chapters_dir.glob("*.txt"))
-    chapter_files = [f for f in all_files if is_chapter_file(f.name)]
-    chapter_files.sort(key=lambda x: extract_chapter_number(x.name))
+    # 目录没有变化时直接使用清单缓存，不再遍历目录、解析文件名；顺序与合并时相同
+    chapter_files = [entry for _, entry in list_indexed_chapters(chapters_dir)]
     
     print("章节列表预览：")
     print("-" * 60)
     
-    for i, chapter_file in enumerate(chapter_files[:10], 1):  # 只显示前10个
-        chapter_num = extract_chapter_number(chapter_file.name)
-        print(f"{i:3d}. 第{chapter_num}章 - {chapter_file.name}")
+    for i, entry in enumerate(chapter_files[:10], 1):  # 只显示前10个
+        chapter_num = entry['chapter_number'] if entry['chapter_number'] is not None else float('inf')
+        print(f"{i:3d}. 第{chapter_num}章 - {entry['name']}")
     
     if len(chapter_files) > 10:
         print(f"... 还有 {len(chapter_files) - 10} 个章节")
@@ -101,13 +631,22 @@ if __name__ == "__main__":
     print("《斗破苍穹》章节汇总工具")
     print("=" * 40)
     
+    # 章节来源：命令行参数指定的目录或归档，默认novel_chapters目录
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    source = args[0] if args else "novel_chapters"
+    incremental = '--full' not in sys.argv
+    epub = '--epub' in sys.argv
+    
     # 显示章节列表
-    show_chapter_list()
+    show_chapter_list(source)
     
     # 询问是否继续
-    response = input("\n是否开始合并章节？(y/n): ").strip().lower()
+    response = input(f"\n是否开始{'导出EPUB' if epub else '合并章节'}？(y/n): ").strip().lower()
     
     if response in ['y', 'yes', '是', '']:
-        merge_novel_chapters()
+        if epub:
+            export_epub(source)
+        else:
+            merge_novel_chapters(source, incremental=incremental)
     else:
         print("操作已取消")
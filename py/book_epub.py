@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式EPUB生成
+addfile.py 导出EPUB时使用：章节一个一个写入zip容器，不会把整本书放进内存。
+
+- 每章一个XHTML文件，压缩（deflate）在线程池中完成，写入线程只按顺序把压缩好的数据写进文件
+- 目录（nav.xhtml、toc.ncx）和 content.opf 在所有章节写完后根据记录的标题和顺序号生成，同样边压缩边写
+- zip容器由本模块直接写出（zipfile模块不能写入已经压缩好的数据），章节数超过65535时使用zip64结束记录
+
+内存中只保留每章的标题和zip目录项，几万章也只需要几MB。
+"""
+
+import html
+import struct
+import time
+import uuid
+import zlib
+
+MIMETYPE = b'application/epub+zip'
+DEFLATE_LEVEL = 9
+
+# zip格式常量
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+_DATA_DESCRIPTOR = struct.Struct('<IIII')
+_END_RECORD = struct.Struct('<IHHHHIIH')
+_ZIP64_END_RECORD = struct.Struct('<IQHHIIQQQQ')
+_ZIP64_END_LOCATOR = struct.Struct('<IIQI')
+_ZIP_VERSION = 20
+_ZIP64_VERSION = 45
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+_STORED = 0
+_DEFLATED = 8
+_MAX_UINT16 = 0xFFFF
+_MAX_UINT32 = 0xFFFFFFFF
+
+CONTAINER_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>
+"""
+
+
+def deflate(data):
+    """
+    压缩一个zip条目（可以在线程池中调用，zlib压缩时会释放GIL）
+
+    Returns:
+        tuple: (crc32, 原始长度, 压缩后的数据)
+    """
+    compressor = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -15)
+    return zlib.crc32(data), len(data), compressor.compress(data) + compressor.flush()
+
+
+def chapter_xhtml(title, text):
+    """生成一章的XHTML，正文每个非空行一个段落"""
+    title = html.escape(title)
+    parts = [
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<!DOCTYPE html>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" lang="zh">\n'
+        f'<head><meta charset="utf-8"/><title>{title}</title></head>\n'
+        f'<body>\n<h2>{title}</h2>\n'
+    ]
+    for line in text.splitlines():
+        line = line.strip()
+        if line:
+            parts.append(f'<p>{html.escape(line)}</p>\n')
+    parts.append('</body>\n</html>\n')
+    return ''.join(parts).encode('utf-8')
+
+
+def pack_chapter(title, text):
+    """生成并压缩一章，返回 deflate() 的结果（在线程池中调用）"""
+    return deflate(chapter_xhtml(title, text))
+
+
+def _dos_datetime(timestamp):
+    """zip目录项使用的DOS日期和时间"""
+    t = time.localtime(timestamp)
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+
+class EpubWriter:
+    """
+    流式EPUB写入器
+
+    用法：
+        with EpubWriter('《斗破苍穹》.epub', '斗破苍穹') as epub:
+            epub.add_chapter(title, pack_chapter(title, text))
+
+    Args:
+        path (str): 输出文件路径
+        title (str): 书名
+        author (str): 作者，可以为空
+    """
+
+    def __init__(self, path, title, author=None):
+        self.path = str(path)
+        self.title = title
+        self.author = author
+        self.toc = []  # (文件名, 标题)
+        self._central = []
+        self._dos_time, self._dos_date = _dos_datetime(time.time())
+        self._file = open(self.path, 'wb')
+        try:
+            # mimetype必须是第一个条目且不压缩
+            self._write_entry('mimetype', zlib.crc32(MIMETYPE), len(MIMETYPE), MIMETYPE, _STORED)
+            self._write_entry('META-INF/container.xml', *deflate(CONTAINER_XML.encode('utf-8')))
+        except BaseException:
+            self._file.close()
+            raise
+
+    def _local_header(self, name, flags, method, crc, compressed_size, size):
+        """写入本地文件头，返回该条目的偏移量"""
+        offset = self._file.tell()
+        if offset > _MAX_UINT32:
+            raise ValueError("EPUB文件超过4GB，不支持")
+        encoded = name.encode('utf-8')
+        self._file.write(_LOCAL_HEADER.pack(
+            0x04034b50, _ZIP_VERSION, flags, method, self._dos_time, self._dos_date,
+            crc, compressed_size, size, len(encoded), 0))
+        self._file.write(encoded)
+        return offset
+
+    def _write_entry(self, name, crc, size, data, method=_DEFLATED):
+        """写入一个已经压缩好的条目"""
+        offset = self._local_header(name, _FLAG_UTF8, method, crc, len(data), size)
+        self._file.write(data)
+        self._central.append((name, _FLAG_UTF8, method, crc, len(data), size, offset))
+
+    def _write_streamed(self, name, chunks):
+        """边压缩边写入一个条目（大小事先未知，写在数据后面的描述符中）"""
+        flags = _FLAG_UTF8 | _FLAG_DATA_DESCRIPTOR
+        offset = self._local_header(name, flags, _DEFLATED, 0, 0, 0)
+        compressor = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -15)
+        crc = size = compressed_size = 0
+        for chunk in chunks:
+            data = chunk.encode('utf-8')
+            crc = zlib.crc32(data, crc)
+            size += len(data)
+            out = compressor.compress(data)
+            compressed_size += len(out)
+            self._file.write(out)
+        out = compressor.flush()
+        compressed_size += len(out)
+        self._file.write(out)
+        self._file.write(_DATA_DESCRIPTOR.pack(0x08074b50, crc, compressed_size, size))
+        self._central.append((name, flags, _DEFLATED, crc, compressed_size, size, offset))
+
+    def add_chapter(self, title, packed):
+        """
+        按顺序添加一章，目录中的序号就是添加的顺序
+
+        Args:
+            title (str): 章节标题（用于目录）
+            packed (tuple): pack_chapter() 的返回值
+        """
+        name = f"text/chapter{len(self.toc) + 1:05d}.xhtml"
+        self._write_entry('OEBPS/' + name, *packed)
+        self.toc.append((name, title))
+
+    def _iter_nav(self):
+        yield ('<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html>\n'
+               '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" lang="zh">\n'
+               f'<head><meta charset="utf-8"/><title>{html.escape(self.title)}</title></head>\n'
+               '<body>\n<nav epub:type="toc" id="toc">\n<h1>目录</h1>\n<ol>\n')
+        for name, title in self.toc:
+            yield f'<li><a href="{name}">{html.escape(title)}</a></li>\n'
+        yield '</ol>\n</nav>\n</body>\n</html>\n'
+
+    def _iter_ncx(self, identifier):
+        # EPUB2阅读器使用的目录
+        yield ('<?xml version="1.0" encoding="utf-8"?>\n'
+               '<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">\n'
+               f'<head><meta name="dtb:uid" content="{identifier}"/></head>\n'
+               f'<docTitle><text>{html.escape(self.title)}</text></docTitle>\n<navMap>\n')
+        for order, (name, title) in enumerate(self.toc, 1):
+            yield (f'<navPoint id="np{order}" playOrder="{order}">'
+                   f'<navLabel><text>{html.escape(title)}</text></navLabel><content src="{name}"/></navPoint>\n')
+        yield '</navMap>\n</ncx>\n'
+
+    def _iter_opf(self, identifier):
+        modified = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        creator = f'<dc:creator>{html.escape(self.author)}</dc:creator>\n' if self.author else ''
+        yield ('<?xml version="1.0" encoding="utf-8"?>\n'
+               '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="bookid">\n'
+               '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">\n'
+               f'<dc:identifier id="bookid">{identifier}</dc:identifier>\n'
+               f'<dc:title>{html.escape(self.title)}</dc:title>\n{creator}'
+               '<dc:language>zh</dc:language>\n'
+               f'<meta property="dcterms:modified">{modified}</meta>\n</metadata>\n<manifest>\n'
+               '<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>\n'
+               '<item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml"/>\n')
+        for order, (name, title) in enumerate(self.toc, 1):
+            yield f'<item id="c{order}" href="{name}" media-type="application/xhtml+xml"/>\n'
+        yield '</manifest>\n<spine toc="ncx">\n'
+        for order in range(1, len(self.toc) + 1):
+            yield f'<itemref idref="c{order}"/>\n'
+        yield '</spine>\n</package>\n'
+
+    def _write_central_directory(self):
+        """写入zip中央目录和结束记录"""
+        start = self._file.tell()
+        for name, flags, method, crc, compressed_size, size, offset in self._central:
+            encoded = name.encode('utf-8')
+            self._file.write(_CENTRAL_HEADER.pack(
+                0x02014b50, _ZIP_VERSION, _ZIP_VERSION, flags, method, self._dos_time, self._dos_date,
+                crc, compressed_size, size, len(encoded), 0, 0, 0, 0, 0, offset))
+            self._file.write(encoded)
+        end = self._file.tell()
+        count = len(self._central)
+        if count > _MAX_UINT16 or end > _MAX_UINT32:
+            # 条目数超过16位时需要zip64结束记录
+            self._file.write(_ZIP64_END_RECORD.pack(
+                0x06064b50, _ZIP64_END_RECORD.size - 12, _ZIP64_VERSION, _ZIP64_VERSION, 0, 0,
+                count, count, end - start, start))
+            self._file.write(_ZIP64_END_LOCATOR.pack(0x07064b50, 0, end, 1))
+            self._file.write(_END_RECORD.pack(
+                0x06054b50, 0, 0, _MAX_UINT16, _MAX_UINT16, min(end - start, _MAX_UINT32),
+                min(start, _MAX_UINT32), 0))
+        else:
+            self._file.write(_END_RECORD.pack(0x06054b50, 0, 0, count, count, end - start, start, 0))
+
+    def close(self):
+        """写入目录、content.opf 和zip中央目录，关闭文件"""
+        if self._file.closed:
+            return
+        with self._file:
+            identifier = f"urn:uuid:{uuid.uuid5(uuid.NAMESPACE_URL, self.title)}"
+            self._write_streamed('OEBPS/nav.xhtml', self._iter_nav())
+            self._write_streamed('OEBPS/toc.ncx', self._iter_ncx(identifier))
+            self._write_streamed('OEBPS/content.opf', self._iter_opf(identifier))
+            self._write_central_directory()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合并后小说的章节偏移索引
+addfile.py 合并时在小说旁边生成索引文件（《斗破苍穹》.txt.idx），每行一个JSON：
+  {"number": 在书中的位置（从1开始）, "chapter": 标题中的章节号（没有时为null）, "title": 章节标题, "offset": 偏移量, "length": 字节长度}
+
+偏移量和长度覆盖一个完整的章节块（"=====" 标题分隔符 + 正文），
+读取时用mmap直接定位，不需要从头扫描整本书。
+
+用法：
+    python book_index.py 《斗破苍穹》.txt list
+    python book_index.py 《斗破苍穹》.txt 1200         # 提取第1200章（按标题中的章节号）
+    python book_index.py 《斗破苍穹》.txt 1200-1210    # 提取第1200到1210章
+    python book_index.py 《斗破苍穹》.txt at 1200      # 提取书中的第1200个章节块（按位置，不看章节号）
+    python book_index.py 《斗破苍穹》.txt at 1200-1210
+    python book_index.py 《斗破苍穹》.txt find 萧炎    # 按标题查找
+    python book_index.py 《斗破苍穹》.txt rebuild      # 扫描分隔符重建索引（旧版本合并的文件）
+"""
+
+import json
+import mmap
+import os
+import sys
+
+from chapter_catalog import chapter_number_or_none
+from chapter_naming import write_text_atomic
+
+BOOK_INDEX_SUFFIX = '.idx'
+SEPARATOR = '=' * 5
+
+
+def book_index_path(book_path):
+    """返回小说对应的索引文件路径"""
+    return str(book_path) + BOOK_INDEX_SUFFIX
+
+
+def write_book_index(book_path, chapters):
+    """
+    写出章节偏移索引
+
+    Args:
+        book_path (str): 合并后的小说路径
+        chapters (list): 按顺序排列的 {'title', 'offset', 'length', 'chapter'} 字典
+    """
+    lines = []
+    for number, chapter in enumerate(chapters, 1):
+        lines.append(json.dumps({
+            'number': number,
+            'chapter': chapter.get('chapter'),
+            'title': chapter['title'],
+            'offset': chapter['offset'],
+            'length': chapter['length'],
+        }, ensure_ascii=False))
+    write_text_atomic(book_index_path(book_path), '\n'.join(lines) + '\n' if lines else '')
+
+
+def load_book_index(book_path):
+    """
+    读取章节偏移索引
+
+    Returns:
+        list: 索引记录列表，索引文件不存在时返回None
+    """
+    try:
+        with open(book_index_path(book_path), 'r', encoding='utf-8') as index_file:
+            return [json.loads(line) for line in index_file if line.strip()]
+    except FileNotFoundError:
+        return None
+
+
+def scan_book(book_path):
+    """
+    扫描合并文件中的 "=====" 分隔符，重建章节偏移索引
+
+    章节块的格式为 "\\n=====\\n标题\\n=====\\n\\n正文\\n\\n"，见 addfile.write_chapter_header。
+
+    Returns:
+        list: 与 load_book_index 相同格式的索引记录
+    """
+    marker = f"\n{SEPARATOR}\n".encode('utf-8')
+    chapters = []
+    if os.path.getsize(book_path) == 0:
+        # 空文件无法mmap
+        return chapters
+    with open(book_path, 'rb') as book, mmap.mmap(book.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        position = mm.find(marker)
+        while position >= 0:
+            title_start = position + len(marker)
+            title_end = mm.find(b"\n", title_start)
+            # 标题行之后必须紧跟第二个分隔符，否则只是正文中恰好出现的 "====="
+            if title_end < 0 or mm[title_end:title_end + len(marker)] != marker:
+                position = mm.find(marker, title_start)
+                continue
+            chapters.append({
+                'title': mm[title_start:title_end].decode('utf-8'),
+                'offset': position,
+            })
+            position = mm.find(marker, title_end + len(marker))
+        size = len(mm)
+
+    for current, following in zip(chapters, chapters[1:] + [None]):
+        end = following['offset'] if following else size
+        current['length'] = end - current['offset']
+    return [dict(chapter, number=number, chapter=chapter_number_or_none(chapter['title']))
+            for number, chapter in enumerate(chapters, 1)]
+
+
+def strip_book_headers(text):
+    """
+    去掉合并后小说文本中的书名和章节标题块，只留下各章正文（按 scan_book 的规则识别分隔符）
+
+    各章正文之间用换行分开，不会把上一章的结尾和下一章的开头连在一起。
+    文本中没有章节标题块时（不是合并生成的文件）原样返回。
+    """
+    marker = f"\n{SEPARATOR}\n"
+    bodies = []
+    body_start = None
+    position = text.find(marker)
+    while position >= 0:
+        title_start = position + len(marker)
+        title_end = text.find("\n", title_start)
+        # 标题行之后必须紧跟第二个分隔符，否则只是正文中恰好出现的 "====="
+        if title_end < 0 or not text.startswith(marker, title_end):
+            position = text.find(marker, title_start)
+            continue
+        if body_start is not None:
+            bodies.append(text[body_start:position])
+        body_start = title_end + len(marker)
+        position = text.find(marker, body_start)
+    if body_start is None:
+        return text
+    bodies.append(text[body_start:])
+    return "\n".join(bodies)
+
+
+def _read_blocks(book_path, blocks):
+    """
+    用mmap读取若干段 (偏移量, 长度) 并按顺序拼接
+
+    Raises:
+        ValueError: 索引与文件内容不一致（合并文件在生成索引后被修改过）
+    """
+    marker = f"\n{SEPARATOR}\n".encode('utf-8')
+    parts = []
+    with open(book_path, 'rb') as book, mmap.mmap(book.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for start, end in blocks:
+            if end > len(mm) or mm[start:start + len(marker)] != marker:
+                raise ValueError("索引与文件内容不一致，请重新合并或运行 rebuild")
+            parts.append(mm[start:end])
+    return b''.join(parts).decode('utf-8')
+
+
+def read_positions(book_path, first, last=None, index=None):
+    """
+    用mmap读取书中第 first 到 last 个章节块（包含两端，从1开始，按在书中的位置，不看章节号）
+
+    Args:
+        book_path (str): 合并后的小说路径
+        first (int): 起始位置
+        last (int): 结束位置，None表示只读取一个章节块
+        index (list): 已加载的索引，None时自动读取
+
+    Returns:
+        str: 章节文本（包括标题分隔符），位置超出范围时返回None
+
+    Raises:
+        ValueError: 索引与文件内容不一致（合并文件在生成索引后被修改过）
+    """
+    if index is None:
+        index = load_book_index(book_path)
+    if last is None:
+        last = first
+    if not index or first < 1 or last < first or last > len(index):
+        return None
+    start = index[first - 1]['offset']
+    end = index[last - 1]['offset'] + index[last - 1]['length']
+    return _read_blocks(book_path, [(start, end)])
+
+
+def read_chapters(book_path, first, last=None, index=None):
+    """
+    读取章节号在 first 到 last 之间（包含两端）的章节，章节号取自索引的 chapter 字段（标题中的章节号）
+
+    书中有缺失的章节号时只返回存在的章节；同一章节号出现多次时全部返回；没有章节号的章节不会被选中。
+    相邻的章节合并为一次读取。
+
+    Args:
+        book_path (str): 合并后的小说路径
+        first (int): 起始章节号
+        last (int): 结束章节号，None表示只读取一章
+        index (list): 已加载的索引，None时自动读取
+
+    Returns:
+        str: 章节文本（包括标题分隔符，按在书中的顺序），没有匹配的章节时返回None
+
+    Raises:
+        ValueError: 索引与文件内容不一致（合并文件在生成索引后被修改过）
+    """
+    if index is None:
+        index = load_book_index(book_path)
+    if last is None:
+        last = first
+    blocks = []
+    for entry in index or []:
+        if entry.get('chapter') is None or not first <= entry['chapter'] <= last:
+            continue
+        start, end = entry['offset'], entry['offset'] + entry['length']
+        if blocks and blocks[-1][1] == start:
+            blocks[-1] = (blocks[-1][0], end)
+        else:
+            blocks.append((start, end))
+    if not blocks:
+        return None
+    return _read_blocks(book_path, blocks)
+
+
+def parse_range(text):
+    """解析 "1200" 或 "1200-1210" 形式的章节范围"""
+    first, sep, last = text.partition('-')
+    if not first.isdigit() or (sep and not last.isdigit()):
+        return None
+    return int(first), int(last) if sep else None
+
+
+def main():
+    """命令行入口"""
+    if len(sys.argv) < 3:
+        print(__doc__)
+        return
+
+    book_path, command = sys.argv[1], sys.argv[2]
+    if not os.path.exists(book_path):
+        print(f"错误：找不到文件 {book_path}")
+        return
+
+    if command == 'rebuild':
+        chapters = scan_book(book_path)
+        write_book_index(book_path, chapters)
+        print(f"已重建索引 {book_index_path(book_path)}，共 {len(chapters)} 个章节")
+        return
+
+    index = load_book_index(book_path)
+    if index is None:
+        print(f"错误：找不到索引 {book_index_path(book_path)}，请重新合并或运行 rebuild")
+        return
+
+    if command == 'list':
+        for entry in index:
+            print(f"{entry['number']:5d}. {entry['title']} (偏移 {entry['offset']:,}，{entry['length']:,} 字节)")
+        print(f"\n共 {len(index)} 个章节")
+    elif command == 'find' and len(sys.argv) > 3:
+        keyword = sys.argv[3]
+        for entry in index:
+            if keyword in entry['title']:
+                print(f"{entry['number']:5d}. {entry['title']}")
+    else:
+        by_position = command == 'at'
+        chapter_range = parse_range(sys.argv[3] if by_position and len(sys.argv) > 3 else command)
+        if chapter_range is None:
+            print(__doc__)
+            return
+        try:
+            if by_position:
+                text = read_positions(book_path, *chapter_range, index=index)
+            else:
+                text = read_chapters(book_path, *chapter_range, index=index)
+        except ValueError as e:
+            print(f"错误：{e}")
+            return
+        if text is not None:
+            print(text)
+        elif by_position:
+            print(f"错误：位置超出范围（共 {len(index)} 个章节）")
+        elif all(entry.get('chapter') is None for entry in index):
+            print("错误：索引中没有章节号（旧版本的索引），请运行 rebuild，或用 at N 按位置提取")
+        else:
+            print(f"错误：书中没有第 {command} 章")
+
+
+if __name__ == "__main__":
+    main()
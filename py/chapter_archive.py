@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+章节打包归档工具
+将所有章节追加写入一个数据文件，并用索引文件记录每章的偏移量和长度
+
+文件格式：
+- novel_chapters.pack      数据文件，所有章节的UTF-8正文首尾相接
+- novel_chapters.pack.idx  索引文件，每行一个JSON：
+  {"index": URL索引, "title": 章节标题, "chapter": 章节号, "offset": 偏移量, "length": 字节长度, "url": 章节URL}
+  （标题中没有章节号时不写 "chapter"）
+
+两个文件都只追加不修改；同一URL索引重复写入时，以最后一条记录为准。
+
+压缩模式（需要安装 zstandard）：
+先用前若干章训练一个共享的zstd字典，保存为 novel_chapters.pack.dict，
+之后每章单独用字典压缩，索引记录中增加 "codec": "zstd" 和 "raw_length"（压缩前字节数）。
+章节之间内容相似，共享字典比逐章单独压缩的压缩率高得多，同时仍然可以按章随机读取。
+
+用法：
+    python chapter_archive.py novel_chapters.pack list
+    python chapter_archive.py novel_chapters.pack cat 12
+    python chapter_archive.py novel_chapters.pack pack novel_chapters
+    python chapter_archive.py novel_chapters.pack compress novel_chapters.zst.pack
+"""
+
+import json
+import os
+import random
+import sys
+import threading
+
+try:
+    import zstandard
+except ImportError:  # 只有压缩模式需要
+    zstandard = None
+
+from chapter_catalog import chapter_number_or_none
+from chapter_naming import write_bytes_atomic
+
+ARCHIVE_SUFFIX = '.pack'
+INDEX_SUFFIX = '.idx'
+DICT_SUFFIX = '.dict'
+
+CODEC_ZSTD = 'zstd'
+DEFAULT_DICT_SIZE = 112640  # zstd默认的字典大小（110KB）
+DEFAULT_DICT_SAMPLES = 200  # 训练字典使用的章节数
+DEFAULT_LEVEL = 9
+
+
+def is_archive_path(path):
+    """判断路径是否指向章节归档文件"""
+    return str(path).endswith(ARCHIVE_SUFFIX)
+
+
+def index_path_for(archive_path):
+    """返回归档数据文件对应的索引文件路径"""
+    return str(archive_path) + INDEX_SUFFIX
+
+
+def dict_path_for(archive_path):
+    """返回归档数据文件对应的压缩字典路径"""
+    return str(archive_path) + DICT_SUFFIX
+
+
+def entry_raw_length(entry):
+    """返回索引记录对应章节压缩前的字节数"""
+    return entry.get('raw_length', entry['length'])
+
+
+def require_zstandard():
+    """压缩模式缺少依赖时给出明确的提示"""
+    if zstandard is None:
+        raise RuntimeError("压缩模式需要安装 zstandard 库：pip install zstandard")
+
+
+def train_dictionary(samples, dict_size=DEFAULT_DICT_SIZE):
+    """
+    用章节样本训练zstd字典
+
+    Args:
+        samples (list): 章节正文的UTF-8字节串列表
+        dict_size (int): 字典大小（字节）
+
+    Returns:
+        bytes: 字典内容，样本太少无法训练时返回None
+    """
+    require_zstandard()
+    try:
+        return zstandard.train_dictionary(dict_size, samples).as_bytes()
+    except zstandard.ZstdError:
+        return None
+
+
+class ArchiveWriter:
+    """
+    章节归档写入器（线程安全，只追加）
+
+    压缩模式下，归档还没有字典时先把前 dict_samples 章缓存在内存中，
+    够数后训练字典、写出字典文件，再把缓存的章节压缩写入。
+
+    Args:
+        archive_path (str): 归档数据文件路径
+        compress (bool): 是否用共享字典压缩每一章
+        dict_samples (int): 训练字典使用的章节数
+        level (int): zstd压缩级别
+        dict_data (bytes): 已经训练好的字典（由调用者负责写出字典文件），None时读取或训练归档自己的字典
+    """
+
+    def __init__(self, archive_path, compress=False, dict_samples=DEFAULT_DICT_SAMPLES, level=DEFAULT_LEVEL,
+                 dict_data=None):
+        self.archive_path = str(archive_path)
+        self.index_path = index_path_for(self.archive_path)
+        self.compress = compress
+        self.dict_samples = dict_samples
+        self.level = level
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._dict = None
+        self._pending = []
+        if compress:
+            require_zstandard()
+            dict_path = dict_path_for(self.archive_path)
+            if dict_data is not None:
+                self._dict = zstandard.ZstdCompressionDict(dict_data)
+            elif os.path.exists(dict_path):
+                with open(dict_path, 'rb') as dict_file:
+                    self._dict = zstandard.ZstdCompressionDict(dict_file.read())
+        self._data_file = open(self.archive_path, 'ab')
+        self._index_file = open(self.index_path, 'a', encoding='utf-8')
+
+    def _compressor(self):
+        """每个线程一个压缩器（ZstdCompressor不能跨线程共用）"""
+        compressor = getattr(self._local, 'compressor', None)
+        if compressor is None:
+            compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self._dict)
+            self._local.compressor = compressor
+        return compressor
+
+    def _write_entry(self, index, title, data, url, raw_length=None):
+        """写入一段数据及其索引记录，调用者必须持有锁"""
+        offset = self._data_file.seek(0, os.SEEK_END)
+        self._data_file.write(data)
+        # 先落数据再写索引，中途崩溃最多留下一段没有索引的数据
+        self._data_file.flush()
+        entry = {'index': index, 'title': title, 'offset': offset, 'length': len(data)}
+        chapter_number = chapter_number_or_none(title)
+        if chapter_number is not None:
+            entry['chapter'] = chapter_number
+        if raw_length is not None:
+            entry['codec'] = CODEC_ZSTD
+            entry['raw_length'] = raw_length
+        if url is not None:
+            entry['url'] = url
+        self._index_file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._index_file.flush()
+        return entry
+
+    def _flush_pending(self):
+        """训练字典并写出缓存的章节，调用者必须持有锁"""
+        pending, self._pending = self._pending, []
+        dict_data = train_dictionary([item[2] for item in pending])
+        if dict_data is None:
+            # 样本太少训练不出字典，这些章节按原文存储，下次运行再尝试
+            print(f"警告：{len(pending)} 个章节不足以训练压缩字典，按未压缩方式保存")
+            for index, title, data, url in pending:
+                self._write_entry(index, title, data, url)
+            return
+        write_bytes_atomic(dict_path_for(self.archive_path), dict_data)
+        self._dict = zstandard.ZstdCompressionDict(dict_data)
+        compressor = self._compressor()
+        for index, title, data, url in pending:
+            self._write_entry(index, title, compressor.compress(data), url, len(data))
+
+    def append(self, index, title, content, url=None):
+        """
+        追加一个章节
+
+        Args:
+            index (int): URL索引（从0开始）
+            title (str): 章节标题
+            content (str): 章节正文
+            url (str): 章节URL，可省略
+
+        Returns:
+            dict: 写入的索引记录
+        """
+        data = content.encode('utf-8')
+        if not self.compress:
+            with self._lock:
+                return self._write_entry(index, title, data, url)
+
+        if self._dict is None:
+            with self._lock:
+                if self._dict is None:
+                    # 还在收集训练样本
+                    self._pending.append((index, title, data, url))
+                    if len(self._pending) >= self.dict_samples:
+                        self._flush_pending()
+                    return None
+
+        # 压缩在锁外进行，多个线程可以同时压缩
+        compressed = self._compressor().compress(data)
+        with self._lock:
+            return self._write_entry(index, title, compressed, url, len(data))
+
+    def buffered_indexes(self):
+        """还缓存在内存中等待训练字典、没有写入归档的章节的URL索引"""
+        with self._lock:
+            return {item[0] for item in self._pending}
+
+    def sync(self):
+        """把数据文件和索引文件同步到磁盘"""
+        with self._lock:
+            for file in (self._data_file, self._index_file):
+                file.flush()
+                os.fsync(file.fileno())
+
+    def write_batch(self, records, fsync_policy):
+        """
+        写入一批章节，作为 chapter_writer.BatchedChapterWriter 的输出端
+
+        Args:
+            records (list): [(URL索引, 标题, 正文, URL), ...]
+            fsync_policy (str): 'none' / 'batch' / 'file'
+
+        Returns:
+            int: 写入的正文字节数（压缩前）
+        """
+        written = 0
+        for index, title, content, url in records:
+            entry = self.append(index, title, content, url)
+            if entry is not None:
+                written += entry_raw_length(entry)
+            else:
+                # 还在缓存中等待训练字典
+                written += len(content.encode('utf-8'))
+            if fsync_policy == 'file':
+                self.sync()
+        if fsync_policy == 'batch':
+            self.sync()
+        return written
+
+    def close(self):
+        """关闭归档文件（压缩模式下先写出还在缓存中的章节）"""
+        with self._lock:
+            if self._pending:
+                self._flush_pending()
+            self._data_file.close()
+            self._index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ArchiveReader:
+    """
+    章节归档读取器，支持按URL索引或标题随机读取
+
+    Args:
+        archive_path (str): 归档数据文件路径
+    """
+
+    def __init__(self, archive_path):
+        self.archive_path = str(archive_path)
+        self.index_path = index_path_for(self.archive_path)
+        self._by_index = {}
+        with open(self.index_path, 'r', encoding='utf-8') as index_file:
+            for line in index_file:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 写到一半的最后一行，忽略
+                    continue
+                self._by_index[entry['index']] = entry
+        self._by_title = {entry['title']: entry for entry in self.entries()}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._dict = None
+        if any(entry.get('codec') == CODEC_ZSTD for entry in self._by_index.values()):
+            require_zstandard()
+            with open(dict_path_for(self.archive_path), 'rb') as dict_file:
+                self._dict = zstandard.ZstdCompressionDict(dict_file.read())
+        self._data_file = open(self.archive_path, 'rb')
+
+    def entries(self):
+        """按URL索引顺序返回所有索引记录"""
+        return [self._by_index[i] for i in sorted(self._by_index)]
+
+    def get_entry(self, index):
+        """按URL索引获取索引记录，不存在时返回None"""
+        return self._by_index.get(index)
+
+    def find_by_title(self, title):
+        """按章节标题获取索引记录，不存在时返回None"""
+        return self._by_title.get(title)
+
+    def read_bytes(self, entry):
+        """读取索引记录对应的存储字节（压缩章节为压缩后的数据）"""
+        with self._lock:
+            self._data_file.seek(entry['offset'])
+            return self._data_file.read(entry['length'])
+
+    def read_text(self, entry):
+        """读取索引记录对应的章节正文，压缩章节自动解压"""
+        data = self.read_bytes(entry)
+        if entry.get('codec') == CODEC_ZSTD:
+            decompressor = getattr(self._local, 'decompressor', None)
+            if decompressor is None:
+                decompressor = zstandard.ZstdDecompressor(dict_data=self._dict)
+                self._local.decompressor = decompressor
+            data = decompressor.decompress(data)
+        return data.decode('utf-8')
+
+    def read(self, index):
+        """
+        按URL索引读取章节正文
+
+        Args:
+            index (int): URL索引（从0开始）
+
+        Returns:
+            str: 章节正文，不存在时返回None
+        """
+        entry = self.get_entry(index)
+        if entry is None:
+            return None
+        return self.read_text(entry)
+
+    def iter_chapters(self):
+        """按URL索引顺序遍历 (索引记录, 正文)"""
+        for entry in self.entries():
+            yield entry, self.read_text(entry)
+
+    def __len__(self):
+        return len(self._by_index)
+
+    def close(self):
+        """关闭归档文件"""
+        self._data_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def pack_directory(chapters_dir, archive_path):
+    """
+    将已有的章节目录打包为归档
+
+    URL索引和标题取自文件名的 NNNN_ 前缀（见 chapter_catalog.list_indexed_chapters），
+    没有前缀的旧章节文件按章节号顺序依次编号。
+
+    Args:
+        chapters_dir (str): 章节目录
+        archive_path (str): 归档数据文件路径
+
+    Returns:
+        int: 打包的章节数
+    """
+    from chapter_catalog import list_indexed_chapters
+
+    chapters = list_indexed_chapters(chapters_dir)
+    with ArchiveWriter(archive_path) as writer:
+        for index, entry in chapters:
+            with open(os.path.join(chapters_dir, entry['name']), 'r', encoding='utf-8') as infile:
+                writer.append(index, entry['title'], infile.read())
+    return len(chapters)
+
+
+def compress_archive(archive_path, output_path, dict_samples=DEFAULT_DICT_SAMPLES, level=DEFAULT_LEVEL):
+    """
+    将已有的归档重新打包为压缩归档
+
+    字典样本从整部小说中均匀随机抽取，比只用开头的章节更有代表性。
+    压缩归档必须是新文件：已有归档中的章节是用另一个字典压缩的，换掉字典后就无法解压。
+    字典文件在所有章节写完后最后原子地写出。
+
+    Args:
+        archive_path (str): 源归档路径
+        output_path (str): 压缩归档路径
+        dict_samples (int): 训练字典使用的章节数
+        level (int): zstd压缩级别
+
+    Returns:
+        tuple: (压缩前总字节数, 压缩后总字节数（含字典）)
+
+    Raises:
+        FileExistsError: 压缩归档（数据、索引或字典文件）已存在
+    """
+    require_zstandard()
+    for path in (output_path, index_path_for(output_path), dict_path_for(output_path)):
+        if os.path.exists(path):
+            raise FileExistsError(f"{path} 已存在，请先删除或换一个输出路径")
+    with ArchiveReader(archive_path) as reader:
+        entries = reader.entries()
+        sample_entries = random.Random(0).sample(entries, min(dict_samples, len(entries)))
+        dict_data = train_dictionary([reader.read_text(e).encode('utf-8') for e in sample_entries])
+        if dict_data is None:
+            raise RuntimeError("章节太少，无法训练压缩字典")
+
+        raw_total = 0
+        with ArchiveWriter(output_path, compress=True, level=level, dict_data=dict_data) as writer:
+            for entry, content in reader.iter_chapters():
+                written = writer.append(entry['index'], entry['title'], content, entry.get('url'))
+                raw_total += written['raw_length']
+            writer.sync()
+    write_bytes_atomic(dict_path_for(output_path), dict_data)
+    return raw_total, os.path.getsize(output_path) + len(dict_data)
+
+
+def main():
+    """命令行入口"""
+    if len(sys.argv) < 3:
+        print(__doc__)
+        return
+
+    archive_path, command = sys.argv[1], sys.argv[2]
+
+    if command == 'pack':
+        chapters_dir = sys.argv[3] if len(sys.argv) > 3 else "novel_chapters"
+        count = pack_directory(chapters_dir, archive_path)
+        print(f"已打包 {count} 个章节到 {archive_path}")
+        return
+
+    if command == 'compress' and len(sys.argv) > 3:
+        try:
+            raw_total, compressed_total = compress_archive(archive_path, sys.argv[3])
+        except (FileExistsError, RuntimeError) as e:
+            print(f"错误：{e}")
+            return
+        print(f"已压缩到 {sys.argv[3]}：{raw_total:,} 字节 -> {compressed_total:,} 字节 "
+              f"（{raw_total / max(compressed_total, 1):.1f} 倍）")
+        return
+
+    if not os.path.exists(index_path_for(archive_path)):
+        print(f"错误：找不到归档索引 {index_path_for(archive_path)}")
+        return
+
+    with ArchiveReader(archive_path) as reader:
+        if command == 'list':
+            raw_total = stored_total = 0
+            for entry in reader.entries():
+                print(f"{entry['index'] + 1:5d}. {entry['title']} ({entry_raw_length(entry):,} 字节)")
+                raw_total += entry_raw_length(entry)
+                stored_total += entry['length']
+            print(f"\n共 {len(reader)} 个章节，正文 {raw_total:,} 字节，存储 {stored_total:,} 字节")
+        elif command == 'cat' and len(sys.argv) > 3:
+            # 命令行中的序号从1开始，与爬虫日志中的"索引N"一致
+            content = reader.read(int(sys.argv[3]) - 1)
+            if content is None:
+                print(f"错误：归档中没有索引为 {sys.argv[3]} 的章节")
+            else:
+                print(content)
+        else:
+            print(__doc__)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+章节目录清单缓存
+addfile.py（章节列表、合并）和 toolname.py（重命名）都要遍历 novel_chapters 目录、
+判断哪些是章节文件、从文件名解析章节号。清单缓存把这些结果保存在目录旁边的
+novel_chapters.catalog.json 中：
+
+- 目录的修改时间没变（没有新增、删除、重命名文件）时直接使用缓存，不再遍历目录
+- 需要刷新时只用一次 os.scandir 遍历，文件名没变的条目沿用上次的解析结果
+- 每个文件同时记录 (大小, 修改时间)，合并时用来判断章节内容是否变化
+
+缓存文件放在目录外面，否则写缓存本身就会改变目录的修改时间。
+"""
+
+import json
+import os
+import re
+import time
+
+from chapter_naming import split_index_prefix, write_text_atomic
+
+CATALOG_SUFFIX = '.catalog.json'
+# 文件名解析规则变化时递增，旧缓存自动作废
+CATALOG_VERSION = 2  # 2: toolname.chinese_to_arabic 改为查表解析，旧缓存中的章节号可能有误
+# 目录修改时间与扫描时间太接近时，可能在同一个时间戳内又有改动，不能信任缓存
+RACY_WINDOW_NS = 2 * 10**9
+
+
+def extract_chapter_number(filename):
+    """从文件名中提取章节号"""
+    # 匹配形如 "1章" "123章" 等格式
+    match = re.search(r'(\d+)章', filename)
+    if match:
+        return int(match.group(1))
+    return float('inf')  # 非章节文件排到最后
+
+
+def chapter_number_or_none(name):
+    """从标题或文件名中提取章节号，没有章节号时返回None（用于写入索引等元数据）"""
+    number = extract_chapter_number(name)
+    return None if number == float('inf') else number
+
+
+def is_chapter_file(filename):
+    """判断是否为章节文件"""
+    # 检查是否包含"章"字且为txt文件
+    return '章' in filename and filename.endswith('.txt')
+
+
+def catalog_path_for(directory):
+    """返回目录对应的清单缓存路径"""
+    return os.path.normpath(os.path.abspath(directory)) + CATALOG_SUFFIX
+
+
+def parse_filename(name):
+    """
+    解析文件名中与目录无关的信息（只依赖文件名，可以跨扫描复用）
+
+    Returns:
+        dict: is_chapter、chapter_number（无章节号时为None）、title、rename_info
+    """
+    # toolname 也依赖本模块，放在函数内导入避免循环导入
+    from toolname import extract_chapter_info
+
+    stem = name[:-len('.txt')] if name.endswith('.txt') else name
+    _, title = split_index_prefix(stem)
+    _, name_part = split_index_prefix(name)
+    chapter_num, remaining_part = extract_chapter_info(name_part)
+    return {
+        'is_chapter': is_chapter_file(name),
+        'chapter_number': chapter_number_or_none(name),
+        'title': title,
+        # toolname.extract_chapter_info 的结果：[汉字章节号转换后的数字, 剩余部分]
+        'rename_info': None if chapter_num is None else [chapter_num, remaining_part],
+    }
+
+
+def load_catalog(directory):
+    """读取清单缓存，不存在、损坏或版本不符时返回None"""
+    try:
+        with open(catalog_path_for(directory), 'r', encoding='utf-8') as f:
+            catalog = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if catalog.get('version') != CATALOG_VERSION:
+        return None
+    return catalog
+
+
+def scan_directory(directory, verify=False):
+    """
+    返回目录中所有 .txt 文件的清单（按文件名排序）
+
+    Args:
+        directory (str): 章节目录
+        verify (bool): 为True时即使目录修改时间没变也重新遍历一次，
+                       用来发现只改了内容、没有增删文件的章节（合并时需要）
+
+    Returns:
+        list: 每个元素为 {'name', 'size', 'mtime_ns', 'is_chapter', 'chapter_number', 'title', 'rename_info'}
+    """
+    dir_mtime_ns = os.stat(directory).st_mtime_ns
+    catalog = load_catalog(directory)
+    if (not verify and catalog is not None
+            and catalog['dir_mtime_ns'] == dir_mtime_ns
+            and dir_mtime_ns + RACY_WINDOW_NS < catalog['scanned_at_ns']):
+        return catalog['files']
+
+    cached = {entry['name']: entry for entry in catalog['files']} if catalog else {}
+    scanned_at_ns = time.time_ns()
+    files = []
+    changed = catalog is None or catalog['dir_mtime_ns'] != dir_mtime_ns
+    with os.scandir(directory) as it:
+        for dir_entry in it:
+            name = dir_entry.name
+            if not name.endswith('.txt') or not dir_entry.is_file():
+                continue
+            st = dir_entry.stat()
+            old = cached.get(name)
+            if old is not None and old['size'] == st.st_size and old['mtime_ns'] == st.st_mtime_ns:
+                files.append(old)
+                continue
+            entry = dict(old) if old is not None else dict(parse_filename(name), name=name)
+            entry['size'] = st.st_size
+            entry['mtime_ns'] = st.st_mtime_ns
+            files.append(entry)
+            changed = True
+    files.sort(key=lambda entry: entry['name'])
+    changed = changed or len(files) != len(cached)
+
+    if changed or catalog['scanned_at_ns'] <= dir_mtime_ns + RACY_WINDOW_NS:
+        try:
+            write_text_atomic(catalog_path_for(directory), json.dumps({
+                'version': CATALOG_VERSION,
+                'directory': os.path.abspath(directory),
+                'dir_mtime_ns': dir_mtime_ns,
+                'scanned_at_ns': scanned_at_ns,
+                'files': files,
+            }, ensure_ascii=False))
+        except OSError:
+            # 缓存写不进去（只读目录等）不影响结果
+            pass
+    return files
+
+
+def list_chapter_entries(directory, verify=False):
+    """
+    返回目录中的章节文件清单，按章节号排序（没有章节号的排在最后）
+
+    Args:
+        directory (str): 章节目录
+        verify (bool): 见 scan_directory
+
+    Returns:
+        list: scan_directory 返回的条目中 is_chapter 为True的部分
+    """
+    entries = [entry for entry in scan_directory(directory, verify) if entry['is_chapter']]
+    # 与 extract_chapter_number 的排序一致：没有章节号视为无穷大；Python排序稳定，同号按文件名
+    entries.sort(key=lambda entry: float('inf') if entry['chapter_number'] is None else entry['chapter_number'])
+    return entries
+
+
+def list_indexed_chapters(directory, verify=False):
+    """
+    返回目录中的章节文件及其URL索引，供合并、导入章节库、打包归档使用
+
+    URL索引取自文件名的 NNNN_ 前缀；没有前缀的旧章节文件按章节号顺序排在已有索引之后。
+    同一URL索引有多个文件时（如旧的"未知章节"文件）保留有章节号的那个。
+
+    Args:
+        directory (str): 章节目录
+        verify (bool): 见 scan_directory
+
+    Returns:
+        list: [(URL索引（从0开始）, scan_directory 的条目)]，按URL索引排序
+    """
+    entries = list_chapter_entries(directory, verify)
+    indexes = [split_index_prefix(entry['name'])[0] for entry in entries]
+    next_index = max((index for index in indexes if index is not None), default=-1) + 1
+    indexed = []
+    seen = set()
+    for index, entry in zip(indexes, entries):
+        if index is None:
+            index = next_index
+            next_index += 1
+        elif index in seen:
+            print(f"警告：{entry['name']} 与其他章节文件的URL索引相同，已忽略")
+            continue
+        seen.add(index)
+        indexed.append((index, entry))
+    # 按URL索引排列：标题中没有章节号的章节（如"0006_未知章节.txt"）留在它下载时的位置，
+    # 新下载的章节总是排在已有章节之后，增量合并时已合并的部分保持不变
+    indexed.sort(key=lambda item: item[0])
+    return indexed
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite章节库
+把章节写入SQLite数据库，并建立FTS5全文索引用于在整部小说中搜索短语
+
+表结构：
+- chapters         每章一行：URL索引、URL、标题、章节号、正文、字符数、中文字符数、字节数
+- chapters_fts     FTS5全文索引（trigram分词，适合没有空格分词的中文），用于3个字符及以上的查询
+- chapters_bigram  FTS5汉字二元组索引：每章标题和正文中出现过的所有相邻两个汉字（空格分隔、去重），
+                   trigram用不上的两字查询（如"异火"、"斗气"）由它回答，只有单字查询需要全表扫描
+
+写入由 chapter_writer 的写线程完成，按批次在一个事务中提交，爬虫线程只负责把章节放进队列。
+
+用法：
+    python chapter_db.py novel_chapters.db search 异火
+    python chapter_db.py novel_chapters.db search 异火 --limit=200  # 最多列出200个章节（0表示全部列出）
+    python chapter_db.py novel_chapters.db list
+    python chapter_db.py novel_chapters.db cat 12
+    python chapter_db.py novel_chapters.db import novel_chapters.pack
+"""
+
+import os
+import re
+import sqlite3
+import sys
+
+from chapter_catalog import chapter_number_or_none
+from chapter_writer import BatchedChapterWriter
+
+DB_SUFFIX = '.db'
+
+# trigram分词器只能为3个字符及以上的查询使用索引
+MIN_INDEXED_QUERY_LENGTH = 3
+# 两个汉字的查询使用二元组索引
+BIGRAM_QUERY_PATTERN = re.compile(r'^[一-鿿]{2}$')
+CJK_RUN_PATTERN = re.compile(r'[一-鿿]{2,}')
+# 搜索时默认最多列出的章节数
+DEFAULT_SEARCH_LIMIT = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chapters (
+    idx INTEGER PRIMARY KEY,
+    url TEXT,
+    title TEXT NOT NULL,
+    chapter INTEGER,
+    content TEXT NOT NULL,
+    char_count INTEGER NOT NULL,
+    chinese_chars INTEGER NOT NULL,
+    byte_count INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS chapters_fts USING fts5(
+    title, content, content='chapters', content_rowid='idx', tokenize='trigram'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS chapters_bigram USING fts5(
+    bigrams, tokenize='unicode61', detail='none'
+);
+CREATE TRIGGER IF NOT EXISTS chapters_ai AFTER INSERT ON chapters BEGIN
+    INSERT INTO chapters_fts(rowid, title, content) VALUES (new.idx, new.title, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS chapters_ad AFTER DELETE ON chapters BEGIN
+    INSERT INTO chapters_fts(chapters_fts, rowid, title, content)
+    VALUES ('delete', old.idx, old.title, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS chapters_bigram_ad AFTER DELETE ON chapters BEGIN
+    DELETE FROM chapters_bigram WHERE rowid = old.idx;
+END;
+CREATE TRIGGER IF NOT EXISTS chapters_au AFTER UPDATE ON chapters BEGIN
+    INSERT INTO chapters_fts(chapters_fts, rowid, title, content)
+    VALUES ('delete', old.idx, old.title, old.content);
+    INSERT INTO chapters_fts(rowid, title, content) VALUES (new.idx, new.title, new.content);
+END;
+"""
+
+UPSERT_SQL = """
+INSERT INTO chapters (idx, url, title, chapter, content, char_count, chinese_chars, byte_count)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(idx) DO UPDATE SET
+    url = excluded.url,
+    title = excluded.title,
+    chapter = excluded.chapter,
+    content = excluded.content,
+    char_count = excluded.char_count,
+    chinese_chars = excluded.chinese_chars,
+    byte_count = excluded.byte_count
+"""
+
+CHINESE_CHAR_PATTERN = re.compile(r'[一-鿿]')
+
+
+def is_db_path(path):
+    """判断路径是否指向SQLite章节库"""
+    return str(path).endswith(DB_SUFFIX)
+
+
+def chapter_bigrams(title, content):
+    """
+    标题和正文中出现过的所有汉字二元组（去重，空格分隔），写入 chapters_bigram
+
+    unicode61分词器按空格切开，每个二元组就是一个词，查询"异火"只需查一个词。
+    """
+    bigrams = set()
+    for text in (title, content):
+        for run in CJK_RUN_PATTERN.findall(text):
+            bigrams.update(run[i:i + 2] for i in range(len(run) - 1))
+    return ' '.join(sorted(bigrams))
+
+
+def write_bigrams(conn, index, title, content):
+    """替换一章的二元组索引（调用者负责事务）"""
+    conn.execute("DELETE FROM chapters_bigram WHERE rowid = ?", (index,))
+    conn.execute("INSERT INTO chapters_bigram(rowid, bigrams) VALUES (?, ?)",
+                 (index, chapter_bigrams(title, content)))
+
+
+def connect(db_path):
+    """打开章节库并确保表结构存在"""
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    has_bigrams = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'chapters_bigram'").fetchone() is not None
+    conn.executescript(SCHEMA)
+    # 旧版本建的库没有章节号一列
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(chapters)")]
+    if 'chapter' not in columns:
+        conn.execute("ALTER TABLE chapters ADD COLUMN chapter INTEGER")
+    if not has_bigrams:
+        # 旧版本建的库没有二元组索引，为已有的章节补建
+        with conn:
+            for index, title, content in conn.execute("SELECT idx, title, content FROM chapters").fetchall():
+                write_bigrams(conn, index, title, content)
+    return conn
+
+
+def chapter_row(index, title, content, url=None):
+    """生成写入chapters表的一行数据"""
+    return (
+        index,
+        url,
+        title,
+        chapter_number_or_none(title),
+        content,
+        len(content),
+        len(CHINESE_CHAR_PATTERN.findall(content)),
+        len(content.encode('utf-8')),
+    )
+
+
+class ChapterDBSink:
+    """
+    章节库输出端，配合 chapter_writer.BatchedChapterWriter 使用
+
+    每批章节在一个事务中提交。连接在写线程第一次写入时创建（sqlite连接不能跨线程使用）。
+    fsync策略对应sqlite的synchronous设置：'none' -> OFF，'batch' -> FULL（每个事务同步一次），
+    'file' -> FULL且每个章节单独一个事务。
+
+    Args:
+        db_path (str): 数据库文件路径
+    """
+
+    SYNCHRONOUS = {'none': 'OFF', 'batch': 'FULL', 'file': 'FULL'}
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self._conn = None
+        # 先在调用线程里建表，数据库无法打开时立即报错
+        connect(self.db_path).close()
+
+    def write_batch(self, records, fsync_policy):
+        """写入一批 (URL索引, 标题, 正文, URL)，返回写入的正文字节数"""
+        if self._conn is None:
+            self._conn = connect(self.db_path)
+            self._conn.execute(f"PRAGMA synchronous={self.SYNCHRONOUS[fsync_policy]}")
+        rows = [chapter_row(index, title, content, url) for index, title, content, url in records]
+        if fsync_policy == 'file':
+            for row in rows:
+                with self._conn:
+                    self._conn.execute(UPSERT_SQL, row)
+                    write_bigrams(self._conn, row[0], row[2], row[4])
+        else:
+            with self._conn:
+                self._conn.executemany(UPSERT_SQL, rows)
+                for row in rows:
+                    write_bigrams(self._conn, row[0], row[2], row[4])
+        return sum(row[-1] for row in rows)
+
+    def close(self):
+        """关闭数据库连接（由写线程调用）"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class ChapterDB:
+    """
+    章节库读取与搜索
+
+    Args:
+        db_path (str): 数据库文件路径
+    """
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self.conn = connect(self.db_path)
+
+    def entries(self):
+        """按URL索引顺序返回 (索引, 标题, 中文字符数) 列表"""
+        return self.conn.execute(
+            "SELECT idx, title, chinese_chars FROM chapters ORDER BY idx"
+        ).fetchall()
+
+    def read(self, index):
+        """按URL索引读取章节正文，不存在时返回None"""
+        row = self.conn.execute("SELECT content FROM chapters WHERE idx = ?", (index,)).fetchone()
+        return row[0] if row else None
+
+    def iter_chapters(self):
+        """按URL索引顺序遍历 (索引, 标题, 正文)"""
+        yield from self.conn.execute("SELECT idx, title, content FROM chapters ORDER BY idx")
+
+    def _match(self, phrase):
+        """
+        生成查找包含短语的章节的 FROM/WHERE 子句
+
+        Returns:
+            tuple: (SQL片段, 参数)，章节表的别名为 c
+        """
+        if len(phrase) >= MIN_INDEXED_QUERY_LENGTH:
+            # 短语查询：整体加双引号，内部的双引号需要转义
+            fts_query = '"' + phrase.replace('"', '""') + '"'
+            return ("FROM chapters_fts f JOIN chapters c ON c.idx = f.rowid WHERE chapters_fts MATCH ?",
+                    (fts_query,))
+        if BIGRAM_QUERY_PATTERN.match(phrase):
+            # 两个汉字trigram索引用不上，查二元组索引（与trigram索引一样同时包括标题和正文）
+            return ("FROM chapters_bigram b JOIN chapters c ON c.idx = b.rowid WHERE chapters_bigram MATCH ?",
+                    ('"' + phrase + '"',))
+        # 单个字符或含有非汉字的两字短语，索引都用不上，退回到全表扫描
+        return "FROM chapters c WHERE instr(c.content, ?) > 0", (phrase,)
+
+    def count_matches(self, phrase):
+        """统计包含短语的章节总数（不受 search 的 limit 限制）"""
+        clause, params = self._match(phrase)
+        return self.conn.execute(f"SELECT count(*) {clause}", params).fetchone()[0]
+
+    def search(self, phrase, limit=DEFAULT_SEARCH_LIMIT, context=20):
+        """
+        搜索包含短语的章节
+
+        Args:
+            phrase (str): 要搜索的短语
+            limit (int): 最多返回的章节数，None表示不限制（总数见 count_matches）
+            context (int): 摘要中短语前后保留的字符数
+
+        Returns:
+            list: [(索引, 标题, 出现次数, 摘要), ...]，按URL索引排序
+        """
+        clause, params = self._match(phrase)
+        rows = self.conn.execute(
+            f"SELECT c.idx, c.title, c.content {clause} ORDER BY c.idx LIMIT ?",
+            params + (-1 if limit is None else limit,),
+        )
+
+        results = []
+        for index, title, content in rows:
+            position = content.find(phrase)
+            if position < 0:
+                # 只在标题中出现
+                snippet = ''
+            else:
+                start = max(0, position - context)
+                end = position + len(phrase) + context
+                snippet = content[start:end].replace('\n', ' ')
+            results.append((index, title, content.count(phrase), snippet))
+        return results
+
+    def close(self):
+        """关闭数据库连接"""
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def import_chapters(source, db_path):
+    """
+    将已有的章节归档或章节目录导入章节库
+
+    Args:
+        source (str): 章节归档（.pack）或章节目录
+        db_path (str): 数据库文件路径
+
+    Returns:
+        int: 导入的章节数
+    """
+    from chapter_archive import ArchiveReader, is_archive_path
+
+    count = 0
+    with BatchedChapterWriter(ChapterDBSink(db_path), fsync_policy='none', batch_size=500) as writer:
+        if is_archive_path(source):
+            with ArchiveReader(source) as reader:
+                for entry, content in reader.iter_chapters():
+                    writer.append(entry['index'], entry['title'], content, entry.get('url'))
+                    count += 1
+        else:
+            from chapter_catalog import list_indexed_chapters
+
+            # URL索引和标题取自文件名（"0001_1章 陨落的天才.txt" -> 索引0，标题"1章 陨落的天才"）
+            for index, entry in list_indexed_chapters(source):
+                with open(os.path.join(source, entry['name']), 'r', encoding='utf-8') as infile:
+                    writer.append(index, entry['title'], infile.read())
+                count += 1
+    return count
+
+
+def main():
+    """命令行入口"""
+    if len(sys.argv) < 3:
+        print(__doc__)
+        return
+
+    db_path, command = sys.argv[1], sys.argv[2]
+    args = [arg for arg in sys.argv[3:] if not arg.startswith('--')]
+    options = dict(arg[2:].partition('=')[::2] for arg in sys.argv[3:] if arg.startswith('--'))
+
+    if command == 'import' and args:
+        count = import_chapters(args[0], db_path)
+        print(f"已导入 {count} 个章节到 {db_path}")
+        return
+
+    if not os.path.exists(db_path):
+        print(f"错误：找不到章节库 {db_path}")
+        return
+
+    with ChapterDB(db_path) as db:
+        if command == 'search' and args:
+            phrase = ' '.join(args)
+            limit = options.get('limit', str(DEFAULT_SEARCH_LIMIT))
+            if not limit.isdigit():
+                print("错误：--limit 必须是整数")
+                return
+            limit = int(limit) or None
+            results = db.search(phrase, limit)
+            for index, title, hits, snippet in results:
+                print(f"{index + 1:5d}. {title} ({hits} 处)")
+                if snippet:
+                    print(f"       ...{snippet}...")
+            total = len(results) if limit is None or len(results) < limit else db.count_matches(phrase)
+            if total > len(results):
+                print(f"\n共 {total} 个章节包含「{phrase}」（仅显示前 {len(results)} 个，用 --limit=N 显示更多）")
+            else:
+                print(f"\n共 {total} 个章节包含「{phrase}」")
+        elif command == 'list':
+            entries = db.entries()
+            for index, title, chinese_chars in entries:
+                print(f"{index + 1:5d}. {title} ({chinese_chars:,} 字)")
+            print(f"\n共 {len(entries)} 个章节")
+        elif command == 'cat' and args:
+            # 命令行中的序号从1开始，与爬虫日志中的"索引N"一致
+            content = db.read(int(args[0]) - 1)
+            if content is None:
+                print(f"错误：章节库中没有索引为 {args[0]} 的章节")
+            else:
+                print(content)
+        else:
+            print(__doc__)
+
+
+if __name__ == "__main__":
+    main()
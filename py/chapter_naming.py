@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+章节文件命名与原子写入
+
+文件名由URL索引和规范化后的标题组成，例如：
+- 索引0，标题"第一章 陨落的天才" -> "0001_第一章 陨落的天才.txt"
+
+同一个URL索引永远得到同一个文件名，重复运行直接覆盖，不需要先检查文件是否存在；
+标题相同（包括多个"未知章节"）的不同URL也不会互相覆盖。
+"""
+
+import os
+import re
+import uuid
+
+# 文件名前缀：URL索引（从1开始，至少4位）加下划线
+INDEX_PREFIX_PATTERN = re.compile(r'^(\d{4,})_')
+
+UNSAFE_CHARS_PATTERN = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_title(title):
+    """
+    规范化章节标题，使其可以安全地用作文件名
+
+    Args:
+        title (str): 章节标题
+
+    Returns:
+        str: 替换不安全字符、合并空白后的标题
+    """
+    title = UNSAFE_CHARS_PATTERN.sub('_', title)
+    title = WHITESPACE_PATTERN.sub(' ', title).strip()
+    # 不能以点开头，否则会变成隐藏文件或与临时文件混淆
+    return title.lstrip('.') or '未知章节'
+
+
+def chapter_filename(index, title):
+    """
+    根据URL索引和标题生成章节文件名
+
+    Args:
+        index (int): URL索引（从0开始）
+        title (str): 章节标题
+
+    Returns:
+        str: 章节文件名
+    """
+    return f"{index + 1:04d}_{normalize_title(title)}.txt"
+
+
+def split_index_prefix(name):
+    """
+    拆分文件名中的URL索引前缀
+
+    Args:
+        name (str): 文件名（或去掉扩展名的文件名）
+
+    Returns:
+        tuple: (URL索引（从0开始）, 去掉前缀的部分)，没有前缀时返回 (None, name)
+    """
+    match = INDEX_PREFIX_PATTERN.match(name)
+    if not match:
+        return None, name
+    return int(match.group(1)) - 1, name[match.end():]
+
+
+def fsync_directory(directory):
+    """
+    同步目录项，使目录中的新建和重命名落盘
+
+    Windows不支持打开目录，直接跳过。
+
+    Args:
+        directory (str): 目录路径
+    """
+    try:
+        fd = os.open(directory or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_file(path):
+    """
+    把已经写完、关闭的文件同步到磁盘（批量写入后统一同步，见 chapter_writer.FileSink）
+
+    Args:
+        path (str): 文件路径
+    """
+    # Windows只能同步以写方式打开的文件
+    fd = os.open(path, os.O_RDWR if os.name == 'nt' else os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def open_temp_file(path):
+    """
+    在目标文件所在目录中创建一个临时文件，写完后用 os.replace 重命名为目标文件
+
+    Args:
+        path (str): 目标文件路径
+
+    Returns:
+        tuple: (以二进制写方式打开的文件描述符, 临时文件路径)
+    """
+    directory = os.path.dirname(path) or '.'
+    while True:
+        # 以0666创建，由内核按umask得到普通文件的权限（mkstemp固定为0600，读umask又要临时改掉进程的umask）
+        temp_path = os.path.join(directory, f".{uuid.uuid4().hex}.tmp")
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+        except FileExistsError:
+            continue
+        return fd, temp_path
+
+
+def write_bytes_atomic(path, data, fsync=False):
+    """
+    原子地写入文件：先写同目录下的临时文件，再重命名为目标文件
+
+    读者要么看到旧文件，要么看到完整的新文件，不会看到写了一半的内容。
+
+    Args:
+        path (str): 目标文件路径
+        data (bytes): 文件内容
+        fsync (bool): 重命名前是否把文件内容同步到磁盘（目录本身需要另外调用 fsync_directory）
+    """
+    fd, temp_path = open_temp_file(path)
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+            if fsync:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def write_text_atomic(path, text, encoding='utf-8'):
+    """
+    原子地写入文本文件，见 write_bytes_atomic
+
+    Args:
+        path (str): 目标文件路径
+        text (str): 文件内容
+        encoding (str): 文件编码
+    """
+    write_bytes_atomic(path, text.encode(encoding))
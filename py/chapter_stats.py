@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+章节字数统计库（列式存储）
+把每章的字数统计（章节号、中文字符数、行数、字节数、标题长度等）按列保存在一个紧凑的二进制文件中，
+每列是一个连续的整数数组，汇总查询时直接对整列求和、排序，不需要重新读取章节。
+
+用法：
+    python chapter_stats.py build novel_chapters.stats.jsonl     # 从爬虫统计清单生成（不读取章节）
+    python chapter_stats.py build novel_chapters                 # 统计目录中的章节文件生成（使用字数统计缓存）
+    python chapter_stats.py novel_chapters.colstats summary      # 总体统计和篇幅分类（短篇/中篇/长篇）
+    python chapter_stats.py novel_chapters.colstats dist 1000    # 章节长度分布（每1000字一档）
+    python chapter_stats.py novel_chapters.colstats top 20       # 最长的20章
+    python chapter_stats.py novel_chapters.colstats top 20 total_lines  # 按其他字段排序
+    python chapter_stats.py novel_chapters.colstats volumes 100  # 每100章为一卷汇总字数
+
+文件格式：第一行是文件标识，第二行是JSON文件头（章节数、字节序、每列的偏移和长度），
+之后依次是各列的原始数据（int64）和所有标题（UTF-8，换行分隔）。
+"""
+
+import heapq
+import json
+import os
+import sys
+from array import array
+
+from chapter_naming import split_index_prefix, write_bytes_atomic
+from word_counter import (LENGTH_CATEGORIES, STAT_FIELDS, STATS_MANIFEST_SUFFIX, StatsCache,
+                          collect_batch_files, count_batch, is_batch_source, length_category,
+                          load_stats_manifest)
+
+STATS_STORE_SUFFIX = '.colstats'
+STATS_STORE_MAGIC = b'CHAPTER-STATS 1\n'
+# 整数列（章节号为 -1 表示没有章节号）
+COLUMNS = ['chapter'] + STAT_FIELDS + ['title_length']
+NO_CHAPTER = -1
+
+
+def stats_store_path(source):
+    """返回统计来源（目录、统计清单）对应的列式统计库路径"""
+    source = os.path.normpath(os.path.abspath(source))
+    if source.endswith(STATS_MANIFEST_SUFFIX):
+        source = source[:-len(STATS_MANIFEST_SUFFIX)]
+    return source + STATS_STORE_SUFFIX
+
+
+def row_title(row):
+    """结果行中的章节标题（章节文件去掉序号前缀和扩展名）"""
+    name = row['name']
+    if name.endswith('.txt'):
+        name = name[:-len('.txt')]
+    return split_index_prefix(name)[1]
+
+
+class ChapterStats:
+    """
+    列式章节统计：columns 中每列是一个 array('q')，titles 是标题列表，第i章的数据在各列的第i个位置
+
+    Args:
+        columns (dict): 列名 -> array('q')
+        titles (list): 章节标题
+    """
+
+    def __init__(self, columns, titles):
+        self.columns = columns
+        self.titles = titles
+
+    def __len__(self):
+        return len(self.titles)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """由 word_counter.count_batch / load_stats_manifest 的结果行生成（保持行的顺序）"""
+        titles = [row_title(row) for row in rows]
+        columns = {name: array('q') for name in COLUMNS}
+        columns['chapter'].extend(NO_CHAPTER if row['chapter'] is None else row['chapter'] for row in rows)
+        for name in STAT_FIELDS:
+            columns[name].extend(row[name] for row in rows)
+        columns['title_length'].extend(map(len, titles))
+        return cls(columns, titles)
+
+    def save(self, path):
+        """原子地写出统计库"""
+        layout = []
+        offset = 0
+        blobs = [self.columns[name].tobytes() for name in COLUMNS]
+        blobs.append('\n'.join(self.titles).encode('utf-8'))
+        for name, blob in zip(COLUMNS + ['titles'], blobs):
+            layout.append({'name': name, 'offset': offset, 'length': len(blob)})
+            offset += len(blob)
+        header = json.dumps({'count': len(self), 'byteorder': sys.byteorder, 'columns': layout},
+                            ensure_ascii=False).encode('utf-8')
+        parts = [STATS_STORE_MAGIC, header, b'\n'] + blobs
+        write_bytes_atomic(str(path), b''.join(parts))
+
+    @classmethod
+    def load(cls, path):
+        """
+        读取统计库
+
+        Raises:
+            ValueError: 不是统计库文件或文件已损坏
+        """
+        with open(path, 'rb') as f:
+            if f.readline() != STATS_STORE_MAGIC:
+                raise ValueError(f"{path} 不是章节统计库文件")
+            header = json.loads(f.readline())
+            data = f.read()
+        blobs = {}
+        for column in header['columns']:
+            blob = data[column['offset']:column['offset'] + column['length']]
+            if len(blob) != column['length']:
+                raise ValueError(f"{path} 已损坏（数据不完整）")
+            blobs[column['name']] = blob
+        columns = {}
+        for name in COLUMNS:
+            values = array('q')
+            values.frombytes(blobs[name])
+            if header['byteorder'] != sys.byteorder:
+                values.byteswap()
+            columns[name] = values
+        titles = blobs['titles'].decode('utf-8').split('\n') if header['count'] else []
+        return cls(columns, titles)
+
+
+def build_stats_store(source, store_path=None):
+    """
+    从爬虫统计清单或章节目录（通配符）生成统计库
+
+    Returns:
+        tuple: (ChapterStats, 统计库路径)，来源中没有章节时返回 (None, None)
+    """
+    if source.endswith(STATS_MANIFEST_SUFFIX):
+        rows = load_stats_manifest(source)
+    else:
+        rows = count_batch(collect_batch_files(source), cache=StatsCache())
+    if not rows:
+        return None, None
+    store = ChapterStats.from_rows(rows)
+    store_path = store_path or (stats_store_path(source) if os.path.exists(source) else 'chapter_stats' + STATS_STORE_SUFFIX)
+    store.save(store_path)
+    return store, store_path
+
+
+def summarize(store):
+    """
+    总体统计
+
+    Returns:
+        dict: 各字段的总和，以及中文字符数的最小值、中位数、平均值、最大值和各篇幅分类的章节数
+    """
+    chinese = sorted(store.columns['chinese_chars'])
+    categories = [0] * len(LENGTH_CATEGORIES)
+    for value in chinese:
+        categories[length_category(value)] += 1
+    count = len(chinese)
+    return {
+        'count': count,
+        'totals': {name: sum(store.columns[name]) for name in STAT_FIELDS},
+        'min': chinese[0] if count else 0,
+        'median': chinese[count // 2] if count else 0,
+        'mean': sum(chinese) / count if count else 0,
+        'max': chinese[-1] if count else 0,
+        'categories': categories,
+    }
+
+
+def length_distribution(store, bucket=1000):
+    """
+    章节长度（中文字符数）分布
+
+    Returns:
+        list: 按区间排列的 (区间下限, 章节数)，只包含有章节的区间
+    """
+    counts = {}
+    for value in store.columns['chinese_chars']:
+        low = value // bucket * bucket
+        counts[low] = counts.get(low, 0) + 1
+    return sorted(counts.items())
+
+
+def top_chapters(store, count=20, field='chinese_chars'):
+    """
+    按某个字段取最大的若干章
+
+    Returns:
+        list: 章节在统计库中的位置，按字段值从大到小排列
+    """
+    column = store.columns[field]
+    return heapq.nlargest(count, range(len(store)), key=column.__getitem__)
+
+
+def volume_rollup(store, size=100):
+    """
+    按章节号每 size 章为一卷汇总（没有章节号的章节单独算作第0卷）
+
+    Returns:
+        list: 按卷号排列的 (卷号, 章节数, 中文字符数, 字节数)
+    """
+    volumes = {}
+    columns = store.columns
+    for chapter, chinese, file_size in zip(columns['chapter'], columns['chinese_chars'], columns['file_size']):
+        volume = 0 if chapter == NO_CHAPTER else (chapter - 1) // size + 1
+        totals = volumes.setdefault(volume, [0, 0, 0])
+        totals[0] += 1
+        totals[1] += chinese
+        totals[2] += file_size
+    return [(volume, *totals) for volume, totals in sorted(volumes.items())]
+
+
+def chapter_label(store, position):
+    """显示用的章节名"""
+    chapter = store.columns['chapter'][position]
+    prefix = f"{chapter:5d}" if chapter != NO_CHAPTER else "    -"
+    return f"{prefix}. {store.titles[position]}"
+
+
+def print_summary(store):
+    """打印总体统计"""
+    summary = summarize(store)
+    totals = summary['totals']
+    print(f"章节数:       {summary['count']:,}")
+    print(f"中文字符数:   {totals['chinese_chars']:,}")
+    print(f"总字符数:     {totals['total_chars']:,}")
+    print(f"总行数:       {totals['total_lines']:,}")
+    print(f"总字节数:     {totals['file_size']:,}")
+    print(f"每章中文字符: 最少 {summary['min']:,}，中位数 {summary['median']:,}，"
+          f"平均 {summary['mean']:,.0f}，最多 {summary['max']:,}")
+    print("篇幅分类:")
+    for (_, _, description), count in zip(LENGTH_CATEGORIES, summary['categories']):
+        print(f"  {description}: {count:,} 章")
+
+
+def print_distribution(store, bucket):
+    """打印章节长度分布"""
+    distribution = length_distribution(store, bucket)
+    widest = max((count for _, count in distribution), default=0)
+    for low, count in distribution:
+        bar = '█' * max(1, count * 40 // widest)
+        print(f"{low:7,}-{low + bucket - 1:<7,} {count:7,}  {bar}")
+
+
+def print_top(store, count, field):
+    """打印最大的若干章"""
+    for position in top_chapters(store, count, field):
+        print(f"{chapter_label(store, position)}  {store.columns[field][position]:,}")
+
+
+def print_volumes(store, size):
+    """打印每卷的汇总"""
+    for volume, chapters, chinese, file_size in volume_rollup(store, size):
+        if volume:
+            name = f"第{volume}卷 ({(volume - 1) * size + 1}-{volume * size}章)"
+        else:
+            name = "无章节号"
+        print(f"{name:<24} {chapters:5,} 章  {chinese:12,} 字  {file_size:14,} 字节")
+
+
+def main():
+    """命令行入口"""
+    if len(sys.argv) < 3:
+        print(__doc__)
+        return
+
+    if sys.argv[1] == 'build':
+        source = sys.argv[2]
+        if not (os.path.exists(source) or is_batch_source(source)):
+            print(f"错误：找不到 {source}")
+            return
+        store, store_path = build_stats_store(source, sys.argv[3] if len(sys.argv) > 3 else None)
+        if store is None:
+            print(f"错误：{source} 中没有章节")
+            return
+        print(f"已生成统计库 {store_path}，共 {len(store):,} 个章节")
+        return
+
+    store_path, command = sys.argv[1], sys.argv[2]
+    try:
+        store = ChapterStats.load(store_path)
+    except FileNotFoundError:
+        print(f"错误：找不到统计库 {store_path}，请先运行 build")
+        return
+    except ValueError as e:
+        print(f"错误：{e}")
+        return
+
+    extra = sys.argv[3:]
+    if extra and not extra[0].isdigit():
+        print(__doc__)
+        return
+    if command == 'summary':
+        print_summary(store)
+    elif command == 'dist':
+        print_distribution(store, int(extra[0]) if extra and int(extra[0]) > 0 else 1000)
+    elif command == 'top':
+        field = extra[1] if len(extra) > 1 else 'chinese_chars'
+        if field not in COLUMNS:
+            print(f"错误：未知字段 {field}（可选: {', '.join(COLUMNS)}）")
+            return
+        print_top(store, int(extra[0]) if extra else 20, field)
+    elif command == 'volumes':
+        print_volumes(store, int(extra[0]) if extra and int(extra[0]) > 0 else 100)
+    else:
+        print(__doc__)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+章节写入阶段
+爬虫线程只把章节放进队列就回去继续下载，由唯一的写线程把队列中的章节攒成批次交给输出端（sink）写入
+
+输出端需要实现：
+- write_batch(records, fsync_policy)  写入一批 (URL索引, 标题, 正文, URL)，返回写入的字节数
+- close()                             关闭（由写线程在退出前调用）
+- buffered_indexes()                  可选，返回已交给输出端但还缓存在内存中、没有写入文件的URL索引
+- stored_text(content)                可选，返回输出端实际写入的正文（如去掉首尾空白），默认原样写入
+
+爬虫线程可以随章节一起提交统计信息（append 的 stats 参数，按写入器 stored_text() 返回的正文统计），
+写线程在章节写入成功后交给统计清单（manifest，如 word_counter.StatsManifest）记录，输出端不需要关心；
+输出端缓存在内存中的章节（如压缩归档等待训练字典的章节）等到写入文件后再记录。
+
+fsync策略：
+- 'none'   不调用fsync，由操作系统决定何时落盘（最快，断电可能丢最近的章节）
+- 'batch'  每批写完同步一次
+- 'file'   每个章节写完都同步（最慢，最安全）
+
+有序模式（ordered=True）下写线程按URL索引顺序把章节交给输出端：先到的后面章节暂存在重排缓冲区中，
+前面的章节全部到齐（或用 skip() 标记为下载失败）后立即写出。缓冲区大小受 reorder_window 限制，
+超出窗口的章节在 append() 处等待，内存占用不会随乱序程度无限增长。
+"""
+
+import os
+import queue
+import threading
+import time
+
+from chapter_naming import chapter_filename, fsync_directory, fsync_file, split_index_prefix, write_bytes_atomic
+
+FSYNC_POLICIES = ('none', 'batch', 'file')
+
+
+class FileSink:
+    """
+    每章一个文本文件的输出端
+
+    文件名由URL索引和规范化后的标题决定（如"0001_1章 陨落的天才.txt"），
+    重复运行会原子地覆盖同一个文件；内容与已有文件完全相同时不再写入，
+    文件的修改时间保持不变，合并状态、字数统计缓存和短语索引都把它当作没有变化的章节。
+    标题变了（如上次解析失败保存成"0005_未知章节.txt"）时，写入新文件后删除同一URL索引的旧文件，
+    目录中每个URL索引始终只有一个章节文件。
+
+    Args:
+        save_directory (str): 保存文件的目录
+    """
+
+    def __init__(self, save_directory):
+        self.save_directory = save_directory
+        os.makedirs(save_directory, exist_ok=True)
+        # 启动时遍历一次目录：URL索引 -> 已有的文件名（只由写线程访问）
+        self._existing = {}
+        for name in os.listdir(save_directory):
+            index, _ = split_index_prefix(name)
+            if index is not None and name.endswith('.txt'):
+                self._existing.setdefault(index, set()).add(name)
+
+    def _remove_stale(self, index, filename):
+        """删除同一URL索引下文件名不同的旧章节文件"""
+        for name in self._existing.pop(index, ()):
+            if name != filename:
+                try:
+                    os.remove(os.path.join(self.save_directory, name))
+                except FileNotFoundError:
+                    pass
+        self._existing[index] = {filename}
+
+    def _unchanged(self, index, filename, data):
+        """已有的同名章节文件内容是否与 data 完全相同（先比较大小，大小相同再比较内容）"""
+        if filename not in self._existing.get(index, ()):
+            return False
+        path = os.path.join(self.save_directory, filename)
+        try:
+            if os.stat(path).st_size != len(data):
+                return False
+            with open(path, 'rb') as file:
+                return file.read() == data
+        except OSError:
+            return False
+
+    def write_batch(self, records, fsync_policy):
+        """
+        写入一批章节，返回写入的字节数（内容没有变化、跳过的章节不计）
+
+        'file' 策略下每个文件重命名前同步内容、重命名后同步目录；
+        'batch' 策略下先把整批文件写完，再逐个同步这些文件，最后只同步一次目录，
+        操作系统可以把整批数据合并写回磁盘。
+        """
+        written = 0
+        paths = []
+        for index, title, content, url in records:
+            data = content.encode('utf-8')
+            filename = chapter_filename(index, title)
+            if self._unchanged(index, filename, data):
+                self._remove_stale(index, filename)
+                continue
+            path = os.path.join(self.save_directory, filename)
+            write_bytes_atomic(path, data, fsync=(fsync_policy == 'file'))
+            self._remove_stale(index, filename)
+            paths.append(path)
+            written += len(data)
+            if fsync_policy == 'file':
+                fsync_directory(self.save_directory)
+        if fsync_policy == 'batch':
+            for path in paths:
+                fsync_file(path)
+            fsync_directory(self.save_directory)
+        return written
+
+    def close(self):
+        """文件都已关闭，无需处理"""
+
+
+class BatchedChapterWriter:
+    """
+    批量章节写入器：append() 把章节放进队列，写线程按批次写入输出端
+
+    Args:
+        sink: 输出端（FileSink、ArchiveWriter、ChapterDBSink、addfile.BookSink）
+        fsync_policy (str): fsync策略，'none' / 'batch' / 'file'
+        batch_size (int): 每批最多写入的章节数
+        max_queue (int): 队列容量，写入跟不上时爬虫线程会在append()处等待
+        ordered (bool): 是否按URL索引顺序交给输出端（合并成一本书时需要）
+        reorder_window (int): 有序模式下最多领先已写出章节多少个索引，超出时append()等待
+        manifest: 统计清单，需要实现 write_batch([(URL索引, 标题, 统计信息)]) 和 close()，None表示不记录
+    """
+
+    _STOP = object()
+
+    def __init__(self, sink, fsync_policy='batch', batch_size=64, max_queue=1024,
+                 ordered=False, reorder_window=256, manifest=None):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"未知的fsync策略: {fsync_policy}（可选: {', '.join(FSYNC_POLICIES)}）")
+        self.sink = sink
+        self.fsync_policy = fsync_policy
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_queue)
+
+        # 有序模式的重排缓冲区：URL索引 -> 章节记录（正文为None表示下载失败），只由写线程访问
+        self.ordered = ordered
+        self.reorder_window = reorder_window
+        self._pending = {}
+        self._next_index = 0
+        self._window_moved = threading.Condition()
+
+        # 随章节提交的统计信息：URL索引 -> 统计，章节写入成功后交给统计清单
+        self.manifest = manifest
+        self._chapter_stats = {}
+        self._buffered = []  # 已交给输出端、但还在输出端缓存中的章节记录
+
+        # 统计信息，只由写线程修改
+        self.written_count = 0
+        self.failed_count = 0
+        self.written_bytes = 0
+        self.batch_count = 0
+        self.busy_time = 0.0
+        self.max_queue_depth = 0
+        self._queue_depth_total = 0
+        self.max_reorder_depth = 0
+
+        self._thread = threading.Thread(target=self._run, name="ChapterWriter", daemon=True)
+        self._thread.start()
+
+    def append(self, index, title, content, url=None, stats=None):
+        """
+        提交一个章节（异步写入）
+
+        Args:
+            index (int): URL索引（从0开始）
+            title (str): 章节标题
+            content (str): 章节正文
+            url (str): 章节URL
+            stats (dict): 章节的字数统计，写入成功后记录到统计清单
+        """
+        if stats is not None and self.manifest is not None:
+            self._chapter_stats[index] = stats
+        if self.ordered:
+            # 比已写出的位置领先太多时等待，前面缺的章节都在其他线程中下载，不会一直等下去
+            with self._window_moved:
+                while index >= self._next_index + self.reorder_window:
+                    self._window_moved.wait()
+        self._queue.put((index, title, content, url))
+
+    def stored_text(self, content):
+        """返回输出端实际写入的正文，爬虫线程统计字数时使用（与之后统计输出内容的结果一致）"""
+        stored_text = getattr(self.sink, 'stored_text', None)
+        return stored_text(content) if stored_text is not None else content
+
+    def skip(self, index):
+        """
+        标记某个URL索引没有章节（下载失败），有序模式下后面的章节不再等它
+
+        Args:
+            index (int): URL索引（从0开始）
+        """
+        if self.ordered:
+            self._queue.put((index, None, None, None))
+
+    def _reorder(self, batch, flush=False):
+        """
+        把批次放进重排缓冲区，取出从下一个待写索引开始连续到齐的章节
+
+        Args:
+            batch (list): 新到的章节记录
+            flush (bool): 为True时不再等待缺失的章节，剩余章节按索引顺序全部取出
+
+        Returns:
+            list: 可以按顺序交给输出端的章节记录
+        """
+        for record in batch:
+            if record[0] < self._next_index:
+                # 这个位置已经写出（重复提交），不能再插回书中间
+                print(f"[写线程] 索引{record[0] + 1} 的章节到达时已被跳过，忽略")
+                continue
+            self._pending[record[0]] = record
+        self.max_reorder_depth = max(self.max_reorder_depth, len(self._pending))
+
+        ready = []
+        next_index = self._next_index
+        while next_index in self._pending:
+            record = self._pending.pop(next_index)
+            if record[2] is not None:
+                ready.append(record)
+            next_index += 1
+        if flush and self._pending:
+            missing = sorted(set(range(next_index, max(self._pending))) - set(self._pending))
+            print(f"[写线程] 有 {len(missing)} 个章节始终没有到达（如索引{missing[0] + 1}），跳过")
+            ready.extend(record for _, record in sorted(self._pending.items()) if record[2] is not None)
+            next_index = max(self._pending) + 1
+            self._pending.clear()
+
+        with self._window_moved:
+            self._next_index = next_index
+            self._window_moved.notify_all()
+        return ready
+
+    def _next_batch(self):
+        """取出一批章节：阻塞等待第一个，再把队列中已有的一起取走"""
+        batch = [self._queue.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        """写线程主循环，退出前关闭输出端"""
+        try:
+            self._write_loop()
+        finally:
+            try:
+                self.sink.close()
+                # 输出端关闭时写出了缓存中的章节
+                self._record_stats([], closing=True)
+            finally:
+                if self.manifest is not None:
+                    self.manifest.close()
+
+    def _write_loop(self):
+        """不断取出批次写入，直到收到停止标记"""
+        stopping = False
+        while not stopping:
+            # 取批次之前队列里积压的章节数，反映写入是否跟得上下载
+            depth = self._queue.qsize()
+            batch = self._next_batch()
+            if batch[-1] is self._STOP:
+                batch.pop()
+                stopping = True
+            if self.ordered:
+                batch = self._reorder(batch, flush=stopping)
+            if not batch:
+                continue
+
+            self.max_queue_depth = max(self.max_queue_depth, depth + 1)
+            self._queue_depth_total += depth + 1
+            start = time.perf_counter()
+            try:
+                self.written_bytes += self.sink.write_batch(batch, self.fsync_policy)
+                self.written_count += len(batch)
+            except Exception as e:
+                self.failed_count += len(batch)
+                print(f"[写线程] 写入 {len(batch)} 个章节时出错: {e}")
+            else:
+                self._record_stats(batch)
+            self.busy_time += time.perf_counter() - start
+            self.batch_count += 1
+
+    def _record_stats(self, batch, closing=False):
+        """
+        把写入成功的章节的统计信息交给统计清单
+
+        Args:
+            batch (list): 刚写入的章节记录
+            closing (bool): 输出端已关闭，之前缓存在输出端中的章节都已写入文件
+        """
+        if self.manifest is None:
+            return
+        batch = self._buffered + [record for record in batch if record[0] in self._chapter_stats]
+        self._buffered = []
+        buffered_indexes = getattr(self.sink, 'buffered_indexes', None)
+        if buffered_indexes is not None and not closing:
+            buffered = buffered_indexes()
+            # 只保留索引和标题，正文已经在输出端的缓存中
+            self._buffered = [(index, title, None, None) for index, title, _, _ in batch if index in buffered]
+            batch = [record for record in batch if record[0] not in buffered]
+        records = [(index, title, self._chapter_stats.pop(index))
+                   for index, title, content, url in batch if index in self._chapter_stats]
+        if records:
+            try:
+                self.manifest.write_batch(records)
+            except Exception as e:
+                print(f"[写线程] 写入统计清单时出错: {e}")
+
+    def close(self):
+        """等待队列中的章节全部写入后关闭输出端"""
+        self._queue.put(self._STOP)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def get_stats(self):
+        """返回写入统计信息"""
+        return {
+            'written_count': self.written_count,
+            'failed_count': self.failed_count,
+            'written_bytes': self.written_bytes,
+            'batch_count': self.batch_count,
+            'busy_time': self.busy_time,
+            'max_queue_depth': self.max_queue_depth,
+            'avg_queue_depth': self._queue_depth_total / self.batch_count if self.batch_count else 0,
+            'max_reorder_depth': self.max_reorder_depth,
+        }
+
+    def print_stats(self):
+        """打印写入吞吐量和队列深度"""
+        stats = self.get_stats()
+        busy_time = stats['busy_time'] or 1e-9
+        print(f"\n=== 写入统计 (fsync策略: {self.fsync_policy}) ===")
+        print(f"写入章节: {stats['written_count']} 个，失败 {stats['failed_count']} 个")
+        print(f"写入字节: {stats['written_bytes']:,} 字节，共 {stats['batch_count']} 批，"
+              f"平均每批 {stats['written_count'] / max(stats['batch_count'], 1):.1f} 个章节")
+        print(f"写线程耗时: {stats['busy_time']:.2f} 秒，"
+              f"吞吐量 {stats['written_bytes'] / busy_time / 1024 / 1024:.2f} MB/秒，"
+              f"{stats['written_count'] / busy_time:.1f} 章/秒")
+        print(f"队列深度: 最大 {stats['max_queue_depth']}，平均 {stats['avg_queue_depth']:.1f}")
+        if self.ordered:
+            print(f"重排缓冲区: 最多暂存 {stats['max_reorder_depth']} 个章节（窗口 {self.reorder_window}）")
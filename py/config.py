@@ -5,6 +5,21 @@ THREAD_CONFIG = {
     'timeout': 30,  # 请求超时时间（秒）
 }
 
+# 输出配置
+OUTPUT_CONFIG = {
+    'mode': 'files',  # 输出方式：'files' 每章一个txt文件，'archive' 打包为单个归档文件，'sqlite' 写入SQLite章节库，'book' 直接写出合并后的小说
+    'directory': 'novel_chapters',  # files模式的保存目录
+    'archive_path': 'novel_chapters.pack',  # archive模式的归档文件（索引文件为同名.idx）
+    'archive_compress': False,  # archive模式是否用训练出的zstd字典压缩每一章（需要安装zstandard）
+    'db_path': 'novel_chapters.db',  # sqlite模式的数据库文件（带FTS5全文索引）
+    'book_path': '《斗破苍穹》.txt',  # book模式的输出文件（格式与addfile.py合并的结果相同）
+    'reorder_window': 256,  # book模式下最多暂存多少个先到的后面章节，等待前面的章节到齐
+    'write_batch_size': 64,  # 写线程每批最多写入的章节数（sqlite模式下每批一个事务）
+    'fsync': 'batch',  # 落盘策略：'none' 不主动同步，'batch' 每批同步一次，'file' 每个章节同步一次
+    'phrase_index': False,  # files模式爬取结束后增量更新章节短语索引（phrase_index.py，只索引新增和改动的章节）
+    'stats_manifest': True,  # 爬取时统计每章字数，写入输出旁边的 .stats.jsonl（word_counter.py 可直接汇总）
+}
+
 urls = [
     "https://www.doupocangqiong.org/doupocangqiong/18096.html",  # 第一章 陨落的天才
     "https://www.doupocangqiong.org/doupocangqiong/18097.html",  # 第二章 斗气大陆
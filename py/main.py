@@ -9,7 +9,14 @@ from concurrent.futures import ThreadPoolExecutor, as_completed  # 用于多线
 import threading  # 用于线程锁
 
 # 导入配置文件
-from config import urls, THREAD_CONFIG  # 从config.py文件中导入urls列表和线程配置
+from config import urls, THREAD_CONFIG, OUTPUT_CONFIG  # 从config.py文件中导入urls列表、线程配置和输出配置
+from addfile import BookSink  # 用于book输出模式
+from chapter_archive import ArchiveWriter  # 用于archive输出模式
+from chapter_db import ChapterDBSink  # 用于sqlite输出模式
+from chapter_writer import BatchedChapterWriter, FileSink  # 单独的写线程，负责所有输出模式的写入
+from phrase_index import PhraseIndex  # 章节短语索引
+from toolname import normalize_chapter_title  # 把标题中的汉字章节号转换为阿拉伯数字
+from word_counter import StatsManifest, count_words_in_text, stats_manifest_path  # 爬取时统计每章字数
 
 # 全局变量用于统计
 success_count = 0
@@ -113,13 +120,54 @@ def extract_novel_content(html_content):
         print(f"解析HTML内容时出错: {str(e)}")
         return "解析失败", f"内容解析失败: {str(e)}"
 
-def download_and_extract_novel(url_info, save_directory):
+def create_chapter_writer():
     """
-    下载网页并提取小说内容，保存为文本文件（多线程版本）
+    根据输出配置创建章节写入器
+    
+    所有输出模式都由同一个写线程负责写入，爬虫线程提交章节后立即返回继续下载
+    
+    返回值：
+    BatchedChapterWriter对象
+    """
+    mode = OUTPUT_CONFIG['mode']
+    if mode == 'archive':
+        print(f"输出模式: 归档文件 {OUTPUT_CONFIG['archive_path']}")
+        sink = ArchiveWriter(OUTPUT_CONFIG['archive_path'], compress=OUTPUT_CONFIG['archive_compress'])
+        output_path = OUTPUT_CONFIG['archive_path']
+    elif mode == 'sqlite':
+        print(f"输出模式: SQLite章节库 {OUTPUT_CONFIG['db_path']}")
+        sink = ChapterDBSink(OUTPUT_CONFIG['db_path'])
+        output_path = OUTPUT_CONFIG['db_path']
+    elif mode == 'book':
+        print(f"输出模式: 直接合并为 {OUTPUT_CONFIG['book_path']}")
+        sink = BookSink(OUTPUT_CONFIG['book_path'])
+        output_path = OUTPUT_CONFIG['book_path']
+    else:
+        print(f"输出模式: 章节文件，保存目录 {OUTPUT_CONFIG['directory']}")
+        sink = FileSink(OUTPUT_CONFIG['directory'])
+        output_path = OUTPUT_CONFIG['directory']
+    
+    manifest = None
+    if OUTPUT_CONFIG['stats_manifest']:
+        manifest = StatsManifest(stats_manifest_path(output_path))
+        print(f"字数统计清单: {manifest.path}")
+    return BatchedChapterWriter(
+        sink,
+        fsync_policy=OUTPUT_CONFIG['fsync'],
+        batch_size=OUTPUT_CONFIG['write_batch_size'],
+        # book模式必须按URL索引顺序写入，乱序到达的章节在重排缓冲区中等待
+        ordered=(mode == 'book'),
+        reorder_window=OUTPUT_CONFIG['reorder_window'],
+        manifest=manifest,
+    )
+
+def download_and_extract_novel(url_info, writer):
+    """
+    下载网页并提取小说内容，交给章节写入器保存（多线程版本）
     
     参数说明：
     url_info: tuple (index, url) - URL索引和地址
-    save_directory: 保存文件的目录
+    writer: 章节写入器（BatchedChapterWriter），由写线程负责实际写入
     
     返回值：
     tuple: (bool, str, int) - (是否成功, 章节标题, URL索引)
@@ -153,24 +201,21 @@ def download_and_extract_novel(url_info, save_directory):
             # 提取小说内容
             title, content = extract_novel_content(response.text)
             
-            # 生成安全的文件名（移除不安全字符）
-            safe_filename = re.sub(r'[<>:"/\\|?*]', '_', title) + '.txt'
-            save_path = os.path.join(save_directory, safe_filename)
+            # 直接使用规范标题（"第两百四十三章 ..." -> "243章 ..."），保存后不需要再运行toolname.py重命名
+            # 章节号不单独传递：输出端和统计清单都从规范标题中解析（chapter_number_or_none），结果相同
+            title, _ = normalize_chapter_title(title)
             
-            # 如果文件已存在，添加序号避免覆盖
-            counter = 1
-            original_save_path = save_path
-            while os.path.exists(save_path):
-                name, ext = os.path.splitext(original_save_path)
-                save_path = f"{name}_{counter}{ext}"
-                counter += 1
+            # 正文已经在内存中，顺便统计字数（统计实际写入的正文，与之后用word_counter.py统计的结果相同）
+            stats = None
+            if writer.manifest is not None:
+                stored = writer.stored_text(content)
+                stats = count_words_in_text(stored, len(stored.encode('utf-8')))
             
-            # 将小说内容写入文件
-            with open(save_path, 'w', encoding='utf-8') as file:
-                file.write(content)
+            # 交给写线程保存，本线程立即返回继续下载
+            writer.append(index, title, content, url=url, stats=stats)
             
             with lock:
-                print(f"[线程{thread_id}] 成功保存章节: {title}")
+                print(f"[线程{thread_id}] 成功提取章节: {title}")
             
             return True, title, index
             
@@ -211,11 +256,8 @@ def main(max_workers=None):
     print(f"请求延时: {THREAD_CONFIG['request_delay']} 秒")
     print(f"请求超时: {THREAD_CONFIG['timeout']} 秒")
     
-    # 创建保存目录（如果不存在）
-    save_directory = "novel_chapters"
-    if not os.path.exists(save_directory):
-        os.makedirs(save_directory)
-        print(f"创建保存目录: {save_directory}")
+    # 创建章节写入器（启动写线程）
+    writer = create_chapter_writer()
     
     # 初始化统计变量
     success_count = 0
@@ -228,25 +270,35 @@ def main(max_workers=None):
     # 记录开始时间
     start_time = time.time()
     
-    # 使用线程池执行下载任务
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # 提交所有任务
-        future_to_url = {
-            executor.submit(download_and_extract_novel, url_info, save_directory): url_info 
-            for url_info in url_list
-        }
+    # 写线程是守护线程：无论爬取正常结束、出错还是被Ctrl-C中断，都要等它把队列中的章节写完，
+    # 否则解释器退出时队列中、归档缓存中的章节以及book模式的偏移索引都会丢失
+    try:
+        # 使用线程池执行下载任务
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # 提交所有任务
+            future_to_url = {
+                executor.submit(download_and_extract_novel, url_info, writer): url_info 
+                for url_info in url_list
+            }
         
-        # 处理完成的任务
-        for future in as_completed(future_to_url):
-            url_info = future_to_url[future]
-            try:
-                success, title, index = future.result()
-                if success:
+            # 处理完成的任务
+            for future in as_completed(future_to_url):
+                url_info = future_to_url[future]
+                try:
+                    success, title, index = future.result()
+                    if success:
+                        with lock:
+                            success_count += 1
+                    else:
+                        # 告诉写入器这个索引不会有章节，book模式下后面的章节不再等它
+                        writer.skip(index)
+                except Exception as exc:
+                    writer.skip(url_info[0])
                     with lock:
-                        success_count += 1
-            except Exception as exc:
-                with lock:
-                    print(f'URL索引 {url_info[0]+1} 生成异常: {exc}')
+                        print(f'URL索引 {url_info[0]+1} 生成异常: {exc}')
+    finally:
+        # 等待写线程把队列中剩余的章节写完
+        writer.close()
     
     # 计算耗时
     end_time = time.time()
@@ -257,7 +309,22 @@ def main(max_workers=None):
     print(f"成功处理: {success_count}/{total_count} 个章节")
     print(f"总耗时: {elapsed_time:.2f} 秒")
     print(f"平均每个章节: {elapsed_time/total_count:.2f} 秒")
-    print(f"文件保存在: {os.path.abspath(save_directory)} 目录中")
+    if OUTPUT_CONFIG['mode'] == 'archive':
+        print(f"章节已写入归档: {os.path.abspath(OUTPUT_CONFIG['archive_path'])}")
+    elif OUTPUT_CONFIG['mode'] == 'sqlite':
+        print(f"章节已写入章节库: {os.path.abspath(OUTPUT_CONFIG['db_path'])}")
+    elif OUTPUT_CONFIG['mode'] == 'book':
+        print(f"小说已合并到: {os.path.abspath(OUTPUT_CONFIG['book_path'])}")
+    else:
+        print(f"文件保存在: {os.path.abspath(OUTPUT_CONFIG['directory'])} 目录中")
+    
+    writer.print_stats()
+    
+    if OUTPUT_CONFIG['mode'] == 'files' and OUTPUT_CONFIG['phrase_index']:
+        # 新下载的章节刚刚写入，只为它们（以及改动过的章节）写一个新的索引分段
+        index = PhraseIndex(OUTPUT_CONFIG['directory'])
+        added, removed = index.update()
+        print(f"短语索引已更新: 新索引 {added} 个章节，共 {len(index.documents)} 个章节（{index.path}）")
 
 def set_thread_count(count):
     """
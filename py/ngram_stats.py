@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+汉字n元组频率统计
+统计整部小说中单字、二字、三字组合出现的次数，并找出常用搭配，用于 抄/方法.md 中的拆句分析（常用词、句式、修辞）。
+
+统计在进程池中分块进行（每个进程统计一部分章节，最后合并各进程的Counter），
+结果保存为紧凑的频率文件（默认在来源旁边的 .ngrams），之后的查询直接读取，不需要重新统计。
+n元组只在连续的汉字中统计，不跨越标点、空白和换行。
+
+用法：
+    python ngram_stats.py build novel_chapters               # 统计章节目录，生成 novel_chapters.ngrams
+    python ngram_stats.py build 《斗破苍穹》.txt              # 统计合并后的小说
+    python ngram_stats.py build novel_chapters --min-count=3  # 只保存至少出现3次的二字、三字组合
+    python ngram_stats.py novel_chapters.ngrams top 2 30      # 最常见的30个二字组合
+    python ngram_stats.py novel_chapters.ngrams freq 异火     # 查询某个组合（1-3个汉字）出现的次数
+    python ngram_stats.py novel_chapters.ngrams colloc 30     # 最紧密的30个二字搭配（按互信息排序）
+
+文件格式：第一行是文件标识，第二行是JSON文件头（总字数、每个n的条数和数据位置），
+之后是zlib压缩的数据：每个n一段按次数从高到低排列的n元组（定长，直接拼接）和一段对应的次数（uint32）。
+"""
+
+import heapq
+import json
+import math
+import os
+import re
+import sys
+import time
+import zlib
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from book_index import strip_book_headers
+from chapter_catalog import list_chapter_entries
+from chapter_naming import write_bytes_atomic
+from word_counter import read_text_file
+
+NGRAM_SUFFIX = '.ngrams'
+NGRAM_MAGIC = b'NGRAM-STATS 1\n'
+NGRAM_SIZES = (1, 2, 3)
+# 保存时只丢弃出现次数少于这个值的二字、三字组合（单字全部保存）
+DEFAULT_MIN_COUNT = 2
+# 合并小说按行切成大约这么大的块分给各个进程
+BOOK_CHUNK_CHARS = 1024 * 1024
+# 计算搭配时忽略出现次数太少的组合，避免罕见组合的互信息虚高
+COLLOCATION_MIN_COUNT = 20
+
+# 用前瞻取出所有重叠的n元组，整个扫描在正则引擎中完成
+NGRAM_PATTERNS = {
+    n: re.compile(f'(?=([\u4e00-\u9fff]{{{n}}}))') if n > 1 else re.compile('[\u4e00-\u9fff]')
+    for n in NGRAM_SIZES
+}
+
+
+def ngram_path_for(source):
+    """返回统计来源（章节目录或合并后的小说）对应的频率文件路径"""
+    source = os.path.normpath(os.path.abspath(source))
+    if source.endswith('.txt'):
+        source = source[:-len('.txt')]
+    return source + NGRAM_SUFFIX
+
+
+def count_ngrams_in_texts(texts):
+    """
+    统计一组文本中的n元组（在子进程中运行）
+
+    Returns:
+        dict: n -> Counter
+    """
+    counters = {n: Counter() for n in NGRAM_SIZES}
+    for text in texts:
+        for n, pattern in NGRAM_PATTERNS.items():
+            counters[n].update(pattern.findall(text))
+    return counters
+
+
+def count_ngrams_in_files(paths):
+    """统计一组章节文件中的n元组（在子进程中运行，编码由 word_counter.read_text_file 判断）"""
+    return count_ngrams_in_texts(content for content, _ in map(read_text_file, paths) if content is not None)
+
+
+def split_evenly(items, parts):
+    """把列表按顺序分成 parts 段（大小尽量相同）"""
+    size, extra = divmod(len(items), parts)
+    chunks = []
+    start = 0
+    for part in range(parts):
+        end = start + size + (part < extra)
+        if end > start:
+            chunks.append(items[start:end])
+        start = end
+    return chunks
+
+
+def split_book(path):
+    """
+    把合并后的小说按行切成大约 BOOK_CHUNK_CHARS 大小的块（n元组不跨行，切开不影响结果）
+
+    书名和章节标题块先去掉，只统计正文，结果与统计章节目录相同。
+    """
+    content, _ = read_text_file(path)
+    if content is None:
+        return []
+    content = strip_book_headers(content)
+    chunks = []
+    start = 0
+    while start < len(content):
+        end = content.find('\n', start + BOOK_CHUNK_CHARS)
+        end = len(content) if end < 0 else end + 1
+        chunks.append(content[start:end])
+        start = end
+    return chunks
+
+
+def count_ngrams(source, workers=None):
+    """
+    用进程池统计章节目录或合并后的小说中的n元组
+
+    每个进程统计一大段（章节文件列表或文本块），只返回一次结果，合并次数与进程数相同。
+
+    Returns:
+        dict: n -> Counter，来源中没有文本时返回None
+    """
+    workers = workers or os.cpu_count() or 1
+    if os.path.isdir(source):
+        paths = [os.path.join(source, entry['name']) for entry in list_chapter_entries(source)]
+        tasks, worker = split_evenly(paths, workers * 2), count_ngrams_in_files
+    else:
+        tasks, worker = split_evenly(split_book(source), workers * 2), count_ngrams_in_texts
+    if not tasks:
+        return None
+
+    totals = None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for counters in executor.map(worker, tasks):
+            if totals is None:
+                totals = counters
+                continue
+            for n in NGRAM_SIZES:
+                totals[n].update(counters[n])
+    return totals
+
+
+class NgramTable:
+    """
+    保存后的n元组频率：每个n一个按次数从高到低排列的n元组列表和对应的次数数组
+
+    Args:
+        grams (dict): n -> n元组列表
+        counts (dict): n -> array('I')
+        totals (dict): n -> 统计时的n元组总数（包括保存时丢弃的）
+    """
+
+    def __init__(self, grams, counts, totals):
+        self.grams = grams
+        self.counts = counts
+        self.totals = totals
+        self._lookup = {}
+
+    @classmethod
+    def from_counters(cls, counters, min_count=DEFAULT_MIN_COUNT):
+        grams, counts, totals = {}, {}, {}
+        for n, counter in counters.items():
+            totals[n] = sum(counter.values())
+            threshold = 1 if n == 1 else min_count
+            items = sorted((item for item in counter.items() if item[1] >= threshold),
+                           key=lambda item: item[1], reverse=True)
+            grams[n] = [gram for gram, _ in items]
+            counts[n] = array('I', (count for _, count in items))
+        return cls(grams, counts, totals)
+
+    def save(self, path):
+        """原子地写出频率文件"""
+        sections = []
+        blobs = []
+        offset = 0
+        for n in sorted(self.grams):
+            for kind, raw in (('grams', ''.join(self.grams[n]).encode('utf-8')),
+                              ('counts', self.counts[n].tobytes())):
+                blob = zlib.compress(raw, 6)
+                sections.append({'n': n, 'kind': kind, 'offset': offset, 'length': len(blob)})
+                blobs.append(blob)
+                offset += len(blob)
+        header = json.dumps({
+            'byteorder': sys.byteorder,
+            'totals': {str(n): total for n, total in self.totals.items()},
+            'sections': sections,
+        }).encode('utf-8')
+        write_bytes_atomic(str(path), b''.join([NGRAM_MAGIC, header, b'\n'] + blobs))
+
+    @classmethod
+    def load(cls, path):
+        """
+        读取频率文件
+
+        Raises:
+            ValueError: 不是频率文件或文件已损坏
+        """
+        with open(path, 'rb') as f:
+            if f.readline() != NGRAM_MAGIC:
+                raise ValueError(f"{path} 不是n元组频率文件")
+            header = json.loads(f.readline())
+            data = f.read()
+        grams, counts = {}, {}
+        try:
+            for section in header['sections']:
+                n = section['n']
+                raw = zlib.decompress(data[section['offset']:section['offset'] + section['length']])
+                if section['kind'] == 'grams':
+                    text = raw.decode('utf-8')
+                    grams[n] = [text[i:i + n] for i in range(0, len(text), n)]
+                else:
+                    values = array('I')
+                    values.frombytes(raw)
+                    if header['byteorder'] != sys.byteorder:
+                        values.byteswap()
+                    counts[n] = values
+        except zlib.error:
+            raise ValueError(f"{path} 已损坏（数据无法解压）")
+        totals = {int(n): total for n, total in header['totals'].items()}
+        return cls(grams, counts, totals)
+
+    def count(self, gram):
+        """查询一个n元组的次数（没有保存的返回0）"""
+        n = len(gram)
+        if n not in self.grams:
+            return 0
+        lookup = self._lookup.get(n)
+        if lookup is None:
+            lookup = self._lookup[n] = dict(zip(self.grams[n], self.counts[n]))
+        return lookup.get(gram, 0)
+
+    def top(self, n, limit=30):
+        """出现次数最多的n元组，返回 [(n元组, 次数)]"""
+        return list(zip(self.grams.get(n, [])[:limit], self.counts.get(n, [])[:limit]))
+
+    def collocations(self, limit=30, min_count=COLLOCATION_MIN_COUNT):
+        """
+        按点互信息（PMI）排序的二字搭配：两个字一起出现的次数比各自独立出现时预期的次数多得越多，搭配越紧密
+
+        Returns:
+            list: [(二字组合, 次数, PMI)]
+        """
+        unigram_total = self.totals.get(1) or 1
+        bigram_total = self.totals.get(2) or 1
+        candidates = []
+        for gram, count in zip(self.grams.get(2, []), self.counts.get(2, [])):
+            if count < min_count:
+                # 按次数从高到低排列，后面的都更少
+                break
+            first, second = self.count(gram[0]), self.count(gram[1])
+            pmi = math.log2((count / bigram_total) / ((first / unigram_total) * (second / unigram_total)))
+            candidates.append((pmi, count, gram))
+        return [(gram, count, pmi) for pmi, count, gram in heapq.nlargest(limit, candidates)]
+
+
+def build_ngram_table(source, output_path=None, min_count=DEFAULT_MIN_COUNT, workers=None):
+    """
+    统计并保存n元组频率
+
+    Returns:
+        tuple: (NgramTable, 保存路径)，来源中没有文本时返回 (None, None)
+    """
+    counters = count_ngrams(source, workers)
+    if counters is None:
+        return None, None
+    table = NgramTable.from_counters(counters, min_count)
+    output_path = output_path or ngram_path_for(source)
+    table.save(output_path)
+    return table, output_path
+
+
+def main():
+    """命令行入口"""
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    options = dict(arg[2:].partition('=')[::2] for arg in sys.argv[1:] if arg.startswith('--'))
+    if len(args) < 2:
+        print(__doc__)
+        return
+
+    if args[0] == 'build':
+        source = args[1]
+        if not os.path.exists(source):
+            print(f"错误：找不到 {source}")
+            return
+        min_count = options.get('min-count', str(DEFAULT_MIN_COUNT))
+        workers = options.get('workers', '0')
+        if not min_count.isdigit() or not workers.isdigit():
+            print("错误：--min-count 和 --workers 必须是整数")
+            return
+        start_time = time.time()
+        table, output_path = build_ngram_table(source, args[2] if len(args) > 2 else None,
+                                               int(min_count), int(workers) or None)
+        if table is None:
+            print(f"错误：{source} 中没有可统计的文本")
+            return
+        print(f"统计完成，耗时 {time.time() - start_time:.2f} 秒，共 {table.totals[1]:,} 个汉字")
+        for n in NGRAM_SIZES:
+            print(f"  {n}字组合: {len(table.grams[n]):,} 种（保存出现至少 {1 if n == 1 else int(min_count)} 次的）")
+        print(f"结果已保存到: {output_path}")
+        return
+
+    table_path, command = args[0], args[1]
+    try:
+        table = NgramTable.load(table_path)
+    except FileNotFoundError:
+        print(f"错误：找不到频率文件 {table_path}，请先运行 build")
+        return
+    except ValueError as e:
+        print(f"错误：{e}")
+        return
+
+    if command == 'top' and len(args) > 2 and args[2].isdigit():
+        n = int(args[2])
+        limit = int(args[3]) if len(args) > 3 and args[3].isdigit() else 30
+        for rank, (gram, count) in enumerate(table.top(n, limit), 1):
+            print(f"{rank:4d}. {gram}  {count:,}")
+    elif command == 'freq' and len(args) > 2:
+        for gram in args[2:]:
+            if not 1 <= len(gram) <= max(NGRAM_SIZES):
+                print(f"{gram}: 只能查询1-{max(NGRAM_SIZES)}个汉字的组合")
+                continue
+            count = table.count(gram)
+            total = table.totals.get(len(gram)) or 1
+            print(f"{gram}: {count:,} 次（每万{len(gram)}字组合 {count * 10000 / total:.2f} 次）")
+    elif command == 'colloc':
+        limit = int(args[2]) if len(args) > 2 and args[2].isdigit() else 30
+        for rank, (gram, count, pmi) in enumerate(table.collocations(limit), 1):
+            print(f"{rank:4d}. {gram}  {count:,} 次  PMI {pmi:.2f}")
+    else:
+        print(__doc__)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+章节短语索引（汉字二元组倒排索引）
+把每个章节中连续的汉字按相邻两个字（二元组）切开，记录每个二元组出现在哪些章节的哪些位置。
+查询 "异火" 时只需读出这个二元组的位置列表，不需要再扫描全部章节；
+更长的短语把各个二元组的位置对齐求交集，含有标点、字母的短语先用索引找出候选章节再核对原文。
+没有两个连续汉字的短语（如单个汉字）无法使用索引，只能逐章查找。
+
+索引保存在章节目录旁边的 novel_chapters.bigram-index/ 中：
+- manifest.json   已索引的章节（文件名、大小、修改时间、所在分段）
+- seg-*.bin       分段文件，每次增量构建只为新增或改动过的章节写一个新分段
+分段数超过 MAX_SEGMENTS 时把所有章节重新合并为一个分段；改动或删除的章节只从清单中去掉，查询时忽略旧分段中的记录。
+
+用法：
+    python phrase_index.py build novel_chapters        # 构建或增量更新索引（只处理新增和改动的章节）
+    python phrase_index.py build novel_chapters --full # 重新构建整个索引
+    python phrase_index.py search novel_chapters 异火  # 查找短语，输出所在章节和上下文
+    python phrase_index.py search novel_chapters 萧炎 --context=20 --limit=5
+
+config.py 中 OUTPUT_CONFIG['phrase_index'] 为True时，爬虫（files模式）结束后自动增量更新索引。
+
+分段文件格式：第一行是文件标识，第二行是JSON文件头（章节编号、二元组数、各部分长度），之后依次是
+排好序的全部二元组（UTF-8，每个2个汉字）、每个二元组位置列表的偏移量（uint64），以及所有位置列表。
+位置列表由 (章节编号差, 位置) 组成，同一章节内的位置记录与上一个位置的差，都用变长整数编码。
+"""
+
+import json
+import os
+import re
+import sys
+import time
+from array import array
+
+from chapter_catalog import RACY_WINDOW_NS, scan_directory
+from chapter_naming import write_bytes_atomic, write_text_atomic
+from word_counter import read_text_file
+
+PHRASE_INDEX_SUFFIX = '.bigram-index'
+PHRASE_INDEX_VERSION = 1
+SEGMENT_MAGIC = b'BIGRAM-SEGMENT 1\n'
+MAX_SEGMENTS = 8
+DEFAULT_CONTEXT = 15
+DEFAULT_LIMIT = 3  # 每章最多显示几处上下文
+
+CJK_RUN_PATTERN = re.compile('[\u4e00-\u9fff]{2,}')
+
+
+def phrase_index_path(directory):
+    """返回章节目录对应的索引目录"""
+    return os.path.normpath(os.path.abspath(directory)) + PHRASE_INDEX_SUFFIX
+
+
+def encode_varint(value, out):
+    """把非负整数按变长整数编码追加到 bytearray（每字节7位，最高位表示后面还有字节）"""
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varints(data):
+    """解码一段变长整数"""
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    return values
+
+
+def decode_postings(data):
+    """
+    解码一个二元组的位置列表
+
+    Returns:
+        list: [(章节编号, 位置)]，按章节编号、位置排列
+    """
+    postings = []
+    values = decode_varints(data)
+    doc = position = 0
+    for i in range(0, len(values), 2):
+        doc_delta, value = values[i], values[i + 1]
+        if doc_delta:
+            doc += doc_delta
+            position = value
+        else:
+            position += value
+        postings.append((doc, position))
+    return postings
+
+
+def build_segment(path, documents):
+    """
+    为一组章节写一个分段文件
+
+    Args:
+        path (str): 分段文件路径
+        documents (list): 按章节编号递增排列的 (章节编号, 正文)
+    """
+    # 二元组 -> [上一个章节编号, 上一个位置, 编码后的位置列表]
+    lists = {}
+    for doc, text in documents:
+        for run in CJK_RUN_PATTERN.finditer(text):
+            chars = run.group()
+            base = run.start()
+            for i in range(len(chars) - 1):
+                bigram = chars[i:i + 2]
+                state = lists.get(bigram)
+                if state is None:
+                    state = lists[bigram] = [0, 0, bytearray()]
+                position = base + i
+                if state[0] == doc and state[2]:
+                    encode_varint(0, state[2])
+                    encode_varint(position - state[1], state[2])
+                else:
+                    encode_varint(doc - state[0], state[2])
+                    encode_varint(position, state[2])
+                    state[0] = doc
+                state[1] = position
+
+    bigrams = sorted(lists)
+    offsets = array('Q', [0])
+    postings = bytearray()
+    for bigram in bigrams:
+        postings += lists[bigram][2]
+        offsets.append(len(postings))
+    dictionary = ''.join(bigrams).encode('utf-8')
+    header = json.dumps({
+        'docs': [doc for doc, _ in documents],
+        'count': len(bigrams),
+        'byteorder': sys.byteorder,
+        'dictionary_length': len(dictionary),
+        'offsets_length': len(offsets) * offsets.itemsize,
+        'postings_length': len(postings),
+    }).encode('utf-8')
+    write_bytes_atomic(path, b''.join([SEGMENT_MAGIC, header, b'\n', dictionary, offsets.tobytes(), bytes(postings)]))
+
+
+class Segment:
+    """
+    只读的分段文件：二元组字典和偏移量读入内存，位置列表按需从文件中读取
+
+    Args:
+        path (str): 分段文件路径
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.readline() != SEGMENT_MAGIC:
+                raise ValueError(f"{path} 不是索引分段文件")
+            header = json.loads(f.readline())
+            self.bigrams = f.read(header['dictionary_length']).decode('utf-8')
+            self.offsets = array('Q')
+            self.offsets.frombytes(f.read(header['offsets_length']))
+            if header['byteorder'] != sys.byteorder:
+                self.offsets.byteswap()
+            self.postings_start = f.tell()
+        self.count = header['count']
+        if len(self.bigrams) != 2 * self.count or len(self.offsets) != self.count + 1:
+            raise ValueError(f"{path} 已损坏（数据不完整）")
+
+    def _bisect(self, key):
+        """在排好序的定长二元组字典中二分查找第一个不小于 key 的位置"""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.bigrams[2 * middle:2 * middle + len(key)] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def postings(self, bigram):
+        """一个二元组的位置列表 [(章节编号, 位置)]"""
+        position = self._bisect(bigram)
+        if position >= self.count or self.bigrams[2 * position:2 * position + 2] != bigram:
+            return []
+        start, end = self.offsets[position], self.offsets[position + 1]
+        with open(self.path, 'rb') as f:
+            f.seek(self.postings_start + start)
+            return decode_postings(f.read(end - start))
+
+
+class PhraseIndex:
+    """
+    章节目录的短语索引
+
+    Args:
+        directory (str): 章节目录
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = phrase_index_path(directory)
+        self.documents = {}  # 文件名 -> {'id', 'size', 'mtime_ns', 'indexed_at_ns', 'segment', 'chapter'}
+        self.segments = []
+        self.next_id = 1
+        self._segment_cache = {}
+        self._load_manifest()
+
+    def _load_manifest(self):
+        try:
+            with open(os.path.join(self.path, 'manifest.json'), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+        if manifest.get('version') != PHRASE_INDEX_VERSION:
+            return
+        self.documents = manifest['documents']
+        self.segments = manifest['segments']
+        self.next_id = manifest['next_id']
+
+    def _save_manifest(self):
+        write_text_atomic(os.path.join(self.path, 'manifest.json'), json.dumps({
+            'version': PHRASE_INDEX_VERSION,
+            'directory': os.path.abspath(self.directory),
+            'next_id': self.next_id,
+            'segments': self.segments,
+            'documents': self.documents,
+        }, ensure_ascii=False))
+
+    def _is_current(self, entry):
+        """已索引的章节是否与目录中的文件一致"""
+        document = self.documents.get(entry['name'])
+        return (document is not None
+                and document['size'] == entry['size'] and document['mtime_ns'] == entry['mtime_ns']
+                and entry['mtime_ns'] + RACY_WINDOW_NS < document['indexed_at_ns'])
+
+    def update(self, full=False):
+        """
+        增量更新索引：只为新增和改动过的章节写一个新分段
+
+        Args:
+            full (bool): 为True时丢弃现有分段，重新索引所有章节
+
+        Returns:
+            tuple: (新索引的章节数, 去掉的章节数)
+        """
+        os.makedirs(self.path, exist_ok=True)
+        entries = {entry['name']: entry for entry in scan_directory(self.directory, verify=True)
+                   if entry['is_chapter']}
+        removed = [name for name in self.documents if name not in entries]
+        for name in removed:
+            del self.documents[name]
+        changed = [entry for name, entry in sorted(entries.items()) if full or not self._is_current(entry)]
+        # 分段太多时合并为一个：所有章节都重新索引
+        if full or len(self.segments) >= MAX_SEGMENTS:
+            changed = [entry for _, entry in sorted(entries.items())]
+            old_segments, self.segments = self.segments, []
+        else:
+            old_segments = []
+        if not changed and not removed and not old_segments:
+            return 0, 0
+
+        documents = []
+        segment_name = f"seg-{self.next_id:08d}.bin"
+        for entry in changed:
+            indexed_at_ns = time.time_ns()
+            content, _ = read_text_file(os.path.join(self.directory, entry['name']))
+            if content is None:
+                self.documents.pop(entry['name'], None)
+                continue
+            doc_id = self.next_id
+            self.next_id += 1
+            documents.append((doc_id, content))
+            self.documents[entry['name']] = {
+                'id': doc_id,
+                'size': entry['size'],
+                'mtime_ns': entry['mtime_ns'],
+                'indexed_at_ns': indexed_at_ns,
+                'segment': segment_name,
+                'chapter': entry['chapter_number'],
+            }
+        if documents:
+            build_segment(os.path.join(self.path, segment_name), documents)
+            self.segments.append(segment_name)
+
+        # 去掉不再有任何有效章节的分段
+        live_segments = {document['segment'] for document in self.documents.values()}
+        dropped = [name for name in self.segments if name not in live_segments] + old_segments
+        self.segments = [name for name in self.segments if name in live_segments]
+        self._save_manifest()
+        for name in dropped:
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+        return len(documents), len(removed)
+
+    def _segment(self, name):
+        segment = self._segment_cache.get(name)
+        if segment is None:
+            segment = self._segment_cache[name] = Segment(os.path.join(self.path, name))
+        return segment
+
+    def _live_postings(self, bigram):
+        """在所有分段中查找二元组，只保留清单中仍然有效的章节，返回 {(章节编号, 位置)}"""
+        live_ids = {document['id'] for document in self.documents.values()}
+        postings = set()
+        for name in self.segments:
+            postings.update(posting for posting in self._segment(name).postings(bigram) if posting[0] in live_ids)
+        return postings
+
+    def _phrase_positions(self, phrase):
+        """纯汉字短语（至少两个字）：对齐各个二元组的位置求交集，返回 {章节编号: [位置]}"""
+        result = None
+        for offset in range(len(phrase) - 1):
+            shifted = {(doc, position - offset) for doc, position in self._live_postings(phrase[offset:offset + 2])}
+            result = shifted if result is None else result & shifted
+            if not result:
+                return {}
+        matches = {}
+        for doc, position in sorted(result):
+            matches.setdefault(doc, []).append(position)
+        return matches
+
+    def search(self, phrase):
+        """
+        查找短语
+
+        Returns:
+            list: 按章节号排列的 (文件名, 章节号, [出现位置])
+        """
+        by_id = {document['id']: (name, document['chapter']) for name, document in self.documents.items()}
+        if not phrase:
+            return []
+        if CJK_RUN_PATTERN.fullmatch(phrase):
+            matches = self._phrase_positions(phrase)
+        else:
+            # 含有非汉字：先用其中的汉字串缩小到候选章节，再在原文中核对；没有汉字串时只能逐章查找
+            candidates = set(by_id)
+            for run in CJK_RUN_PATTERN.findall(phrase):
+                candidates &= set(self._phrase_positions(run))
+            matches = {}
+            for doc in candidates:
+                content, _ = read_text_file(os.path.join(self.directory, by_id[doc][0]))
+                positions = find_all(content or '', phrase)
+                if positions:
+                    matches[doc] = positions
+
+        results = [(*by_id[doc], positions) for doc, positions in matches.items()]
+        results.sort(key=lambda item: (item[1] is None, item[1] or 0, item[0]))
+        return results
+
+
+def find_all(text, phrase):
+    """返回短语在文本中所有出现的位置"""
+    positions = []
+    position = text.find(phrase)
+    while position >= 0:
+        positions.append(position)
+        position = text.find(phrase, position + 1)
+    return positions
+
+
+def kwic(text, position, length, context=DEFAULT_CONTEXT):
+    """关键词上下文：短语前后各 context 个字，换行替换为空格"""
+    left = text[max(0, position - context):position]
+    right = text[position + length:position + length + context]
+    return (f"{left}【{text[position:position + length]}】{right}").replace('\n', ' ')
+
+
+def print_search_results(index, phrase, context=DEFAULT_CONTEXT, limit=DEFAULT_LIMIT):
+    """打印查找结果和上下文（只读取有匹配的章节）"""
+    start_time = time.time()
+    results = index.search(phrase)
+    elapsed = time.time() - start_time
+    total = sum(len(positions) for _, _, positions in results)
+    for name, chapter, positions in results:
+        content, _ = read_text_file(os.path.join(index.directory, name))
+        print(f"\n{name}（{len(positions)} 处）")
+        for position in positions[:limit]:
+            print(f"    {kwic(content or '', position, len(phrase), context)}")
+        if len(positions) > limit:
+            print(f"    ……还有 {len(positions) - limit} 处")
+    print(f"\n\"{phrase}\" 共出现 {total:,} 次，分布在 {len(results):,} 个章节中（查找耗时 {elapsed:.3f} 秒）")
+
+
+def main():
+    """命令行入口"""
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    options = dict(arg[2:].partition('=')[::2] for arg in sys.argv[1:] if arg.startswith('--'))
+    if len(args) < 2 or args[0] not in ('build', 'search') or (args[0] == 'search' and len(args) < 3):
+        print(__doc__)
+        return
+
+    directory = args[1]
+    if not os.path.isdir(directory):
+        print(f"错误：找不到章节目录 {directory}")
+        return
+    index = PhraseIndex(directory)
+
+    if args[0] == 'build':
+        start_time = time.time()
+        added, removed = index.update(full='full' in options)
+        print(f"索引已更新：新索引 {added} 个章节，去掉 {removed} 个章节，"
+              f"共 {len(index.documents)} 个章节、{len(index.segments)} 个分段，耗时 {time.time() - start_time:.2f} 秒")
+        print(f"索引目录: {index.path}")
+        return
+
+    if not index.segments:
+        print(f"错误：{directory} 还没有索引，请先运行 build")
+        return
+    context = options.get('context', str(DEFAULT_CONTEXT))
+    limit = options.get('limit', str(DEFAULT_LIMIT))
+    if not context.isdigit() or not limit.isdigit():
+        print("错误：--context 和 --limit 必须是整数")
+        return
+    print_search_results(index, args[2], int(context), int(limit))
+
+
+if __name__ == "__main__":
+    main()
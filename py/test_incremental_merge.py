@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+爬取 -> 合并流程的增量测试：重新爬取内容没有变化的章节后，合并只追加新章节
+
+运行：
+    python -m unittest test_incremental_merge   # 在 py 目录中运行
+"""
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from addfile import merge_novel_chapters
+from chapter_writer import BatchedChapterWriter, FileSink
+
+
+def crawl(directory, chapters):
+    """模拟一次爬取：把 (URL索引, 标题, 正文) 交给 files 模式的写入器"""
+    with BatchedChapterWriter(FileSink(directory)) as writer:
+        for index, title, content in chapters:
+            writer.append(index, title, content)
+
+
+def merge(directory, book_path):
+    """合并并返回打印的内容"""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        merge_novel_chapters(directory, book_path, prefetch_workers=0)
+    return output.getvalue()
+
+
+class IncrementalMergeTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self._tmp.name, 'novel_chapters')
+        self.book_path = os.path.join(self._tmp.name, 'book.txt')
+        # 第6章解析失败，标题中没有章节号
+        self.chapters = [(i, f"第{i + 1}章 标题{i + 1}" if i != 5 else "未知章节", f"第{i + 1}章的正文\n")
+                         for i in range(8)]
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_recrawl_unchanged_chapters_keeps_files(self):
+        crawl(self.directory, self.chapters)
+        before = {name: os.stat(os.path.join(self.directory, name)).st_mtime_ns
+                  for name in os.listdir(self.directory)}
+        crawl(self.directory, self.chapters)
+        after = {name: os.stat(os.path.join(self.directory, name)).st_mtime_ns
+                 for name in os.listdir(self.directory)}
+        self.assertEqual(before, after)
+
+    def test_recrawl_then_merge_is_incremental(self):
+        crawl(self.directory, self.chapters)
+        merge(self.directory, self.book_path)
+
+        # 第二次爬取：已有的章节原样再下载一遍，再加两个新章节
+        new_chapters = [(8, "第9章 标题9", "第9章的正文\n"), (9, "第10章 标题10", "第10章的正文\n")]
+        crawl(self.directory, self.chapters + new_chapters)
+        output = merge(self.directory, self.book_path)
+        self.assertIn("增量合并：保留已合并的 8 个章节，追加 2 个新章节", output)
+        self.assertNotIn("完整重写", output)
+
+        with open(self.book_path, 'r', encoding='utf-8') as book:
+            text = book.read()
+        self.assertLess(text.index("未知章节"), text.index("第9章 标题9"))
+        self.assertLess(text.index("第9章 标题9"), text.index("第10章 标题10"))
+
+        # 第三次爬取没有任何变化
+        crawl(self.directory, self.chapters + new_chapters)
+        self.assertIn("没有新章节", merge(self.directory, self.book_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
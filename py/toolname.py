@@ -7,95 +7,158 @@
 例如：
 - "地两百四十三章 击杀大斗师！" -> "243章 击杀大斗师！"
 - "第八百二十八章  分尸【第二更！】" -> "828章  分尸【第二更！】"
+- "0243_第两百四十三章 击杀大斗师！" -> "0243_243章 击杀大斗师！"（保留爬虫写入的URL索引前缀）
+
+新版爬虫在保存前已经用 normalize_chapter_title 转换了标题，本工具只用于处理旧的章节目录。
+
+重命名先扫描一次目录生成完整计划（冲突和互相占用的文件名在执行前就找出来），
+执行时把计划写入目录旁边的 novel_chapters.rename-journal，中途中断后再次运行可以继续或回滚。
 """
 
+import functools
+import itertools
+import json
 import os
 import re
+import sys
+import time
+from collections import Counter
 from pathlib import Path
 
+from chapter_catalog import chapter_number_or_none, scan_directory
+from chapter_naming import WHITESPACE_PATTERN, fsync_directory, split_index_prefix
+
+# 重命名日志（预写日志）：第一行是完整的重命名步骤，之后每完成一步追加一行
+RENAME_JOURNAL_SUFFIX = '.rename-journal'
+RENAME_JOURNAL_VERSION = 1
+# 每完成这么多步把日志同步到磁盘一次
+RENAME_JOURNAL_SYNC_INTERVAL = 1000
+
+
+# 汉字数字表（兼容大写数字、〇和阿拉伯数字，连续的数字按位拼接，如"二〇二三"、"243"）
+CHINESE_DIGITS = {
+    '零': 0, '〇': 0, '一': 1, '二': 2, '两': 2, '三': 3, '四': 4,
+    '五': 5, '六': 6, '七': 7, '八': 8, '九': 9,
+    '壹': 1, '贰': 2, '叁': 3, '肆': 4, '伍': 5, '陆': 6, '柒': 7, '捌': 8, '玖': 9,
+    **{str(digit): digit for digit in range(10)},
+}
+# 节内单位：乘在前面的数字上（省略时为1，如"十五"）
+CHINESE_SMALL_UNITS = {'十': 10, '拾': 10, '百': 100, '佰': 100, '千': 1000, '仟': 1000}
+# 节单位：把它前面所有比它小的部分整体放大（如"一万亿"、"三亿零五万"）
+CHINESE_BIG_UNITS = {'万': 10**4, '萬': 10**4, '亿': 10**8, '億': 10**8}
+# 可以出现在章节号前后、直接忽略的字
+CHINESE_IGNORED = frozenset('第章')
 
+# 转换结果的缓存大小（同一部小说的章节号反复出现在文件名、标题和日志里）
+CHINESE_NUMBER_CACHE_SIZE = 65536
+
+
+def _parse_chinese_number(chinese_num_str):
+    """
+    按数字表和单位表解析汉字数字（不带缓存，供 chinese_to_arabic 和测试使用）
+
+    Raises:
+        ValueError: 包含数字表和单位表之外的字符
+    """
+    total = 0    # 已经遇到过节单位（万、亿）的部分
+    section = 0  # 当前节内已经乘过单位的部分
+    number = 0   # 还没有乘单位的数字
+    for char in chinese_num_str:
+        if char in CHINESE_DIGITS:
+            number = number * 10 + CHINESE_DIGITS[char]
+        elif char in CHINESE_SMALL_UNITS:
+            section += (number or 1) * CHINESE_SMALL_UNITS[char]
+            number = 0
+        elif char in CHINESE_BIG_UNITS:
+            unit = CHINESE_BIG_UNITS[char]
+            part = section + number
+            lower = total % unit
+            total += (lower + part) * unit - lower if (lower or part) else unit
+            section = number = 0
+        elif char not in CHINESE_IGNORED:
+            raise ValueError(f"无法识别的汉字数字: {chinese_num_str}")
+    return total + section + number
+
+
+@functools.lru_cache(maxsize=CHINESE_NUMBER_CACHE_SIZE)
 def chinese_to_arabic(chinese_num_str):
     """
     将汉字数字转换为阿拉伯数字
     
+    支持万、亿，以及汉字和阿拉伯数字混写（如"2百43"、"1万2千"），结果会被缓存。
+    
     Args:
-        chinese_num_str (str): 汉字数字字符串
+        chinese_num_str (str): 汉字数字字符串（可以带"第"和"章"）
         
     Returns:
         int: 转换后的阿拉伯数字
+        
+    Raises:
+        ValueError: 包含无法识别的字符
     """
-    # 汉字数字映射表
-    chinese_digits = {
-        '零': 0, '一': 1, '二': 2, '三': 3, '四': 4, '五': 5,
-        '六': 6, '七': 7, '八': 8, '九': 9, '两': 2
-    }
-    
-    # 去掉可能的前缀"第"和后缀"章"
-    chinese_num_str = chinese_num_str.replace('第', '').replace('章', '')
-    
-    if not chinese_num_str:
-        return 0
+    return _parse_chinese_number(chinese_num_str)
+
+
+def chinese_to_arabic_batch(chinese_num_strs):
+    """
+    批量转换汉字数字，重复的字符串只解析一次
     
-    # 如果已经是阿拉伯数字，直接返回
-    if chinese_num_str.isdigit():
-        return int(chinese_num_str)
+    Args:
+        chinese_num_strs (iterable): 汉字数字字符串
+        
+    Returns:
+        list: 与输入顺序对应的阿拉伯数字
+    """
+    chinese_num_strs = list(chinese_num_strs)
+    converted = {chinese_num_str: chinese_to_arabic(chinese_num_str) for chinese_num_str in set(chinese_num_strs)}
+    return [converted[chinese_num_str] for chinese_num_str in chinese_num_strs]
+
+
+def arabic_to_chinese(number):
+    """
+    将阿拉伯数字转换为标准写法的汉字数字（用于测试往返转换）
     
-    result = 0
-    current = 0
+    例如 10 -> "十"，105 -> "一百零五"，100010 -> "十万零一十"
     
-    i = 0
-    while i < len(chinese_num_str):
-        char = chinese_num_str[i]
-        
-        if char in chinese_digits:
-            current = chinese_digits[char]
-        elif char == '十':
-            if current == 0:  # 处理"十"开头的情况，如"十五"
-                current = 1
-            current *= 10
-            # 检查是否后面还有数字
-            if i + 1 < len(chinese_num_str) and chinese_num_str[i + 1] in chinese_digits:
-                i += 1
-                current += chinese_digits[chinese_num_str[i]]
-            result += current
-            current = 0
-        elif char == '百':
-            if current == 0:
-                current = 1
-            current *= 100
-            # 检查后面是否有十位数
-            if i + 1 < len(chinese_num_str):
-                remaining = chinese_num_str[i + 1:]
-                if remaining.startswith('零') and len(remaining) > 1:
-                    # 处理"百零X"的情况
-                    i += 2  # 跳过"零"
-                    if i < len(chinese_num_str) and chinese_num_str[i] in chinese_digits:
-                        current += chinese_digits[chinese_num_str[i]]
-                elif remaining[0] in chinese_digits:
-                    # 处理"百X"的情况（X是个位数）
-                    i += 1
-                    current += chinese_digits[chinese_num_str[i]]
-                elif remaining.startswith('十'):
-                    # 处理"百十X"或"百一十X"等情况
-                    continue  # 让下一轮循环处理"十"
-            result += current
-            current = 0
-        elif char == '千':
-            if current == 0:
-                current = 1
-            current *= 1000
-            result += current
-            current = 0
-        elif char == '万':
-            if current == 0 and result == 0:
-                current = 1
-            result = (result + current) * 10000
-            current = 0
+    Args:
+        number (int): 0 到 99999999999 之间的整数
         
-        i += 1
+    Returns:
+        str: 汉字数字
+    """
+    digits = '零一二三四五六七八九'
+    if number == 0:
+        return '零'
     
-    result += current
-    return result
+    def section_text(value, need_zero):
+        # 四位以内的一节；need_zero 为True时在这一节最前面补一个"零"
+        text = '零' if need_zero else ''
+        zero = False
+        for unit, name in ((1000, '千'), (100, '百'), (10, '十'), (1, '')):
+            digit = value // unit % 10
+            if digit == 0:
+                zero = zero or text not in ('', '零')
+                continue
+            if zero:
+                text += '零'
+                zero = False
+            text += digits[digit] + name
+        return text
+    
+    parts = []
+    gap = False
+    for unit, name in ((10**8, '亿'), (10**4, '万'), (1, '')):
+        value = number // unit % 10000 if unit < 10**8 else number // unit
+        if value:
+            # 前面有更高的节，且这一节不足千位或中间隔了整节的零时，需要补"零"
+            need_zero = bool(parts) and (gap or value < 1000)
+            parts.append(section_text(value, need_zero) + name)
+            gap = False
+        elif parts:
+            gap = True
+    text = ''.join(parts)
+    # 一十X 开头时习惯省略"一"
+    return text[1:] if text.startswith('一十') else text
 
 
 def extract_chapter_info(filename):
@@ -110,8 +173,8 @@ def extract_chapter_info(filename):
     """
     # 匹配模式：以"第"或"地"开头，包含汉字数字，以"章"结尾
     patterns = [
-        r'^(第[零一二三四五六七八九十百千万两]+章)\s*(.*)',  # 第xxx章
-        r'^(地[零一二三四五六七八九十百千万两]+章)\s*(.*)',  # 地xxx章（可能是"第"的错别字）
+        r'^(第[零〇一二三四五六七八九十百千万亿两]+章)\s*(.*)',  # 第xxx章
+        r'^(地[零〇一二三四五六七八九十百千万亿两]+章)\s*(.*)',  # 地xxx章（可能是"第"的错别字）
     ]
     
     for pattern in patterns:
@@ -121,7 +184,7 @@ def extract_chapter_info(filename):
             remaining_part = match.group(2)
             
             # 提取汉字数字部分
-            chinese_num_match = re.search(r'[零一二三四五六七八九十百千万两]+', chapter_part)
+            chinese_num_match = re.search(r'[零〇一二三四五六七八九十百千万亿两]+', chapter_part)
             if chinese_num_match:
                 chinese_num = chinese_num_match.group()
                 arabic_num = chinese_to_arabic(chinese_num)
@@ -130,6 +193,358 @@ def extract_chapter_info(filename):
     return None, None
 
 
+def normalize_chapter_title(title):
+    """
+    把章节标题中的汉字章节号转换为阿拉伯数字，得到与重命名后的文件名相同的规范标题
+    
+    例如 "第两百四十三章 击杀大斗师！" -> ("243章 击杀大斗师！", 243)
+    
+    Args:
+        title (str): 章节标题
+        
+    Returns:
+        tuple: (规范标题, 章节号)，标题中没有章节号时章节号为None，标题保持不变
+    """
+    chapter_num, remaining_part = extract_chapter_info(title.strip())
+    if chapter_num is None:
+        return title, chapter_number_or_none(title)
+    return re.sub(r'\s+', ' ', f"{chapter_num}章 {remaining_part}").strip(), chapter_num
+
+
+def target_filename(entry):
+    """
+    根据清单缓存中的条目计算重命名后的文件名
+    
+    Args:
+        entry (dict): chapter_catalog.scan_directory 返回的条目
+        
+    Returns:
+        str: 新文件名，文件名中没有汉字章节号时返回None
+    """
+    if entry['rename_info'] is None:
+        return None
+    filename = entry['name']
+    # 爬虫生成的文件名带有URL索引前缀，重命名时原样保留
+    _, name_part = split_index_prefix(filename)
+    prefix = filename[:len(filename) - len(name_part)]
+    
+    # 章节信息：清单缓存中保存的是 extract_chapter_info(name_part) 的结果
+    chapter_num, remaining_part = entry['rename_info']
+    # 标题只有章节号时剩余部分只是扩展名（"第四章.txt" -> "4章.txt"）
+    new_filename = f"{chapter_num}章 {remaining_part}" if remaining_part not in ('', '.txt') else f"{chapter_num}章.txt"
+    if not new_filename.endswith('.txt'):
+        new_filename += '.txt'
+    
+    # 去掉多余的空格
+    return prefix + WHITESPACE_PATTERN.sub(' ', new_filename).strip()
+
+
+def plan_renames(directory_path):
+    """
+    扫描一次目录，生成完整的重命名计划
+    
+    冲突在执行前全部找出来：多个文件要改成同一个名字，或目标文件已存在且不会被改名，都跳过。
+    目标名正好是另一个待改名文件的旧名时，先改后面的文件（A->B、B->C 按 B->C、A->B 的顺序执行）；
+    互相占用的循环（A->B、B->A）借助临时文件名打断。
+    
+    Args:
+        directory_path (str): 目录路径
+        
+    Returns:
+        dict: {'directory', 'total', 'unchanged', 'renames': [(旧名, 新名)],
+               'conflicts': [(旧名, 新名, 原因)], 'steps': [(旧名, 新名)]（按执行顺序，含临时文件名）}
+    """
+    entries = scan_directory(directory_path)
+    names = {entry['name'] for entry in entries}
+    wanted = {}
+    unchanged = 0
+    for entry in entries:
+        new_filename = target_filename(entry)
+        if new_filename is None:
+            continue
+        if new_filename == entry['name']:
+            unchanged += 1
+        else:
+            wanted[entry['name']] = new_filename
+    
+    conflicts = []
+    target_counts = Counter(wanted.values())
+    for old, new in list(wanted.items()):
+        if target_counts[new] > 1:
+            conflicts.append((old, new, "多个文件要重命名为同一个名字"))
+            del wanted[old]
+    
+    # 目标文件已存在且不会被改名时跳过；被跳过的文件留在原处，又会挡住以它为目标的文件
+    renamed_from = {new: old for old, new in wanted.items()}
+    blocked = [old for old, new in wanted.items() if new in names and new not in wanted]
+    while blocked:
+        old = blocked.pop()
+        if old not in wanted:
+            continue
+        conflicts.append((old, wanted.pop(old), "目标文件已存在"))
+        if renamed_from.get(old) in wanted:
+            blocked.append(renamed_from[old])
+    
+    # 按依赖关系排出执行顺序：每个文件最多被一个文件当作目标，所以只有链和环两种情况
+    steps = []
+    pending = dict(wanted)
+    temp_names = (f".rename-{i}.tmp" for i in itertools.count())
+    for start in sorted(wanted):
+        if start not in pending:
+            continue
+        path = []
+        current = start
+        while current in pending and (not path or current != start):
+            path.append(current)
+            current = pending[current]
+        if current == start:
+            temp_name = next(name for name in temp_names if name not in names)
+            steps.append((start, temp_name))
+            steps.extend((old, pending[old]) for old in reversed(path[1:]))
+            steps.append((temp_name, pending[start]))
+        else:
+            steps.extend((old, pending[old]) for old in reversed(path))
+        for old in path:
+            del pending[old]
+    
+    return {
+        'directory': str(directory_path),
+        'total': len(entries),
+        'unchanged': unchanged,
+        'renames': sorted(wanted.items()),
+        'conflicts': conflicts,
+        'steps': steps,
+    }
+
+
+def print_rename_plan(plan):
+    """显示重命名计划（试运行）"""
+    for old, new in plan['renames']:
+        print(f"原文件名: {old}")
+        print(f"新文件名: {new}")
+        print(f"  → 将会重命名")
+        print("-" * 40)
+    for old, new, reason in plan['conflicts']:
+        print(f"原文件名: {old}")
+        print(f"新文件名: {new}")
+        print(f"  警告: {reason}，跳过重命名")
+        print("-" * 40)
+    
+    print(f"\n{'=' * 60}")
+    print(f"预计重命名文件数: {len(plan['renames'])}")
+    if plan['conflicts']:
+        print(f"冲突/跳过文件数: {len(plan['conflicts'])}")
+    if len(plan['steps']) > len(plan['renames']):
+        print(f"其中有互相占用的文件名，需要经过临时文件名，共 {len(plan['steps'])} 步")
+    print(f"无需重命名: {plan['unchanged']}")
+    print(f"总文件数: {plan['total']}")
+    print(f"{'=' * 60}")
+
+
+def rename_journal_path(directory_path):
+    """重命名日志的路径（放在目录旁边，与清单缓存一样不影响目录本身）"""
+    return os.path.normpath(os.path.abspath(directory_path)) + RENAME_JOURNAL_SUFFIX
+
+
+def load_rename_journal(directory_path):
+    """
+    读取未完成的重命名日志
+    
+    日志头（全部步骤）在第一次重命名之前就同步到了磁盘，日志头不完整说明写日志头时被中断，
+    还没有执行任何重命名：删除日志，当作没有日志。
+    中断时写了一半的最后一条记录会从日志中截掉，否则继续执行时追加的记录会接在这半行后面，
+    整行都无法解析。没来得及记录的步骤由 _detect_unjournaled 按文件系统推断。
+    
+    Returns:
+        tuple: (步骤列表, 已完成的步骤序号集合)，没有日志时返回None
+    """
+    journal_path = rename_journal_path(directory_path)
+    try:
+        with open(journal_path, 'r', encoding='utf-8', newline='') as journal:
+            lines = journal.read().splitlines(keepends=True)
+    except FileNotFoundError:
+        return None
+    try:
+        if not lines:
+            raise ValueError("空文件")
+        if not lines[0].endswith('\n'):
+            raise ValueError("日志头没有写完")
+        header = json.loads(lines[0])
+        steps = [tuple(step) for step in header['steps']]
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"⚠️  重命名日志 {journal_path} 的日志头不完整（{e}），"
+              f"写日志头时被中断，还没有执行任何重命名，删除日志")
+        os.remove(journal_path)
+        return None
+    
+    done = set()
+    valid_length = len(lines[0].encode('utf-8'))
+    for line in lines[1:]:
+        try:
+            if not line.endswith('\n'):
+                raise ValueError("记录没有写完")
+            record = json.loads(line)
+            if 'done' in record:
+                done.add(record['done'])
+            else:
+                done.discard(record['undone'])
+        except (ValueError, KeyError, TypeError):
+            # 中断时写了一半的最后一行
+            with open(journal_path, 'r+b') as journal:
+                journal.truncate(valid_length)
+                journal.flush()
+                os.fsync(journal.fileno())
+            break
+        valid_length += len(line.encode('utf-8'))
+    return steps, done
+
+
+def _detect_unjournaled(directory, steps, done):
+    """
+    找出已经执行、但日志还没来得及记录的步骤（日志每步都写入，但只定期同步到磁盘）
+    
+    从第一个未记录的步骤开始，旧文件不在、新文件已存在的步骤视为已完成。
+    _run_rename_steps 在使用前面步骤腾出的文件名之前总会先同步日志，
+    所以未同步的步骤之间不会重用文件名，按文件系统推断的结果是可靠的。
+    
+    Returns:
+        list: 推断为已完成的步骤序号（已加入 done）
+    """
+    detected = []
+    for i, (old, new) in enumerate(steps):
+        if i in done:
+            continue
+        if not os.path.lexists(os.path.join(directory, old)) and os.path.lexists(os.path.join(directory, new)):
+            done.add(i)
+            detected.append(i)
+        else:
+            break
+    return detected
+
+
+def _record_detected(journal, detected):
+    """把推断出的已完成步骤补记到日志并同步，之后的步骤才能安全地重用它们腾出的文件名"""
+    if not detected:
+        return
+    for i in detected:
+        journal.write(json.dumps({'done': i}) + '\n')
+    journal.flush()
+    os.fsync(journal.fileno())
+
+
+def _run_rename_steps(directory, journal, steps, indices, undo=False):
+    """
+    按顺序执行（或撤销）重命名步骤，每步完成后追加一条日志
+    
+    目标文件已存在时停止，不会覆盖任何文件（POSIX上os.rename会静默覆盖）。
+    目标名是本次运行中前面某步腾出来的（链 A->B、B->C 或环）时，先把日志同步到磁盘：
+    否则中断后前面那一步的记录可能丢失，而它的旧文件名又被后面的步骤占用，无法判断它是否执行过。
+    
+    Returns:
+        tuple: (成功步数, 出错信息或None)
+    """
+    count = 0
+    vacated = set()
+    unsynced = False
+    for i in indices:
+        old, new = steps[i]
+        source, target = (new, old) if undo else (old, new)
+        target_path = os.path.join(directory, target)
+        if target in vacated and unsynced:
+            os.fsync(journal.fileno())
+            unsynced = False
+        if os.path.lexists(target_path):
+            return count, f"{source} -> {target}: 目标文件已存在，拒绝覆盖"
+        try:
+            os.rename(os.path.join(directory, source), target_path)
+        except OSError as e:
+            return count, f"{source} -> {target}: {e}"
+        vacated.add(source)
+        journal.write(json.dumps({'undone' if undo else 'done': i}) + '\n')
+        journal.flush()
+        unsynced = True
+        count += 1
+        if count % RENAME_JOURNAL_SYNC_INTERVAL == 0:
+            os.fsync(journal.fileno())
+            unsynced = False
+            print(f"  已完成 {count}/{len(indices)} 步")
+    return count, None
+
+
+def _finish_renames(directory_path, journal, count, error, action):
+    """关闭日志；全部完成时删除日志，出错时保留日志供继续或回滚"""
+    journal.close()
+    if error:
+        print(f"  ✗ {action}失败: {error}")
+        print(f"已{action} {count} 步。重新运行本工具可以继续或回滚（日志: {rename_journal_path(directory_path)}）")
+        return False
+    os.remove(rename_journal_path(directory_path))
+    print(f"  ✓ {action}完成，共 {count} 步")
+    return True
+
+
+def execute_rename_plan(plan):
+    """
+    执行重命名计划
+    
+    先把全部步骤写入日志并同步到磁盘（预写日志），再逐个重命名；
+    中途中断时日志保留在目录旁边，可以用 resume_renames 继续或 rollback_renames 回滚。
+    
+    Returns:
+        bool: 是否全部完成
+    """
+    directory_path = plan['directory']
+    journal_path = rename_journal_path(directory_path)
+    if load_rename_journal(directory_path) is not None:
+        print(f"错误：存在未完成的重命名日志 {journal_path}，请先继续或回滚")
+        return False
+    
+    journal = open(journal_path, 'w', encoding='utf-8')
+    journal.write(json.dumps({
+        'version': RENAME_JOURNAL_VERSION,
+        'directory': os.path.abspath(directory_path),
+        'steps': plan['steps'],
+    }, ensure_ascii=False) + '\n')
+    journal.flush()
+    os.fsync(journal.fileno())
+    fsync_directory(os.path.dirname(journal_path))
+    
+    count, error = _run_rename_steps(directory_path, journal, plan['steps'], range(len(plan['steps'])))
+    return _finish_renames(directory_path, journal, count, error, "重命名")
+
+
+def resume_renames(directory_path):
+    """按日志继续执行中断的重命名"""
+    journal_state = load_rename_journal(directory_path)
+    if journal_state is None:
+        print("没有未完成的重命名")
+        return True
+    steps, done = journal_state
+    detected = _detect_unjournaled(directory_path, steps, done)
+    remaining = [i for i in range(len(steps)) if i not in done]
+    print(f"继续重命名：已完成 {len(done)} 步，剩余 {len(remaining)} 步")
+    journal = open(rename_journal_path(directory_path), 'a', encoding='utf-8')
+    _record_detected(journal, detected)
+    count, error = _run_rename_steps(directory_path, journal, steps, remaining)
+    return _finish_renames(directory_path, journal, count, error, "继续重命名")
+
+
+def rollback_renames(directory_path):
+    """按日志把已完成的重命名逆序撤销"""
+    journal_state = load_rename_journal(directory_path)
+    if journal_state is None:
+        print("没有未完成的重命名")
+        return True
+    steps, done = journal_state
+    detected = _detect_unjournaled(directory_path, steps, done)
+    completed = sorted(done, reverse=True)
+    print(f"回滚重命名：需要撤销 {len(completed)} 步")
+    journal = open(rename_journal_path(directory_path), 'a', encoding='utf-8')
+    _record_detected(journal, detected)
+    count, error = _run_rename_steps(directory_path, journal, steps, completed, undo=True)
+    return _finish_renames(directory_path, journal, count, error, "回滚")
+
+
 def rename_files(directory_path, dry_run=True):
     """
     批量重命名文件
@@ -138,72 +553,19 @@ def rename_files(directory_path, dry_run=True):
         directory_path (str): 目录路径
         dry_run (bool): 是否为试运行模式（只显示结果，不实际重命名）
     """
-    directory = Path(directory_path)
-    
-    if not directory.exists():
+    if not Path(directory_path).exists():
         print(f"错误：目录 {directory_path} 不存在")
         return
     
-    renamed_count = 0
-    error_count = 0
-    
     print(f"{'=' * 60}")
     print(f"{'试运行模式' if dry_run else '实际重命名模式'}")
     print(f"处理目录: {directory_path}")
     print(f"{'=' * 60}")
     
-    # 获取所有.txt文件
-    txt_files = list(directory.glob("*.txt"))
-    
-    for file_path in txt_files:
-        filename = file_path.name
-        
-        # 提取章节信息
-        chapter_num, remaining_part = extract_chapter_info(filename)
-        
-        if chapter_num is not None:
-            # 构造新文件名
-            new_filename = f"{chapter_num}章 {remaining_part}" if remaining_part else f"{chapter_num}章.txt"
-            if not new_filename.endswith('.txt'):
-                new_filename += '.txt'
-            
-            # 去掉多余的空格
-            new_filename = re.sub(r'\s+', ' ', new_filename).strip()
-            
-            if filename != new_filename:
-                print(f"原文件名: {filename}")
-                print(f"新文件名: {new_filename}")
-                
-                if not dry_run:
-                    try:
-                        new_file_path = file_path.parent / new_filename
-                        
-                        # 检查新文件名是否已存在
-                        if new_file_path.exists():
-                            print(f"  警告: 目标文件已存在，跳过重命名")
-                            error_count += 1
-                        else:
-                            file_path.rename(new_file_path)
-                            print(f"  ✓ 重命名成功")
-                            renamed_count += 1
-                    except Exception as e:
-                        print(f"  ✗ 重命名失败: {e}")
-                        error_count += 1
-                else:
-                    print(f"  → 将会重命名")
-                    renamed_count += 1
-                
-                print("-" * 40)
-            else:
-                print(f"跳过（无需重命名）: {filename}")
-    
-    print(f"\n{'=' * 60}")
-    print(f"处理完成!")
-    print(f"{'预计' if dry_run else '实际'}重命名文件数: {renamed_count}")
-    if error_count > 0:
-        print(f"错误/跳过文件数: {error_count}")
-    print(f"总文件数: {len(txt_files)}")
-    print(f"{'=' * 60}")
+    plan = plan_renames(directory_path)
+    print_rename_plan(plan)
+    if not dry_run and plan['steps']:
+        execute_rename_plan(plan)
 
 
 def main():
@@ -220,16 +582,35 @@ def main():
         print("请确保该脚本在正确的目录中运行")
         return
     
-    # 首先进行试运行
+    # 上次重命名中途被中断
+    if load_rename_journal(novel_chapters_dir) is not None:
+        print(f"发现未完成的重命名日志 {rename_journal_path(novel_chapters_dir)}")
+        while True:
+            choice = input("继续重命名(r)、回滚(b)还是暂不处理(n)？: ").strip().lower()
+            if choice == 'r':
+                resume_renames(novel_chapters_dir)
+                return
+            elif choice == 'b':
+                rollback_renames(novel_chapters_dir)
+                return
+            elif choice == 'n':
+                return
+            else:
+                print("请输入 r、b 或 n")
+    
+    # 只扫描一次目录：先显示计划，确认后按同一个计划执行
     print("\n1. 试运行模式 - 预览重命名结果")
-    rename_files(novel_chapters_dir, dry_run=True)
+    plan = plan_renames(novel_chapters_dir)
+    print_rename_plan(plan)
+    if not plan['steps']:
+        return
     
     # 询问用户是否继续
     while True:
         choice = input("\n是否执行实际重命名？(y/n): ").strip().lower()
         if choice in ['y', 'yes', '是']:
             print("\n2. 执行实际重命名")
-            rename_files(novel_chapters_dir, dry_run=False)
+            execute_rename_plan(plan)
             break
         elif choice in ['n', 'no', '否']:
             print("取消重命名操作")
@@ -262,20 +643,97 @@ def test_chinese_to_arabic():
         ("一千四百零一", 1401),
         ("一千六百二十三", 1623),
         ("九千九百九十九", 9999),
+        ("一千零一十", 1010),
+        ("两千零五", 2005),
+        ("一万", 10000),
+        ("一万零一", 10001),
+        ("十万零一十", 100010),
+        ("三万五千", 35000),
+        ("一千万零一", 10000001),
+        ("一亿", 100000000),
+        ("一亿二千万", 120000000),
+        ("三亿零五万", 300050000),
+        ("一万亿", 1000000000000),
+        ("第两百四十三章", 243),
+        ("2百43", 243),
+        ("1万2千", 12000),
+        ("12万", 120000),
+        ("243", 243),
+        ("二〇二三", 2023),
+        ("壹佰贰拾", 120),
     ]
     
     print("测试汉字数字转换功能:")
     print("-" * 30)
     
+    failed = 0
     for chinese, expected in test_cases:
         result = chinese_to_arabic(chinese)
         status = "✓" if result == expected else "✗"
+        failed += result != expected
         print(f"{status} {chinese} -> {result} (期望: {expected})")
+    
+    print(f"\n共 {len(test_cases)} 个用例，失败 {failed} 个")
+    return failed == 0
 
 
-if __name__ == "__main__":
-    # 如果需要测试转换功能，取消下面的注释
-    # test_chinese_to_arabic()
-    # print()
+def test_round_trip(limit=99999999):
+    """
+    往返测试：1 到 limit 的每个数字转换为汉字再转换回来，结果必须相同
+    
+    不经过缓存，完整跑一遍 1-99999999 需要几分钟。
+    """
+    print(f"往返测试 1-{limit:,}:")
+    print("-" * 30)
+    start = time.perf_counter()
+    failed = []
+    for number in range(1, limit + 1):
+        if _parse_chinese_number(arabic_to_chinese(number)) != number:
+            failed.append(number)
+        if number % 10000000 == 0:
+            print(f"已检查 {number:,} 个数字，失败 {len(failed)} 个")
+    for number in failed[:10]:
+        print(f"✗ {number} -> {arabic_to_chinese(number)} -> {_parse_chinese_number(arabic_to_chinese(number))}")
+    print(f"共检查 {limit:,} 个数字，失败 {len(failed)} 个，耗时 {time.perf_counter() - start:.1f} 秒")
+    return not failed
+
+
+def benchmark_chinese_to_arabic(count=200000):
+    """测试转换速度：不带缓存的解析、带缓存的单个转换、批量转换"""
+    chinese_nums = [arabic_to_chinese(number) for number in range(1, count + 1)]
+    # 模拟同一批章节号反复出现（文件名、标题、日志）
+    repeated = chinese_nums[:2000] * (count // 2000)
+    
+    print(f"转换速度测试（{count:,} 个数字）:")
+    print("-" * 30)
+    start = time.perf_counter()
+    for chinese_num in chinese_nums:
+        _parse_chinese_number(chinese_num)
+    elapsed = time.perf_counter() - start
+    print(f"解析（无缓存）:   {count / elapsed:,.0f} 个/秒")
     
-    main()
+    chinese_to_arabic.cache_clear()
+    start = time.perf_counter()
+    for chinese_num in repeated:
+        chinese_to_arabic(chinese_num)
+    elapsed = time.perf_counter() - start
+    print(f"重复章节号（缓存）: {len(repeated) / elapsed:,.0f} 个/秒")
+    
+    chinese_to_arabic.cache_clear()
+    start = time.perf_counter()
+    chinese_to_arabic_batch(repeated)
+    elapsed = time.perf_counter() - start
+    print(f"批量转换:         {len(repeated) / elapsed:,.0f} 个/秒")
+
+
+if __name__ == "__main__":
+    # python toolname.py test     测试转换功能（加 full 参数时完整往返测试 1-99999999）
+    # python toolname.py bench    测试转换速度
+    if len(sys.argv) > 1 and sys.argv[1] == 'test':
+        test_chinese_to_arabic()
+        print()
+        test_round_trip(99999999 if 'full' in sys.argv[2:] else 1000000)
+    elif len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        benchmark_chinese_to_arabic()
+    else:
+        main()
@@ -2,86 +2,581 @@
 # -*- coding: utf-8 -*-
 """
 小说章节字数统计工具
-用于统计指定txt文件的字数
+用于统计指定txt文件（或章节归档中的章节）的字数
+
+章节归档用法：
+    python word_counter.py novel_chapters.pack      # 统计整个归档
+    python word_counter.py novel_chapters.pack#12   # 只统计索引为12的章节
+
+批量统计（多进程，每个文件一行结果）：
+    python word_counter.py novel_chapters/                       # 统计目录中所有txt，结果写入 novel_chapters.wordcount.csv
+    python word_counter.py "抄/*.txt" --output=字数.json          # 按通配符选择文件，输出JSON
+    python word_counter.py novel_chapters/ --workers=4            # 指定进程数（默认CPU核数）
+    python word_counter.py novel_chapters/ --hash                 # 缓存命中时再用内容哈希确认文件没变
+    python word_counter.py novel_chapters/ --no-cache             # 不使用统计缓存，全部重新统计
+
+爬虫统计清单（main.py 爬取时已经统计好每一章，不需要再读取章节）：
+    python word_counter.py novel_chapters.stats.jsonl
+
+批量统计的结果缓存在每个目录旁边的 <目录>.wordcount-cache.json 中，
+文件的大小和修改时间没变时直接使用上次的结果，每天爬取后只需统计新增的章节。
+
+大文件（超过64MB）自动分块流式统计，内存占用不随文件大小增长；--stream 强制使用流式统计。
+
+NumPy后端（需要安装 numpy）：
+    python word_counter.py --numpy 《斗破苍穹》.txt       # 用向量运算统计，结果与默认方式相同
+    python word_counter.py --histogram 《斗破苍穹》.txt   # 同时输出最常用的字符
 """
 
+import codecs
+import csv
+import functools
+import glob
+import hashlib
+import json
 import os
+import re
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from chapter_archive import ArchiveReader, ARCHIVE_SUFFIX, entry_raw_length, index_path_for
+from chapter_catalog import RACY_WINDOW_NS, chapter_number_or_none, extract_chapter_number, scan_directory
+from chapter_naming import write_text_atomic
+
+BATCH_OUTPUT_SUFFIX = '.wordcount.csv'
+STATS_CACHE_SUFFIX = '.wordcount-cache.json'
+STATS_MANIFEST_SUFFIX = '.stats.jsonl'
+# 统计规则变化时递增，旧缓存自动作废
+STATS_CACHE_VERSION = 1
+HASH_CHUNK_BYTES = 1024 * 1024
+GLOB_CHARS = '*?['
+TEXT_ENCODINGS = ['utf-8', 'gbk', 'gb2312', 'ascii']
+# 带BOM的编码（UTF-32 LE的BOM以UTF-16 LE的BOM开头，必须先判断）
+BOM_ENCODINGS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+SNIFF_BYTES = 64 * 1024        # 判断编码时试解码的字节数
+ENCODING_CACHE_SIZE = 100000   # 每个进程最多记住多少个文件的编码
+STREAM_CHUNK_CHARS = 4 * 1024 * 1024  # 流式统计每次读取的字符数
+STREAM_THRESHOLD = 64 * 1024 * 1024   # 超过这个字节数的文件自动流式统计
+# 篇幅分类：(中文字符数上限（不含），名称，说明)，上限为None表示没有上限
+LENGTH_CATEGORIES = [
+    (2000, '短篇', '短篇 (一般2000字以下)'),
+    (10000, '中篇', '中篇章节 (2000-10000字)'),
+    (None, '长篇', '长篇章节 (10000字以上)'),
+]
+STAT_FIELDS = ['total_chars', 'effective_chars', 'chinese_chars', 'english_chars', 'digit_chars',
+               'english_words', 'total_lines', 'non_empty_lines', 'file_size']
+
+
+def split_archive_spec(path):
+    """
+    拆分章节归档路径
+
+    Args:
+        path (str): 形如 "novel_chapters.pack" 或 "novel_chapters.pack#12" 的路径
+
+    Returns:
+        tuple: (归档路径, 章节序号或None)，不是归档路径时返回 (None, None)
+    """
+    archive_path, sep, number = path.partition('#')
+    if not archive_path.endswith(ARCHIVE_SUFFIX):
+        return None, None
+    if sep and number.isdigit():
+        return archive_path, int(number)
+    return archive_path, None
+
+
+# 各类字符的正则（每个都在C中扫描一遍文本，不在Python中逐字符循环）
+CHINESE_RUN_PATTERN = re.compile('[\u4e00-\u9fff]+')       # 中文字符
+ENGLISH_RUN_PATTERN = re.compile('[A-Za-z]+')                # ASCII英文字母
+WHITESPACE_RUN_PATTERN = re.compile(r'\s+')                  # 空白字符（与str.split()的规则相同）
+# 含有英文字母的单词：从单词开头（前面不是非空白字符）跳过非字母部分后遇到字母
+ENGLISH_WORD_PATTERN = re.compile(r'(?<!\S)[^\sA-Za-z]*[A-Za-z]')
+# 只有空白的行（按"\n"分行，与 content.split('\n') 一致）
+BLANK_LINE_PATTERN = re.compile(r'^[^\S\n]*$', re.MULTILINE)
+NON_SPACE_PATTERN = re.compile(r'\S')
+# 文本开头的非空白部分（被块边界切开的单词的后半段）
+LEADING_WORD_PATTERN = re.compile(r'\S*')
+
+
+@functools.lru_cache(maxsize=None)
+def digit_run_pattern():
+    """所有 str.isdigit() 为真的字符（包括全角数字、上标数字等）组成的正则，第一次使用时生成"""
+    ranges = []
+    for code in range(sys.maxunicode + 1):
+        if chr(code).isdigit():
+            if ranges and ranges[-1][1] == code - 1:
+                ranges[-1][1] = code
+            else:
+                ranges.append([code, code])
+    char_class = ''.join(f"\\U{low:08x}-\\U{high:08x}" for low, high in ranges)
+    return re.compile(f"[{char_class}]+")
+
+
+def count_run_chars(pattern, content):
+    """统计正则匹配到的字符总数（按连续的一段匹配，比逐个字符匹配产生的对象少得多）"""
+    return sum(map(len, pattern.findall(content)))
+
+
+def count_words_in_text(content, file_size):
+    """
+    统计文本中的字数
+
+    Args:
+        content (str): 文本内容
+        file_size (int): 文本对应的字节数
+
+    Returns:
+        dict: 包含字符数、中文字符数、英文单词数等统计信息
+    """
+    # 统计各种字数
+    total_chars = len(content)  # 总字符数（包括空格、换行等）
+    
+    # 统计中文字符数（\u4e00-\u9fff）：一次删掉所有中文字符，少掉的长度就是中文字符数
+    # 中文字符既不是字母、数字，也不是空白，后面的统计在剩下的（小得多的）文本上进行
+    rest = CHINESE_RUN_PATTERN.sub('', content)
+    chinese_chars = total_chars - len(rest)
+    
+    # 统计英文字母数（ASCII英文字母）
+    english_chars = count_run_chars(ENGLISH_RUN_PATTERN, rest)
+    
+    # 统计数字数（与 str.isdigit() 相同）
+    digit_chars = count_run_chars(digit_run_pattern(), rest)
+    
+    # 统计英文单词数（按空白分割后含有英文字母的部分；删掉中文字符不会合并或拆开单词）
+    english_words = len(ENGLISH_WORD_PATTERN.findall(rest))
+    
+    # 统计行数（只有中文的行删掉中文后会变成空行，所以空行要在原文上统计）
+    total_lines = content.count('\n') + 1
+    non_empty_lines = total_lines - len(BLANK_LINE_PATTERN.findall(content))
+    
+    # 去除空白字符后的总字符数
+    effective_chars = total_chars - count_run_chars(WHITESPACE_RUN_PATTERN, rest)
+    
+    return {
+        'total_chars': total_chars,
+        'effective_chars': effective_chars,
+        'chinese_chars': chinese_chars,
+        'english_chars': english_chars,
+        'digit_chars': digit_chars,
+        'english_words': english_words,
+        'total_lines': total_lines,
+        'non_empty_lines': non_empty_lines,
+        'file_size': file_size
+    }
+
+
+def require_numpy():
+    """检查是否安装了 numpy"""
+    if numpy is None:
+        raise RuntimeError("NumPy后端需要安装 numpy 库：pip install numpy")
+
+
+@functools.lru_cache(maxsize=None)
+def codepoint_tables():
+    """
+    按码位查表用的数组（第一次使用时生成）
+
+    Returns:
+        tuple: (是否 str.isdigit(), 是否 str.isspace())，长度都是 sys.maxunicode + 1
+    """
+    require_numpy()
+    digits = numpy.zeros(sys.maxunicode + 1, dtype=bool)
+    spaces = numpy.zeros(sys.maxunicode + 1, dtype=bool)
+    for code in range(sys.maxunicode + 1):
+        char = chr(code)
+        if char.isdigit():
+            digits[code] = True
+        elif char.isspace():
+            spaces[code] = True
+    return digits, spaces
+
+
+def text_codepoints(content):
+    """把文本转成码位数组（UTF-32编码后直接按uint32解释，不复制）"""
+    require_numpy()
+    return numpy.frombuffer(content.encode('utf-32-le'), dtype='<u4')
+
+
+def count_distinct_sorted(values):
+    """统计有序数组中不同值的个数"""
+    if len(values) == 0:
+        return 0
+    return int(numpy.count_nonzero(values[1:] != values[:-1])) + 1
+
+
+def count_words_in_text_numpy(content, file_size):
+    """
+    用NumPy向量运算统计文本中的字数，返回值与 count_words_in_text 完全相同
+
+    每种字符先算出一个布尔掩码，再用 count_nonzero 计数；
+    单词和非空行用累加和给每个字符编号（属于第几个单词/第几行），再数不同编号的个数。
+    """
+    codes = text_codepoints(content)
+    digit_table, space_table = codepoint_tables()
+    
+    total_chars = len(codes)
+    chinese = (codes >= 0x4e00) & (codes <= 0x9fff)
+    # 大小写只差0x20，统一成大写后只需比较一个范围
+    upper = codes & ~numpy.uint32(0x20)
+    letters = (upper >= ord('A')) & (upper <= ord('Z'))
+    digits = digit_table[codes]
+    spaces = space_table[codes]
+    
+    # 英文单词：非空白字符前面是空白（或文本开头）时开始一个新单词
+    word_starts = ~spaces
+    word_starts[1:] &= spaces[:-1]
+    word_ids = numpy.cumsum(word_starts)
+    english_words = count_distinct_sorted(word_ids[letters])
+    
+    # 非空行：含有非空白字符的行
+    newlines = codes == ord('\n')
+    line_ids = numpy.cumsum(newlines)
+    non_empty_lines = count_distinct_sorted(line_ids[~spaces])
+    
+    space_chars = int(numpy.count_nonzero(spaces))
+    return {
+        'total_chars': total_chars,
+        'effective_chars': total_chars - space_chars,
+        'chinese_chars': int(numpy.count_nonzero(chinese)),
+        'english_chars': int(numpy.count_nonzero(letters)),
+        'digit_chars': int(numpy.count_nonzero(digits)),
+        'english_words': english_words,
+        'total_lines': int(numpy.count_nonzero(newlines)) + 1,
+        'non_empty_lines': non_empty_lines,
+        'file_size': file_size
+    }
+
+
+def codepoint_histogram(content):
+    """
+    统计每个字符出现的次数
+
+    Returns:
+        dict: {字符: 次数}
+    """
+    codes, counts = numpy.unique(text_codepoints(content), return_counts=True)
+    return {chr(code): int(count) for code, count in zip(codes.tolist(), counts.tolist())}
+
+
+def add_histogram(histogram, content):
+    """把文本的字符频率累加到 histogram 中"""
+    for char, count in codepoint_histogram(content).items():
+        histogram[char] = histogram.get(char, 0) + count
+
+
+def count_text(content, file_size, use_numpy=False, histogram=None):
+    """
+    按选择的后端统计文本字数
+
+    Args:
+        content (str): 文本内容
+        file_size (int): 文本对应的字节数
+        use_numpy (bool): 是否使用NumPy后端
+        histogram (dict): 不为None时把字符频率累加到其中（需要numpy）
+    """
+    if histogram is not None:
+        add_histogram(histogram, content)
+    if use_numpy:
+        return count_words_in_text_numpy(content, file_size)
+    return count_words_in_text(content, file_size)
+
+
+def print_histogram(histogram, top=30):
+    """打印出现次数最多的字符（跳过空白字符）"""
+    items = sorted(((count, char) for char, count in histogram.items() if not char.isspace()), reverse=True)
+    print(f"\n最常用的 {min(top, len(items))} 个字符（共 {len(items):,} 种）:")
+    for rank, (count, char) in enumerate(items[:top], 1):
+        print(f"  {rank:3d}. {char}  {count:,}")
+
+
+class StreamingCounter:
+    """
+    分块统计文本字数，内存占用只与块大小有关
+
+    每块文本立即统计，不保留任何文本，块边界可以在任意位置（包括单词或没有空白的长行中间）：
+    - 跨块的行用 pending_line 记录已经读到的部分是否有非空白字符
+    - 跨块的单词用 open_word 记录上一块结尾未结束的单词是否已经含有英文字母（已经计数），
+      这一块开头的后半段也含有英文字母时会被再算一次，需要扣掉
+    finish() 的结果与对整段文本调用 count_words_in_text 完全相同。
+
+    Args:
+        use_numpy (bool): 见 count_text
+        histogram (dict): 见 count_text
+    """
+
+    ADDITIVE_FIELDS = ['total_chars', 'effective_chars', 'chinese_chars', 'english_chars',
+                       'digit_chars', 'english_words']
+
+    def __init__(self, use_numpy=False, histogram=None):
+        self.use_numpy = use_numpy
+        self.histogram = histogram
+        self.totals = dict.fromkeys(self.ADDITIVE_FIELDS, 0)
+        self.finished_lines = 0     # 已经结束（遇到换行）的行数
+        self.non_empty_lines = 0    # 其中的非空行数
+        self.pending_line = False   # 当前未结束的行是否已经有非空白字符
+        self.open_word = None       # 上一块结尾未结束的单词是否含有英文字母，None表示上一块以空白结尾
+
+    def feed(self, text):
+        """添加一块文本"""
+        if text:
+            self._count(text)
+
+    def _count(self, piece):
+        stats = count_text(piece, 0, self.use_numpy, self.histogram)
+        for key in self.ADDITIVE_FIELDS:
+            self.totals[key] += stats[key]
+        self._join_words(piece)
+        
+        first = piece.find('\n')
+        if first < 0:
+            self.pending_line = self.pending_line or NON_SPACE_PATTERN.search(piece) is not None
+            return
+        # count_words_in_text 把第一个换行之前和最后一个换行之后的部分也当作完整的行，
+        # 这两段分别属于上一块未结束的行和下一块的行，需要扣掉
+        last = piece.rfind('\n')
+        first_non_empty = NON_SPACE_PATTERN.search(piece, 0, first) is not None
+        last_non_empty = NON_SPACE_PATTERN.search(piece, last + 1) is not None
+        self.non_empty_lines += ((self.pending_line or first_non_empty)
+                                 + stats['non_empty_lines'] - first_non_empty - last_non_empty)
+        self.finished_lines += stats['total_lines'] - 1
+        self.pending_line = last_non_empty
+
+    def _join_words(self, piece):
+        """把被块边界切开的单词接起来：修正英文单词数，并记录这一块结尾未结束的单词"""
+        leading = LEADING_WORD_PATTERN.match(piece).group()
+        leading_letter = ENGLISH_RUN_PATTERN.search(leading) is not None
+        if self.open_word and leading_letter:
+            self.totals['english_words'] -= 1
+        if piece[-1].isspace():
+            self.open_word = None
+        elif len(leading) == len(piece):
+            # 整块都在同一个单词中
+            self.open_word = bool(self.open_word) or leading_letter
+        else:
+            # rsplit 在C中从结尾往回找最后一个空白
+            self.open_word = ENGLISH_RUN_PATTERN.search(piece.rsplit(None, 1)[-1]) is not None
+
+    def finish(self, file_size):
+        """返回与 count_words_in_text 相同格式的结果"""
+        return dict(self.totals,
+                    total_lines=self.finished_lines + 1,
+                    non_empty_lines=self.non_empty_lines + self.pending_line,
+                    file_size=file_size)
+
+
+def merge_statistics(stats_list):
+    """将多个统计结果逐项相加"""
+    merged = {}
+    for stats in stats_list:
+        for key, value in stats.items():
+            merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def count_words_in_archive(archive_path, number=None, use_numpy=False, histogram=None):
+    """
+    统计章节归档的字数
+
+    Args:
+        archive_path (str): 归档数据文件路径
+        number (int): 章节序号（从1开始，与爬虫日志中的"索引N"一致），None表示统计整个归档
+        use_numpy (bool): 见 count_text
+        histogram (dict): 见 count_text
+
+    Returns:
+        dict: 统计信息，整个归档时为各章节统计之和
+    """
+    if not os.path.exists(index_path_for(archive_path)):
+        print(f"错误: 找不到章节归档 '{archive_path}'")
+        return None
+    
+    with ArchiveReader(archive_path) as reader:
+        if number is not None:
+            entry = reader.get_entry(number - 1)
+            if entry is None:
+                print(f"错误: 归档中没有索引为 {number} 的章节")
+                return None
+            print(f"章节: {entry['title']}")
+            return count_text(reader.read_text(entry), entry_raw_length(entry), use_numpy, histogram)
+        
+        print(f"章节数: {len(reader)}")
+        return merge_statistics(
+            count_text(content, entry_raw_length(entry), use_numpy, histogram)
+            for entry, content in reader.iter_chapters()
+        )
+
+
+def source_exists(path):
+    """判断文件或章节归档（可带 #序号）是否存在"""
+    archive_path, _ = split_archive_spec(path)
+    if archive_path is not None:
+        return os.path.exists(index_path_for(archive_path))
+    return os.path.exists(path)
+
+
+def count_words(path, use_numpy=False, histogram=None, stream=None):
+    """统计文件或章节归档的字数，归档路径可带 #序号 指定单个章节"""
+    archive_path, number = split_archive_spec(path)
+    if archive_path is not None:
+        return count_words_in_archive(archive_path, number, use_numpy, histogram)
+    return count_words_in_file(path, use_numpy, histogram, stream)
+
+
+# (绝对路径, 大小, 修改时间) -> 实际解码成功的编码
+_encoding_cache = {}
+
+
+def sniff_encoding(file_path):
+    """
+    判断文件编码：有BOM时按BOM，否则用文件开头 SNIFF_BYTES 字节按 TEXT_ENCODINGS 的顺序试解码
+
+    Returns:
+        str: 第一个能解码样本的编码，都不能解码时返回 TEXT_ENCODINGS[0]
+    """
+    with open(file_path, 'rb') as file:
+        sample = file.read(SNIFF_BYTES)
+        whole_file = len(sample) < SNIFF_BYTES
+    for bom, encoding in BOM_ENCODINGS:
+        if sample.startswith(bom):
+            return encoding
+    for encoding in TEXT_ENCODINGS:
+        try:
+            # 样本末尾可能截断了一个多字节字符，不是整个文件时不检查结尾
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=whole_file)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return TEXT_ENCODINGS[0]
+
+
+def candidate_encodings(file_path, encoding_hint=None):
+    """
+    返回尝试读取文件的编码顺序：缓存中的编码、调用者提供的编码或样本判断的编码在前，其余编码作为后备
+
+    Args:
+        file_path (str): 文件路径
+        encoding_hint (str): 以前读取这个文件时使用的编码（如 StatsCache 中记录的），
+            文件改动后一般不会换编码，有这个编码时不再读取样本判断
+
+    Returns:
+        tuple: (缓存键, 编码列表)
+    """
+    st = os.stat(file_path)
+    key = (os.path.abspath(file_path), st.st_size, st.st_mtime_ns)
+    guess = _encoding_cache.get(key) or encoding_hint or sniff_encoding(file_path)
+    return key, [guess] + [encoding for encoding in TEXT_ENCODINGS if encoding != guess]
+
+
+def remember_encoding(key, encoding):
+    """记录文件实际使用的编码，下次读取同一文件（大小和修改时间不变）时不再判断"""
+    if len(_encoding_cache) >= ENCODING_CACHE_SIZE:
+        _encoding_cache.clear()
+    _encoding_cache[key] = encoding
+
+
+def read_text_file(file_path, encoding_hint=None):
+    """
+    读取文件，编码由 candidate_encodings 决定（通常只需要解码一次）
+
+    Returns:
+        tuple: (文本内容, 编码)，所有编码都失败时返回 (None, None)
+    """
+    key, encodings = candidate_encodings(file_path, encoding_hint)
+    for encoding in encodings:
+        try:
+            with open(file_path, 'r', encoding=encoding) as file:
+                content = file.read()
+        except UnicodeDecodeError:
+            # 样本之后才出现无法解码的内容，换下一种编码
+            continue
+        remember_encoding(key, encoding)
+        return content, encoding
+    return None, None
 
 
-def count_words_in_file(file_path):
+def count_file_streaming(file_path, use_numpy=False, histogram=None, encoding_hint=None):
+    """
+    分块读取并统计文件，编码顺序见 candidate_encodings（解码失败时换下一种编码从头再读）
+
+    Returns:
+        tuple: (统计信息, 编码)，所有编码都失败时返回 (None, None)
+    """
+    key, encodings = candidate_encodings(file_path, encoding_hint)
+    for encoding in encodings:
+        # 换编码重读时不能把读了一半的字符频率留在结果里
+        file_histogram = {} if histogram is not None else None
+        counter = StreamingCounter(use_numpy, file_histogram)
+        try:
+            # 文本模式读取：多字节字符和 \r\n 跨块时由 TextIOWrapper 处理，与一次性读取的结果相同
+            with open(file_path, 'r', encoding=encoding) as file:
+                for chunk in iter(lambda: file.read(STREAM_CHUNK_CHARS), ''):
+                    counter.feed(chunk)
+        except UnicodeDecodeError:
+            continue
+        stats = counter.finish(os.path.getsize(file_path))
+        remember_encoding(key, encoding)
+        if file_histogram:
+            for char, count in file_histogram.items():
+                histogram[char] = histogram.get(char, 0) + count
+        return stats, encoding
+    return None, None
+
+
+def count_file(file_path, use_numpy=False, histogram=None, stream=None, encoding_hint=None):
+    """
+    读取并统计文件（不打印任何内容）
+
+    Args:
+        stream (bool): 是否流式统计，None时超过 STREAM_THRESHOLD 的文件自动流式统计
+        encoding_hint (str): 见 candidate_encodings
+
+    Returns:
+        tuple: (统计信息, 编码)，无法识别编码时返回 (None, None)
+    """
+    file_size = os.path.getsize(file_path)
+    if stream is None:
+        stream = file_size > STREAM_THRESHOLD
+    if stream:
+        return count_file_streaming(file_path, use_numpy, histogram, encoding_hint)
+    content, encoding = read_text_file(file_path, encoding_hint)
+    if content is None:
+        return None, None
+    return count_text(content, file_size, use_numpy, histogram), encoding
+
+
+def count_words_in_file(file_path, use_numpy=False, histogram=None, stream=None):
     """
     统计文件中的字数
     
     Args:
         file_path (str): 文件路径
+        use_numpy (bool): 见 count_text
+        histogram (dict): 见 count_text
+        stream (bool): 见 count_file
         
     Returns:
         dict: 包含字符数、中文字符数、英文单词数等统计信息
     """
     try:
-        # 尝试不同的编码方式读取文件
-        encodings = ['utf-8', 'gbk', 'gb2312', 'ascii']
-        content = None
-        
-        for encoding in encodings:
-            try:
-                with open(file_path, 'r', encoding=encoding) as file:
-                    content = file.read()
-                print(f"文件编码: {encoding}")
-                break
-            except UnicodeDecodeError:
-                continue
-        
-        if content is None:
+        stats, encoding = count_file(file_path, use_numpy, histogram, stream)
+        if stats is None:
             print("错误: 无法读取文件，请检查文件编码")
             return None
-            
-        # 统计各种字数
-        total_chars = len(content)  # 总字符数（包括空格、换行等）
-        
-        # 统计中文字符数
-        chinese_chars = 0
-        for char in content:
-            if '\u4e00' <= char <= '\u9fff':  # 中文字符范围
-                chinese_chars += 1
-        
-        # 统计英文字母数
-        english_chars = 0
-        for char in content:
-            if char.isalpha() and ord(char) < 128:  # ASCII英文字母
-                english_chars += 1
-        
-        # 统计数字数
-        digit_chars = 0
-        for char in content:
-            if char.isdigit():
-                digit_chars += 1
+        print(f"文件编码: {encoding}")
         
-        # 统计英文单词数（简单按空格分割）
-        words = content.split()
-        english_words = len([word for word in words if any(c.isalpha() and ord(c) < 128 for c in word)])
-        
-        # 统计行数
-        lines = content.split('\n')
-        total_lines = len(lines)
-        non_empty_lines = len([line for line in lines if line.strip()])
-        
-        # 去除空白字符后的总字符数
-        content_without_whitespace = ''.join(content.split())
-        effective_chars = len(content_without_whitespace)
-        
-        return {
-            'total_chars': total_chars,
-            'effective_chars': effective_chars,
-            'chinese_chars': chinese_chars,
-            'english_chars': english_chars,
-            'digit_chars': digit_chars,
-            'english_words': english_words,
-            'total_lines': total_lines,
-            'non_empty_lines': non_empty_lines,
-            'file_size': os.path.getsize(file_path)
-        }
+        return stats
         
     except FileNotFoundError:
         print(f"错误: 找不到文件 '{file_path}'")
@@ -91,6 +586,386 @@ def count_words_in_file(file_path):
         return None
 
 
+def is_batch_source(path):
+    """目录或通配符表示批量统计"""
+    return os.path.isdir(path) or any(char in path for char in GLOB_CHARS)
+
+
+def collect_batch_files(source):
+    """
+    列出批量统计的文件，按章节号排序（没有章节号的排在最后，同号按文件名）
+
+    Args:
+        source (str): 目录或通配符
+
+    Returns:
+        list: 文件路径列表
+    """
+    if os.path.isdir(source):
+        # 目录清单缓存里已经有解析好的章节号，不需要再逐个解析文件名
+        entries = sorted(scan_directory(source),
+                         key=lambda entry: (entry['chapter_number'] is None, entry['chapter_number'] or 0))
+        return [os.path.join(source, entry['name']) for entry in entries]
+    paths = sorted((path for path in glob.glob(source) if os.path.isfile(path)), key=os.path.basename)
+    paths.sort(key=lambda path: extract_chapter_number(os.path.basename(path)))
+    return paths
+
+
+def file_digest(path):
+    """分块计算文件内容的哈希（用于确认缓存的文件确实没有变化）"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stats_cache_path(directory):
+    """返回目录对应的统计缓存路径（放在目录外面，与章节清单缓存相同）"""
+    return os.path.normpath(os.path.abspath(directory)) + STATS_CACHE_SUFFIX
+
+
+class StatsCache:
+    """
+    持久化的字数统计缓存
+
+    每个目录一个缓存文件 <目录>.wordcount-cache.json，按文件名记录
+    (大小, 修改时间, 内容哈希, 编码, 统计结果)。大小和修改时间都没变时认为文件没变；
+    修改时间与写入缓存的时间太接近时不信任缓存（见 chapter_catalog.RACY_WINDOW_NS）。
+    use_hash 为True时还要求内容哈希一致，可以发现保留了修改时间的改动。
+    """
+
+    def __init__(self, use_hash=False):
+        self.use_hash = use_hash
+        self._directories = {}  # 目录 -> {文件名: 缓存条目}
+        self._dirty = set()
+
+    def _entries(self, directory):
+        entries = self._directories.get(directory)
+        if entries is None:
+            try:
+                with open(stats_cache_path(directory), 'r', encoding='utf-8') as f:
+                    cache = json.load(f)
+                entries = cache['files'] if cache.get('version') == STATS_CACHE_VERSION else {}
+            except (OSError, ValueError, KeyError):
+                entries = {}
+            self._directories[directory] = entries
+        return entries
+
+    def lookup(self, path, st):
+        """
+        查找文件的缓存结果
+
+        Args:
+            path (str): 文件路径
+            st (os.stat_result): 统计前取得的文件状态
+
+        Returns:
+            dict: 缓存条目（含 'encoding'、'stats'、'hash'），没有或已经过期时返回None。
+                use_hash 为True时内容哈希还没有核对，由 count_batch 在子进程中与统计一起核对
+        """
+        directory, name = os.path.split(os.path.abspath(path))
+        entry = self._entries(directory).get(name)
+        if (entry is None or entry['size'] != st.st_size or entry['mtime_ns'] != st.st_mtime_ns
+                or st.st_mtime_ns + RACY_WINDOW_NS >= entry['cached_at_ns']):
+            return None
+        if self.use_hash and entry.get('hash') is None:
+            # 记录时没有计算哈希，无法核对
+            return None
+        return entry
+
+    def known_encoding(self, path):
+        """
+        缓存中记录的文件编码（统计结果过期时也返回），没有记录时返回None
+
+        文件改动后统计结果要重新计算，但编码一般不变，交给 count_file 作为 encoding_hint，
+        子进程中不需要再读取样本判断编码
+        """
+        directory, name = os.path.split(os.path.abspath(path))
+        entry = self._entries(directory).get(name)
+        return entry['encoding'] if entry is not None else None
+
+    def store(self, path, st, encoding, stats, digest=None):
+        """记录一个文件的统计结果（st 必须是统计之前取得的状态）"""
+        directory, name = os.path.split(os.path.abspath(path))
+        self._entries(directory)[name] = {
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'cached_at_ns': time.time_ns(),
+            'hash': digest,
+            'encoding': encoding,
+            'stats': stats,
+        }
+        self._dirty.add(directory)
+
+    def save(self, listed_paths=()):
+        """
+        写回有变化的缓存文件，同时去掉已经不存在的文件
+
+        Args:
+            listed_paths (list): 本次统计时列出的文件（collect_batch_files 的结果），
+                这些文件肯定存在，不需要再检查；缓存中有不在其中的文件时，对该目录调用一次 os.listdir 确认，
+                不逐个检查文件是否存在
+        """
+        listed = {}
+        for path in listed_paths:
+            directory, name = os.path.split(os.path.abspath(path))
+            listed.setdefault(directory, set()).add(name)
+        for directory in self._dirty:
+            entries = self._directories[directory]
+            unlisted = entries.keys() - listed.get(directory, set())
+            if unlisted:
+                try:
+                    present = set(os.listdir(directory))
+                except OSError:
+                    present = set()
+                for name in unlisted - present:
+                    del entries[name]
+            try:
+                write_text_atomic(stats_cache_path(directory), json.dumps(
+                    {'version': STATS_CACHE_VERSION, 'files': entries}, ensure_ascii=False))
+            except OSError:
+                # 缓存写不进去（只读目录等）不影响结果
+                pass
+        self._dirty.clear()
+
+
+def count_batch_file(path, use_numpy=False, with_histogram=False, stream=None, with_hash=False,
+                     encoding_hint=None, expected_hash=None):
+    """
+    统计一个文件（在子进程中运行，不打印任何内容）
+
+    encoding_hint 见 candidate_encodings（子进程中的编码缓存随进程结束丢失，编码由 StatsCache 保存后传入）。
+    expected_hash 不为None时先计算内容哈希：与缓存中的哈希一致时不再统计，返回的结果行含有 'unchanged'。
+
+    Returns:
+        tuple: (结果行, 字符频率表或None, 内容哈希或None)，结果行读取失败时含有 'error'
+    """
+    name = os.path.basename(path)
+    row = {'name': name, 'chapter': chapter_number_or_none(name)}
+    try:
+        digest = None
+        if expected_hash is not None:
+            digest = file_digest(path)
+            if digest == expected_hash:
+                return dict(row, unchanged=True), None, digest
+        histogram = {} if with_histogram else None
+        stats, encoding = count_file(path, use_numpy, histogram, stream, encoding_hint)
+        if stats is None:
+            return dict(row, error="无法识别文件编码"), None, None
+        if with_hash and digest is None:
+            digest = file_digest(path)
+    except Exception as e:
+        return dict(row, error=str(e)), None, None
+    return dict(row, encoding=encoding, **stats), histogram, digest
+
+
+def count_batch(paths, workers=None, use_numpy=False, histogram=None, stream=None, cache=None):
+    """
+    用进程池统计多个文件
+
+    Args:
+        paths (list): 文件路径列表（结果保持这个顺序）
+        workers (int): 进程数，None时使用CPU核数
+        use_numpy (bool): 见 count_text
+        histogram (dict): 不为None时把所有文件的字符频率累加到其中（缓存中没有字符频率，此时不使用缓存）
+        stream (bool): 见 count_file
+        cache (StatsCache): 统计缓存，None表示不使用缓存
+
+    Returns:
+        list: 统计成功的结果行，每行是文件名、章节号、编码加上 count_words_in_text 的各项
+    """
+    if histogram is not None:
+        cache = None
+    def cached_row(path, entry):
+        name = os.path.basename(path)
+        return dict({'name': name, 'chapter': chapter_number_or_none(name)},
+                    encoding=entry['encoding'], **entry['stats'])
+
+    rows = [None] * len(paths)
+    pending = []  # (序号, 统计前的文件状态, 需要核对哈希的缓存条目或None)
+    with_hash = cache is not None and cache.use_hash
+    for position, path in enumerate(paths):
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            print(f"⚠️  跳过 {os.path.basename(path)}: {e}")
+            continue
+        entry = cache.lookup(path, st) if cache is not None else None
+        if entry is None or with_hash:
+            # 核对哈希要读取整个文件，放到进程池中与需要统计的文件一起并行进行
+            pending.append((position, st, entry))
+            continue
+        rows[position] = cached_row(path, entry)
+    if cache is not None:
+        to_verify = sum(entry is not None for _, _, entry in pending)
+        print(f"缓存命中 {len(paths) - len(pending) + to_verify} 个文件"
+              f"{f'（其中 {to_verify} 个需要核对内容哈希）' if with_hash else ''}，"
+              f"需要统计 {len(pending) - to_verify} 个文件")
+
+    if pending:
+        pending_paths = [paths[position] for position, _, _ in pending]
+        workers = workers or os.cpu_count() or 1
+        # 每个任务很小，按块分发减少进程间通信的次数
+        chunksize = max(1, len(pending_paths) // (workers * 4))
+        count = len(pending_paths)
+        hints = [cache.known_encoding(path) if cache is not None else None for path in pending_paths]
+        expected_hashes = [entry['hash'] if entry is not None else None for _, _, entry in pending]
+        changed = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(count_batch_file, pending_paths, [use_numpy] * count,
+                                   [histogram is not None] * count, [stream] * count, [with_hash] * count,
+                                   hints, expected_hashes, chunksize=chunksize)
+            for (position, st, entry), (row, file_histogram, digest) in zip(pending, results):
+                if 'error' in row:
+                    print(f"⚠️  跳过 {row['name']}: {row['error']}")
+                    continue
+                if row.get('unchanged'):
+                    rows[position] = cached_row(paths[position], entry)
+                    continue
+                changed += entry is not None
+                rows[position] = row
+                if cache is not None:
+                    cache.store(paths[position], st, row['encoding'],
+                                {key: row[key] for key in STAT_FIELDS}, digest)
+                if file_histogram:
+                    for char, count in file_histogram.items():
+                        histogram[char] = histogram.get(char, 0) + count
+        if changed:
+            print(f"其中 {changed} 个文件的内容哈希与缓存不一致，已重新统计")
+        if cache is not None:
+            cache.save(paths)
+    return [row for row in rows if row is not None]
+
+
+def default_batch_output(source):
+    """批量统计结果的默认路径：目录旁边的 <目录>.wordcount.csv，通配符时为当前目录的 word_counts.csv"""
+    if os.path.isdir(source):
+        return os.path.normpath(os.path.abspath(source)) + BATCH_OUTPUT_SUFFIX
+    return 'word_counts.csv'
+
+
+def write_batch_rows(rows, output_path, total):
+    """
+    写出每个文件的统计结果，按扩展名选择CSV或JSON
+
+    Args:
+        rows (list): count_batch 的返回值
+        output_path (str): 输出路径（.json 为JSON，其余为CSV）
+        total (dict): 汇总统计，JSON中一并写出
+    """
+    if output_path.lower().endswith('.json'):
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump({'total': total, 'files': rows}, f, ensure_ascii=False, indent=2)
+        return
+    # utf-8-sig 让Excel能正确识别中文
+    with open(output_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['name', 'chapter', 'encoding'] + STAT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def run_batch(source, output_path=None, workers=None, use_numpy=False, show_histogram=False, stream=None,
+              cache=None):
+    """批量统计目录或通配符选中的文件，打印汇总结果并写出每个文件的统计"""
+    paths = collect_batch_files(source)
+    if not paths:
+        print(f"❌ 错误: '{source}' 中没有找到txt文件")
+        return None
+    
+    print(f"\n正在统计 {len(paths)} 个文件...")
+    start_time = time.time()
+    histogram = {} if show_histogram else None
+    rows = count_batch(paths, workers, use_numpy, histogram, stream, cache)
+    if not rows:
+        print("❌ 错误: 没有统计成功的文件")
+        return None
+    
+    total = merge_statistics({key: row[key] for key in STAT_FIELDS} for row in rows)
+    output_path = output_path or default_batch_output(source)
+    write_batch_rows(rows, output_path, total)
+    print(f"统计完成: {len(rows)} 个文件，耗时 {time.time() - start_time:.2f} 秒")
+    print(f"每个文件的结果已写入: {output_path}")
+    print_statistics(total, f"{source}（共 {len(rows)} 个文件）")
+    if histogram:
+        print_histogram(histogram)
+    return total
+
+
+def stats_manifest_path(output_path):
+    """返回爬虫输出（目录、归档、数据库或合并文件）对应的统计清单路径"""
+    return os.path.normpath(os.path.abspath(output_path)) + STATS_MANIFEST_SUFFIX
+
+
+class StatsManifest:
+    """
+    爬取时写出的每章统计清单（JSON Lines）
+
+    每行一个章节：{"index": URL索引, "chapter": 章节号, "title": 标题, 以及 count_words_in_text 的各项}。
+    统计在爬虫线程中对提取出的正文进行（file_size 为UTF-8编码后的字节数，与保存的章节文件一致），
+    由写线程在章节写入成功后追加到清单中。重复爬取时追加新记录，读取时同一索引以最后一条为准。
+
+    Args:
+        path (str): 清单文件路径
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def write_batch(self, records):
+        """追加一批 (URL索引, 标题, 统计信息)"""
+        lines = [json.dumps(dict({'index': index, 'chapter': chapter_number_or_none(title), 'title': title},
+                                 **stats), ensure_ascii=False) + '\n'
+                 for index, title, stats in records]
+        self._file.writelines(lines)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def load_stats_manifest(path):
+    """
+    读取统计清单
+
+    Returns:
+        list: 与 count_batch 返回值相同格式的结果行（name 为章节标题），按章节号排序
+    """
+    latest = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                latest[record['index']] = record
+    rows = [dict({'name': record['title'], 'chapter': record['chapter'], 'encoding': 'utf-8'},
+                 **{key: record[key] for key in STAT_FIELDS})
+            for _, record in sorted(latest.items())]
+    rows.sort(key=lambda row: float('inf') if row['chapter'] is None else row['chapter'])
+    return rows
+
+
+def run_manifest_report(manifest_path, output_path=None):
+    """根据爬虫统计清单输出汇总结果和每章统计（不读取任何章节）"""
+    rows = load_stats_manifest(manifest_path)
+    if not rows:
+        print(f"❌ 错误: 统计清单 '{manifest_path}' 中没有章节")
+        return None
+    total = merge_statistics({key: row[key] for key in STAT_FIELDS} for row in rows)
+    output_path = output_path or manifest_path[:-len(STATS_MANIFEST_SUFFIX)] + BATCH_OUTPUT_SUFFIX
+    write_batch_rows(rows, output_path, total)
+    print(f"每章的结果已写入: {output_path}")
+    print_statistics(total, f"{manifest_path}（共 {len(rows)} 个章节）")
+    return total
+
+
+def length_category(chinese_chars):
+    """按中文字符数返回篇幅分类在 LENGTH_CATEGORIES 中的位置"""
+    for position, (limit, _, _) in enumerate(LENGTH_CATEGORIES):
+        if limit is None or chinese_chars < limit:
+            return position
+
+
 def print_statistics(stats, file_path):
     """
     打印统计结果
@@ -117,12 +992,7 @@ def print_statistics(stats, file_path):
     if stats['chinese_chars'] > 0:
         print(f"\n📖 小说字数统计建议:")
         print(f"   - 按中文字符计算: {stats['chinese_chars']:,} 字")
-        if stats['chinese_chars'] < 2000:
-            print(f"   - 篇幅: 短篇 (一般2000字以下)")
-        elif stats['chinese_chars'] < 10000:
-            print(f"   - 篇幅: 中篇章节 (2000-10000字)")
-        else:
-            print(f"   - 篇幅: 长篇章节 (10000字以上)")
+        print(f"   - 篇幅: {LENGTH_CATEGORIES[length_category(stats['chinese_chars'])][2]}")
 
 
 def main():
@@ -132,44 +1002,72 @@ def main():
     print("📚 小说章节字数统计工具")
     print("-" * 30)
     
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    options = dict(arg[2:].partition('=')[::2] for arg in sys.argv[1:] if arg.startswith('--'))
+    show_histogram = '--histogram' in sys.argv
+    use_numpy = '--numpy' in sys.argv or show_histogram
+    stream = True if '--stream' in sys.argv else None
+    if use_numpy and numpy is None:
+        print("❌ 错误: NumPy后端需要安装 numpy 库：pip install numpy")
+        return
+    
+    def run(path):
+        histogram = {} if show_histogram else None
+        stats = count_words(path, use_numpy, histogram, stream)
+        if stats:
+            print_statistics(stats, path)
+            if histogram:
+                print_histogram(histogram)
+    
     # 如果命令行提供了文件路径参数
-    if len(sys.argv) > 1:
-        file_path = sys.argv[1]
+    if args:
+        file_path = args[0]
     else:
         # 交互式输入文件路径
         file_path = input("请输入要统计的文件路径 (例如: 抄/2章节.txt): ").strip()
     
+    # 爬虫统计清单：直接汇总后结束
+    if file_path.endswith(STATS_MANIFEST_SUFFIX) and os.path.isfile(file_path):
+        run_manifest_report(file_path, options.get('output') or None)
+        return
+    
+    # 目录或通配符：批量统计后直接结束
+    if is_batch_source(file_path):
+        workers = options.get('workers')
+        if workers is not None and not workers.isdigit():
+            print(f"❌ 错误: 无效的进程数 '{workers}'")
+            return
+        run_batch(file_path, options.get('output') or None, int(workers) if workers else None,
+                  use_numpy, show_histogram, stream,
+                  None if '--no-cache' in sys.argv else StatsCache(use_hash='--hash' in sys.argv))
+        return
+    
     # 如果是相对路径，尝试在当前目录查找
-    if not os.path.isabs(file_path) and not os.path.exists(file_path):
+    if not os.path.isabs(file_path) and not source_exists(file_path):
         # 尝试在项目根目录查找
         script_dir = os.path.dirname(os.path.abspath(__file__))
         parent_dir = os.path.dirname(script_dir)
         full_path = os.path.join(parent_dir, file_path)
-        if os.path.exists(full_path):
+        if source_exists(full_path):
             file_path = full_path
     
     # 检查文件是否存在
-    if not os.path.exists(file_path):
+    if not source_exists(file_path):
         print(f"❌ 错误: 文件 '{file_path}' 不存在")
         print("请检查文件路径是否正确")
         return
     
     # 统计字数
     print(f"\n正在统计文件: {file_path}")
-    stats = count_words_in_file(file_path)
-    
-    if stats:
-        print_statistics(stats, file_path)
+    run(file_path)
     
     # 询问是否继续统计其他文件
     while True:
         choice = input("\n是否要统计其他文件? (y/n): ").strip().lower()
         if choice in ['y', 'yes', '是', 'Y']:
             file_path = input("请输入要统计的文件路径: ").strip()
-            if os.path.exists(file_path):
-                stats = count_words_in_file(file_path)
-                if stats:
-                    print_statistics(stats, file_path)
+            if source_exists(file_path):
+                run(file_path)
             else:
                 print(f"❌ 文件 '{file_path}' 不存在")
         else: